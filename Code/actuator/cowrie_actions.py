@@ -1,18 +1,38 @@
 from actuator.utils import ssh_exec, get_creds
 
+ALLOWED_PLUGINS = {"telnet", "ssh"}  # ✅ Cowrie only supports these
+RESTART_CMD = "~/cowrie/bin/cowrie restart"
+
+# Both plugins drive Cowrie's telnet listener. The flag keeps the state across
+# restarts; cowriectl applies it to the running Cowrie without dropping SSH
+# sessions. Only if the control socket is unreachable do we restart.
+CTL_CMD = "~/cowrie/bin/cowriectl"
+
+def _toggle_cmd(act_type):
+    if act_type == "disable_plugin":
+        return "rm -f ~/cowrie/etc/enable_telnet.flag"
+    if act_type == "enable_plugin":
+        return "touch ~/cowrie/etc/enable_telnet.flag"
+    return None
+
 def handle_cowrie_action(act_type, plugin):
+    return handle_cowrie_batch([(plugin, act_type)])
+
+def handle_cowrie_batch(changes):
+    """Apply [(plugin, act_type), ...] in order, then update the running Cowrie once."""
     hp = "cowrie"
     ip, username, password, port = get_creds(hp)
 
-    allowed_plugins = {"telnet", "ssh"}  # ✅ Cowrie only supports these
-    if plugin not in allowed_plugins:
-        return False, f"❌ Plugin '{plugin}' not supported by Cowrie", "N/A"
-
-    if act_type == "disable_plugin":
-        cmd = "rm -f ~/cowrie/etc/enable_telnet.flag && ~/cowrie/bin/cowrie restart"
-    elif act_type == "enable_plugin":
-        cmd = "touch ~/cowrie/etc/enable_telnet.flag && ~/cowrie/bin/cowrie restart"
-    else:
-        return False, f"❌ Unknown action {act_type}", "N/A"
+    steps = []
+    for plugin, act_type in changes:
+        if plugin not in ALLOWED_PLUGINS:
+            return False, f"❌ Plugin '{plugin}' not supported by Cowrie", "N/A"
+        step = _toggle_cmd(act_type)
+        if step is None:
+            return False, f"❌ Unknown action {act_type}", "N/A"
+        steps.append(step)
 
-    return ssh_exec(ip, username, password, cmd, port) + (cmd,)
\ No newline at end of file
+    # The last change decides the listener state
+    live = f"{CTL_CMD} {'enable' if changes[-1][1] == 'enable_plugin' else 'disable'} telnet"
+    cmd = " && ".join(steps) + f" && {{ {live} || {RESTART_CMD}; }}"
+    return ssh_exec(ip, username, password, cmd, port) + (cmd,)
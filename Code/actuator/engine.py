@@ -0,0 +1,37 @@
+# engine.py
+"""
+Concurrent action execution across honeypots.
+
+Each honeypot gets its own single-worker lane, so actions for different
+honeypots run in parallel while actions for the same honeypot stay in
+submission order (its handlers restart daemons and must not interleave).
+"""
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+from actuator.utils import close_all_ssh
+
+
+class ActuatorEngine:
+    def __init__(self):
+        self._lanes = {}
+        self._lock = threading.Lock()
+
+    def _lane(self, honeypot):
+        with self._lock:
+            lane = self._lanes.get(honeypot)
+            if lane is None:
+                lane = self._lanes[honeypot] = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix=f"act-{honeypot}")
+            return lane
+
+    def submit(self, honeypot, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) on `honeypot`'s lane; returns a Future."""
+        return self._lane(honeypot).submit(fn, *args, **kwargs)
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            lanes, self._lanes = list(self._lanes.values()), {}
+        for lane in lanes:
+            lane.shutdown(wait=wait)
+        close_all_ssh()
@@ -1,33 +1,96 @@
+import base64
+import re
+
 from actuator.utils import ssh_exec, get_creds
 
+CONFIG_PATH = "~/honeypy/HoneyPy/etc/services.cfg"
+
+PLUGIN_SECTIONS = {
+    "ftp": "FTP",
+    "http": "HTTP",
+    "echo": "Echo",
+    "motd": "MOTD"
+}
+
+RESTART_CMD = (
+    "sudo systemctl restart honeypy-mongo-logger && "
+    "~/honeypy/HoneyPy/stop_honeypy.sh && sleep 2 && "
+    "nohup python3 ~/honeypy/HoneyPy/Honey.py > ~/honeypy/HoneyPy/logs/honeypy.log 2>&1 &"
+)
+
+# Honey.py re-reads services.cfg on SIGHUP and starts/stops only the changed
+# listeners; fall back to a full restart if no HoneyPy is running (or an old
+# one without the handler left no pid file). The pid is only signalled if it
+# still belongs to Honey.py: a stale file after a crash may name another process.
+PID_FILE = "~/honeypy/HoneyPy/logs/honeypy.pid"
+RELOAD_CMD = (
+    f'{{ pid="$(cat {PID_FILE} 2>/dev/null)"; '
+    f'if [ -n "$pid" ] && grep -qa Honey.py "/proc/$pid/cmdline" 2>/dev/null; '
+    f'then kill -HUP "$pid"; else {RESTART_CMD}; fi; }}'
+)
+
+_SECTION_RE = re.compile(r"^\s*\[([^\]]+)\]")
+_ENABLED_RE = re.compile(r"^(\s*enabled\s*[=:]\s*)(.*?)(\s*)$", re.IGNORECASE)
+
+def render_services_cfg(text, desired):
+    """
+    services.cfg with `enabled` set per {section: True/False}; every other line
+    (comments, spacing, other sections) is kept as is. Returns (text, changed sections).
+    """
+    out, changed, section = [], [], None
+    for line in text.splitlines(keepends=True):
+        m = _SECTION_RE.match(line)
+        if m:
+            section = m.group(1).strip()
+        elif section in desired:
+            m = _ENABLED_RE.match(line.rstrip("\n"))
+            if m:
+                value = "Yes" if desired[section] else "No"
+                if m.group(2) != value:
+                    line = f"{m.group(1)}{value}{m.group(3)}\n"
+                    changed.append(section)
+        out.append(line)
+    return "".join(out), changed
+
 def handle_honeypy_action(act_type, plugin):
+    return handle_honeypy_batch([(plugin, act_type)])
+
+def handle_honeypy_batch(changes):
+    """
+    Apply [(plugin, act_type), ...] as one services.cfg update: read the file,
+    compute the final enabled state of every touched section (last change
+    wins), write it back in one atomic replace, then hot-reload HoneyPy once.
+    """
     hp = "honeypy"
     ip, username, password, port = get_creds(hp)
 
-    config_path = "~/honeypy/HoneyPy/etc/services.cfg"
+    desired = {}
+    for plugin, act_type in changes:
+        plugin_section = PLUGIN_SECTIONS.get(plugin.lower())
+        if not plugin_section:
+            return False, f"❌ Plugin '{plugin}' not supported by HoneyPy", "N/A"
+        if act_type not in ("enable_plugin", "disable_plugin"):
+            return False, f"❌ Unknown action type: {act_type}", "N/A"
+        desired[plugin_section] = act_type == "enable_plugin"
 
-    plugin_section = {
-        "ftp": "FTP",
-        "http": "HTTP",
-        "echo": "Echo",
-        "motd": "MOTD"
-    }.get(plugin.lower())
+    read_cmd = f"cat {CONFIG_PATH}"
+    success, current = ssh_exec(ip, username, password, read_cmd, port=port)
+    sections = {m.group(1).strip() for m in map(_SECTION_RE.match, current.splitlines()) if m}
+    if not success or not sections:
+        return False, f"❌ Could not read services.cfg: {current}", read_cmd
 
-    if not plugin_section:
-        return False, f"❌ Plugin '{plugin}' not supported by HoneyPy", "N/A"
-
-    if act_type == "disable_plugin":
-        sed_cmd = f"sed -i '/\\[{plugin_section}\\]/,/enabled/s/enabled *= *Yes/enabled = No/' {config_path}"
-    elif act_type == "enable_plugin":
-        sed_cmd = f"sed -i '/\\[{plugin_section}\\]/,/enabled/s/enabled *= *No/enabled = Yes/' {config_path}"
-    else:
-        return False, f"❌ Unknown action type: {act_type}", "N/A"
+    missing = sorted(set(desired) - sections)
+    if missing:
+        return False, f"❌ Sections missing from services.cfg: {', '.join(missing)}", read_cmd
+    updated, changed = render_services_cfg(current + "\n", desired)
+    if not changed:
+        return True, "services.cfg already in desired state", read_cmd
 
+    payload = base64.b64encode(updated.encode()).decode()
     cmd = (
-        f"{sed_cmd} && sudo systemctl restart honeypy-mongo-logger && "
-        f"~/honeypy/HoneyPy/stop_honeypy.sh && sleep 2 && "
-        f"nohup python3 ~/honeypy/HoneyPy/Honey.py > ~/honeypy/HoneyPy/logs/honeypy.log 2>&1 &"
+        f"echo {payload} | base64 -d > {CONFIG_PATH}.tmp && mv {CONFIG_PATH}.tmp {CONFIG_PATH} && "
+        f"{RELOAD_CMD}"
     )
-
     success, output = ssh_exec(ip, username, password, cmd, port=port)
-    return success, output, cmd
\ No newline at end of file
+    summary = ", ".join(f"{s}={'Yes' if desired[s] else 'No'}" for s in changed)
+    return success, output or f"services.cfg updated ({summary})", cmd
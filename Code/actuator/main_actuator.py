@@ -1,20 +1,27 @@
 # main_actuator.py
 import time
+import os
 from datetime import datetime, timezone, timedelta
-from pymongo import MongoClient
 
-from actuator.cowrie_actions import handle_cowrie_action
-from actuator.honeypy_actions import handle_honeypy_action
+from bson import ObjectId
+
+from actuator.cowrie_actions import handle_cowrie_action, handle_cowrie_batch
+from actuator.honeypy_actions import handle_honeypy_action, handle_honeypy_batch
 from actuator.honeytrap_actions import handle_honeytrap_action
 from actuator.conpot_actions import handle_conpot_action
 from actuator.nodepot_actions import handle_nodepot_action
+from actuator.engine import ActuatorEngine
 from actuator.utils import log_action
+from common.indexes import ensure_indexes
+from common.mongo import get_db
 
-client = MongoClient("mongodb://localhost:27017/")
-db = client["adapttrap"]
+db = get_db()
 action_collection = db["agent_actions"]
 
-last_action_id = None
+BATCH = int(os.getenv("ACTUATOR_BATCH", "100"))            # actions claimed per cycle
+POLL_SECONDS = float(os.getenv("ACTUATOR_POLL_SECONDS", "2"))
+LOCK_EXPIRE_MINUTES = int(os.getenv("ACTUATOR_LOCK_EXPIRE_MINUTES", "10"))  # reclaim actions of a crashed actuator
+MAX_AGE_MINUTES = int(os.getenv("ACTUATOR_MAX_AGE_MINUTES", "30"))  # older pending actions expire unapplied
 
 # ✅ Centralized plugin → honeypot → handler mapping
 PLUGIN_HANDLER_MAP = {
@@ -48,47 +55,142 @@ PLUGIN_HANDLER_MAP = {
     "conpot":       ("conpot", handle_conpot_action)
 }
 
-def apply_action(action_doc):
-    global last_action_id
-    action = action_doc.get("selected_action", {})
-    plugin = action.get("plugin")
-    act_type = action.get("action")
+# Honeypots whose handlers restart the whole daemon: all of a batch's changes
+# for them go into one command with a single restart.
+BATCH_HANDLERS = {
+    "cowrie":  handle_cowrie_batch,
+    "honeypy": handle_honeypy_batch,
+}
 
-    if plugin in PLUGIN_HANDLER_MAP:
-        hp, handler = PLUGIN_HANDLER_MAP[plugin]
-        success, result, cmd = handler(act_type, plugin)
-    else:
-        print(f"[!] Unsupported plugin: {plugin}")
-        return
+engine = ActuatorEngine()
+
+def _utcnow():
+    return datetime.now(timezone.utc)
+
+def _claimable():
+    """Pending actions nobody holds; claims older than LOCK_EXPIRE_MINUTES count as released."""
+    stale = _utcnow() - timedelta(minutes=LOCK_EXPIRE_MINUTES)
+    return {
+        "processed": {"$ne": True},
+        "$or": [
+            {"processing": {"$exists": False}},
+            {"processing": False},
+            {"processing_at": {"$lt": stale}},
+        ],
+    }
+
+def expire_old():
+    """
+    Mark pending actions older than MAX_AGE_MINUTES (by `_id` time) processed
+    with expired=True: after an outage the policy's state has moved on, and
+    replaying its old decisions would flap the honeypots.
+    """
+    cutoff = ObjectId.from_datetime(_utcnow() - timedelta(minutes=MAX_AGE_MINUTES))
+    res = action_collection.update_many(
+        {**_claimable(), "_id": {"$lt": cutoff}},
+        {"$set": {"processed": True, "processing": False, "expired": True, "processed_at": _utcnow()}},
+    )
+    if res.modified_count:
+        print(f"[!] Expired {res.modified_count} action(s) older than {MAX_AGE_MINUTES} min")
+
+def claim_batch(limit=BATCH):
+    """
+    Claim up to `limit` of the oldest pending actions in three round trips:
+    pick their ids, tag the ones still claimable with a fresh claim id in one
+    update_many, read back what this claim got. Another actuator racing for
+    the same ids gets the rest.
+    """
+    expire_old()
+    ids = [d["_id"] for d in action_collection.find(_claimable(), {"_id": 1}).sort("_id", 1).limit(limit)]
+    if not ids:
+        return []
+    claim_id = ObjectId()
+    action_collection.update_many(
+        {**_claimable(), "_id": {"$in": ids}},
+        {"$set": {"processing": True, "processing_at": _utcnow(), "claim_id": claim_id}},
+    )
+    return list(action_collection.find({"claim_id": claim_id}).sort("_id", 1))
 
-    db.agent_actions.update_one(
+def mark_processed(action_doc, **extra):
+    action_collection.update_one(
         {"_id": action_doc["_id"]},
-        {"$set": {"processed": True, "processed_at": datetime.now(timezone.utc)}}
+        {"$set": {"processed": True, "processing": False, "processed_at": _utcnow(), **extra}}
     )
-    log_action(hp, plugin, act_type, cmd, result, success, action_doc["_id"])
 
-def watch_and_apply_actions():
-    print("[*] Watching MongoDB for actions...")
-    global last_action_id
-    while True:
-        now = datetime.now(timezone.utc)
-
-        latest = action_collection.find_one(
-            {
-                "processed": {"$ne": True},
-                "created_at": {"$gte": now - timedelta(minutes=2)}
-            },
-            sort=[("_id", -1)]
-        )
-
-        if latest:
-            if str(latest['_id']) != str(last_action_id):
-                last_action_id = latest['_id']
-                apply_action(latest)
+def coalesce(batch):
+    """
+    Keep the newest action per plugin (the last desired state wins).
+    Returns ({honeypot: [winning docs in _id order]}, [(superseded doc, winner)]).
+    """
+    latest = {}
+    for doc in batch:  # claimed in _id order
+        latest[doc.get("selected_action", {}).get("plugin")] = doc
+
+    per_honeypot, superseded = {}, []
+    for doc in batch:
+        plugin = doc.get("selected_action", {}).get("plugin")
+        winner = latest[plugin]
+        if winner is not doc:
+            superseded.append((doc, winner))
+        elif plugin in PLUGIN_HANDLER_MAP:
+            per_honeypot.setdefault(PLUGIN_HANDLER_MAP[plugin][0], []).append(doc)
         else:
-            print("[=] No new action.")
+            print(f"[!] Unsupported plugin: {plugin}")
+            mark_processed(doc, success=False, error=f"unsupported plugin: {plugin}")
+    return per_honeypot, superseded
+
+def apply_honeypot(hp, docs):
+    """Apply one honeypot's share of a batch; runs on that honeypot's engine lane."""
+    changes = [(d["selected_action"]["plugin"], d["selected_action"].get("action")) for d in docs]
+    batch_handler = BATCH_HANDLERS.get(hp)
+    if batch_handler and len(docs) > 1:
+        try:
+            success, result, cmd = batch_handler(changes)
+        except Exception as e:
+            success, result, cmd = False, str(e), "N/A"
+        print(f"[+] {hp}: {len(docs)} change(s) applied with one restart")
+        outcomes = [(success, result, cmd)] * len(docs)
+    else:
+        outcomes = []
+        for plugin, act_type in changes:
+            try:
+                outcomes.append(PLUGIN_HANDLER_MAP[plugin][1](act_type, plugin))
+            except Exception as e:
+                outcomes.append((False, str(e), "N/A"))
+
+    for doc, (plugin, act_type), (success, result, cmd) in zip(docs, changes, outcomes):
+        mark_processed(doc)
+        log_action(hp, plugin, act_type, cmd, result, success, doc["_id"])
+
+def process_batch(batch):
+    per_honeypot, superseded = coalesce(batch)
+    for doc, winner in superseded:
+        mark_processed(doc, superseded_by=winner["_id"])
+    if superseded:
+        print(f"[=] Coalesced {len(superseded)} superseded action(s)")
+
+    # Different honeypots run in parallel, each on its own lane.
+    futures = [engine.submit(hp, apply_honeypot, hp, docs) for hp, docs in per_honeypot.items()]
+    for future in futures:
+        try:
+            future.result()
+        except Exception as e:
+            print(f"[!] Action failed: {e}")
 
-        time.sleep(10)
+def watch_and_apply_actions():
+    print(f"[*] Watching MongoDB for actions (batch {BATCH}, poll {POLL_SECONDS}s)...")
+    while True:
+        batch = claim_batch()
+        if batch:
+            print(f"[+] Claimed {len(batch)} action(s)")
+            process_batch(batch)
+            if len(batch) == BATCH:
+                continue  # more queued, don't sleep
+        time.sleep(POLL_SECONDS)
 
 if __name__ == "__main__":
-    watch_and_apply_actions()
+    ensure_indexes(db, ["agent_actions"])
+    try:
+        watch_and_apply_actions()
+    finally:
+        engine.shutdown()
@@ -1,8 +1,10 @@
 import os
 import json
 import subprocess
+import threading
 from datetime import datetime, timezone
-from pymongo import MongoClient
+
+from common.mongo import get_db
 
 # Load honeypot credentials from JSON
 CONFIG_PATH = os.path.expanduser("~/adapttrap/Code/configs/honeypot_creds.json")
@@ -31,20 +33,84 @@ HONEYPOT_PORTS = {
 def get_creds(hp):
     return HONEYPOT_HOSTS[hp], CREDS[hp]["username"], CREDS[hp]["password"], HONEYPOT_PORTS[hp]
 
-# SSH execution with password
-def ssh_exec(ip, username, password, command, port=22):
-    ssh_cmd = [
-        "sshpass", "-p", password,
+# === Persistent SSH (OpenSSH connection multiplexing)
+# One master connection per user@host:port is opened with sshpass and kept
+# alive for CONTROL_PERSIST seconds after its last use; every command after
+# the first rides on it as a new channel, skipping TCP + key exchange + auth.
+CONTROL_DIR = os.path.expanduser("~/.ssh/adapttrap")
+CONTROL_PERSIST = 600
+SSH_TIMEOUT = 30
+SSH_CONNECTION_ERROR = 255
+
+_master_locks = {}
+_master_locks_guard = threading.Lock()
+
+
+def _control_path(ip, username, port):
+    # Unix socket paths are capped at ~104 bytes; keep it short.
+    return os.path.join(CONTROL_DIR, f"{username}@{ip}:{port}")
+
+
+def _ssh_base(ip, username, port):
+    return [
         "ssh", "-p", str(port),
         "-o", "StrictHostKeyChecking=no",
-        f"{username}@{ip}", command
+        "-o", f"ControlPath={_control_path(ip, username, port)}",
     ]
+
+
+def _master_alive(ip, username, port):
+    check = _ssh_base(ip, username, port) + ["-O", "check", f"{username}@{ip}"]
+    return subprocess.run(check, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode == 0
+
+
+def _ensure_master(ip, username, password, port):
+    key = (ip, username, port)
+    with _master_locks_guard:
+        lock = _master_locks.setdefault(key, threading.Lock())
+    with lock:
+        if _master_alive(ip, username, port):
+            return
+        os.makedirs(CONTROL_DIR, mode=0o700, exist_ok=True)
+        # -f -N: authenticate, then background the master. Its stdio goes to
+        # /dev/null so it can't hold our pipes open. Password via env, not argv.
+        master = ["sshpass", "-e"] + _ssh_base(ip, username, port) + [
+            "-o", "ControlMaster=yes",
+            "-o", f"ControlPersist={CONTROL_PERSIST}",
+            "-f", "-N", f"{username}@{ip}",
+        ]
+        subprocess.run(master, env=dict(os.environ, SSHPASS=password), timeout=SSH_TIMEOUT,
+                       stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+# SSH execution with password
+def ssh_exec(ip, username, password, command, port=22):
     try:
-        result = subprocess.run(ssh_cmd, capture_output=True, text=True, timeout=30)
-        return True, result.stdout.strip() or result.stderr.strip()
+        for attempt in range(2):
+            _ensure_master(ip, username, password, port)
+            ssh_cmd = _ssh_base(ip, username, port) + [
+                "-o", "ControlMaster=no",
+                "-o", "BatchMode=yes",  # never prompt if the master went away
+                f"{username}@{ip}", command
+            ]
+            result = subprocess.run(ssh_cmd, capture_output=True, text=True, timeout=SSH_TIMEOUT)
+            if result.returncode != SSH_CONNECTION_ERROR or attempt:
+                return True, result.stdout.strip() or result.stderr.strip()
+            # stale master socket (host rebooted, network blip): rebuild once
+            close_ssh(ip, username, port)
     except Exception as e:
         return False, str(e)
 
+
+def close_ssh(ip, username, port=22):
+    stop = _ssh_base(ip, username, port) + ["-O", "exit", f"{username}@{ip}"]
+    subprocess.run(stop, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def close_all_ssh():
+    for ip, username, port in list(_master_locks):
+        close_ssh(ip, username, port)
+
 # Log actuator results to MongoDB
 def log_action(hp, plugin, act_type, cmd, output, success, action_id):
     error_keywords = ["No such file", "command not found", "Failed", "Error", "permission denied"]
@@ -65,6 +131,5 @@ def log_action(hp, plugin, act_type, cmd, output, success, action_id):
         "action_id": action_id
     }
 
-    log_collection = MongoClient("mongodb://localhost:27017/")["adapttrap"]["actuator_logs"]
-    log_collection.insert_one(log_entry)
+    get_db()["actuator_logs"].insert_one(log_entry)
     print("[📝] Logged to actuator_logs.")
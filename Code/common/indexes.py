@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Index declarations for the adapttrap database.
+
+Every collection's indexes are declared in INDEXES, next to a note on the
+query they serve; `hot_queries()` lists those queries for `explain`. Services call `ensure_indexes(db, [...])` at
+startup for the collections they read; `create_indexes` is a no-op for
+indexes that already exist, so this is cheap to repeat.
+
+    python3 Code/common/indexes.py ensure              # create everything
+    python3 Code/common/indexes.py explain             # winning plan per hot query
+    python3 Code/common/indexes.py explain --stats     # + docs/keys examined, ms
+
+Index order follows equality → sort → range, so e.g. a rollup series read
+(dim, key, t range, sorted by t) is a pure index scan on (dim, t).
+"""
+from __future__ import annotations
+
+import os
+import sys
+import argparse
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from common.mongo import get_db
+
+# rollup_minute buckets older than this are dropped by the t_ttl index
+ROLLUP_MINUTE_TTL_DAYS = int(os.getenv("ROLLUP_MINUTE_TTL_DAYS", "30"))
+
+# Same key spec, different name/options → server refuses to create it again.
+INDEX_CONFLICT = {85, 86}
+
+# ---------- declarations ----------
+INDEXES: Dict[str, List[IndexModel]] = {
+    "normalized_logs": [
+        # LiveFeed.seed: newest timestamp, then the newest window; rollups: timestamp range
+        IndexModel([("timestamp", DESCENDING)], name="timestamp_desc"),
+        # dashboard: filtered counts / pages by source
+        IndexModel([("source", ASCENDING), ("timestamp", DESCENDING)], name="source_timestamp"),
+        # normalizer upsert key; legacy rows without raw_id are exempt
+        IndexModel([("raw_collection", ASCENDING), ("raw_id", ASCENDING)], name="raw_ref_unique",
+                   unique=True, partialFilterExpression={"raw_id": {"$exists": True}}),
+    ],
+    "agent_actions": [
+        # actuator claim_batch / expire_old: pending actions, oldest first
+        IndexModel([("processed", ASCENDING), ("_id", ASCENDING)], name="processed_id"),
+        # actuator claim_batch: read back the rows one claim tagged
+        IndexModel([("claim_id", ASCENDING)], name="claim_id", sparse=True),
+        # dashboard / health check: latest actions
+        IndexModel([("created_at", DESCENDING)], name="created_at_desc"),
+        # predictor writes one decision as a batch; groups its actions for audit
+        IndexModel([("decision_id", ASCENDING)], name="decision_id", sparse=True),
+    ],
+    "plugin_states": [
+        IndexModel([("plugin", ASCENDING)], name="plugin"),
+    ],
+    "nodepot_logs": [
+        # forwarder claim_next: pending file uploads, oldest first
+        IndexModel([("event_type", ASCENDING), ("forwarded", ASCENDING), ("processing", ASCENDING)],
+                   name="event_forwarded_processing"),
+        # forwarder dedup: {$or: [{sha256}, {cape_sha256}]} needs both sides indexed
+        IndexModel([("sha256", ASCENDING)], name="sha256"),
+        IndexModel([("cape_sha256", ASCENDING)], name="cape_sha256"),
+    ],
+    "cape_results": [
+        IndexModel([("sha256", ASCENDING)], name="sha256"),
+    ],
+    # normalizer/rollups.py readers: one dimension over a time range
+    "rollup_minute": [
+        IndexModel([("dim", ASCENDING), ("t", DESCENDING)], name="dim_t"),
+        # minute buckets are only kept for recent charts and hour rebuilds (rollups.recompute)
+        IndexModel([("t", ASCENDING)], name="t_ttl",
+                   expireAfterSeconds=ROLLUP_MINUTE_TTL_DAYS * 86400),
+    ],
+    "rollup_hour": [
+        IndexModel([("dim", ASCENDING), ("t", DESCENDING)], name="dim_t"),
+    ],
+    "rollup_day": [
+        IndexModel([("dim", ASCENDING), ("t", DESCENDING)], name="dim_t"),
+    ],
+}
+
+
+def ensure_indexes(db, collections: Optional[Iterable[str]] = None) -> Dict[str, List[str]]:
+    """Create the declared indexes (all collections by default); returns names per collection."""
+    created: Dict[str, List[str]] = {}
+    for name in collections if collections is not None else INDEXES:
+        models = INDEXES.get(name)
+        if not models:
+            continue
+        try:
+            created[name] = db[name].create_indexes(models)
+        except OperationFailure as e:
+            if e.code not in INDEX_CONFLICT:
+                raise
+            # An equivalent index exists under another name; create the rest one by one.
+            created[name] = []
+            for model in models:
+                try:
+                    created[name] += db[name].create_indexes([model])
+                except OperationFailure as e2:
+                    if e2.code not in INDEX_CONFLICT:
+                        raise
+                    print(f"[!] {name}.{model.document['name']}: {e2.details.get('errmsg', e2)}")
+    return created
+
+
+# ---------- hot queries ----------
+def hot_queries(now: Optional[datetime] = None) -> List[Dict[str, Any]]:
+    """The queries the services actually run, as explainable commands."""
+    now = now or datetime.now(timezone.utc)
+    return [
+        {"name": "feed.newest", "command": {
+            "find": "normalized_logs", "filter": {}, "projection": {"timestamp": 1},
+            "sort": {"timestamp": -1}, "limit": 1}},
+        {"name": "feed.seed", "command": {
+            "find": "normalized_logs", "filter": {"timestamp": {"$gte": now - timedelta(minutes=5)}},
+            "projection": {"ip": 1, "port": 1, "source": 1, "tags": 1, "timestamp": 1},
+            "sort": {"timestamp": -1}, "limit": 50}},
+        {"name": "dashboard.recent_logs", "command": {
+            "find": "normalized_logs",
+            "filter": {"_id": {"$gt": ObjectId.from_datetime(now - timedelta(minutes=5))}},
+            "sort": {"_id": -1}, "limit": 20000}},
+        {"name": "dashboard.logs_page", "command": {
+            "find": "normalized_logs", "filter": {"source": {"$in": ["cowrie"]}},
+            "sort": {"_id": -1}, "skip": 20000, "limit": 100}},
+        {"name": "dashboard.count_logs", "command": {
+            "count": "normalized_logs", "query": {"source": {"$in": ["cowrie"]}}}},
+        {"name": "rollups.logs_range", "command": {
+            "aggregate": "normalized_logs", "cursor": {}, "pipeline": [
+                {"$match": {"timestamp": {"$gte": now - timedelta(minutes=5), "$lt": now}}},
+                {"$group": {"_id": "$source", "count": {"$sum": 1}}}]}},
+        {"name": "actuator.claim_batch", "command": {
+            "find": "agent_actions",
+            "filter": {"processed": {"$ne": True}, "$or": [
+                {"processing": {"$exists": False}}, {"processing": False},
+                {"processing_at": {"$lt": now - timedelta(minutes=10)}}]},
+            "sort": {"_id": 1}, "limit": 100, "projection": {"_id": 1}}},
+        {"name": "actuator.claimed", "command": {
+            "find": "agent_actions", "filter": {"claim_id": ObjectId()}, "sort": {"_id": 1}}},
+        {"name": "dashboard.latest_actions", "command": {
+            "find": "agent_actions", "filter": {}, "sort": {"created_at": -1}, "limit": 100}},
+        {"name": "predictor.plugin_state", "command": {
+            "find": "plugin_states", "filter": {"plugin": "ssh"}, "limit": 1}},
+        {"name": "nodepot.claim_next", "command": {
+            "find": "nodepot_logs",
+            "filter": {"event_type": "file_upload", "dead": {"$ne": True}, "$and": [
+                {"$or": [{"forwarded": {"$exists": False}}, {"forwarded": False}]},
+                {"$or": [{"processing": {"$exists": False}}, {"processing": False},
+                         {"processing_at": {"$lt": now - timedelta(minutes=10)}}]}]},
+            "sort": {"_id": 1}, "limit": 1}},
+        {"name": "rollups.series", "command": {
+            "find": "rollup_day", "filter": {"dim": "total", "key": "all", "t": {"$gte": now - timedelta(days=30)}},
+            "projection": {"t": 1, "count": 1}, "sort": {"t": 1}}},
+        {"name": "rollups.top_ips", "command": {
+            "aggregate": "rollup_day", "cursor": {}, "pipeline": [
+                {"$match": {"dim": "ip", "t": {"$gte": now - timedelta(days=7)}}},
+                {"$group": {"_id": "$key", "count": {"$sum": "$count"}}},
+                {"$sort": {"count": -1}}, {"$limit": 10}]}},
+        {"name": "nodepot.dedup", "command": {
+            "count": "nodepot_logs",
+            "query": {"$or": [{"sha256": "0" * 64}, {"cape_sha256": "0" * 64}]}}},
+    ]
+
+
+def plan_summary(plan: Dict[str, Any]) -> List[str]:
+    """Flatten a winning plan into 'STAGE(index)' strings, root first."""
+    out = []
+    stack = [plan]
+    while stack:
+        node = stack.pop()
+        stage = node.get("stage", "?")
+        out.append(f"{stage}({node['indexName']})" if "indexName" in node else stage)
+        if "inputStage" in node:
+            stack.append(node["inputStage"])
+        stack.extend(reversed(node.get("inputStages", [])))
+    return out
+
+
+def explain(db, verbosity: str = "queryPlanner") -> List[Dict[str, Any]]:
+    results = []
+    for q in hot_queries():
+        res = db.command("explain", q["command"], verbosity=verbosity)
+        if "stages" in res:  # aggregate that was not pushed down whole: the plan sits in the $cursor stage
+            res = res["stages"][0].get("$cursor", {})
+        planner = res.get("queryPlanner", {})
+        stages = plan_summary(planner.get("winningPlan", {}).get("queryPlan", planner.get("winningPlan", {})))
+        row = {"name": q["name"], "plan": stages, "collscan": "COLLSCAN" in stages}
+        stats = res.get("executionStats")
+        if stats:
+            row.update(returned=stats.get("nReturned"), keys=stats.get("totalKeysExamined"),
+                       docs=stats.get("totalDocsExamined"), ms=stats.get("executionTimeMillis"))
+        results.append(row)
+    return results
+
+
+# ---------- CLI ----------
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Create adapttrap indexes / explain the hot queries")
+    parser.add_argument("action", choices=["ensure", "explain"])
+    parser.add_argument("--collections", nargs="+", choices=list(INDEXES), help="default: all")
+    parser.add_argument("--stats", action="store_true", help="explain with executionStats (runs the queries)")
+    parser.add_argument("--mongo-uri", help="default: MONGO_URI / Config/mongo.config.yaml")
+    args = parser.parse_args()
+
+    db = get_db(uri=args.mongo_uri)
+    if args.action == "ensure":
+        for name, created in ensure_indexes(db, args.collections).items():
+            print(f"[+] {name}: {', '.join(created) or '-'}")
+        return
+
+    rows = explain(db, "executionStats" if args.stats else "queryPlanner")
+    for row in rows:
+        flag = "❌ COLLSCAN" if row["collscan"] else "✅"
+        print(f"{flag} {row['name']:<26} {' <- '.join(row['plan'])}")
+        if "ms" in row:
+            print(f"   returned={row['returned']} keys={row['keys']} docs={row['docs']} {row['ms']}ms")
+    if any(r["collscan"] for r in rows):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Shared MongoDB client factory.
+
+One pooled MongoClient per (URI, process) is built on first use and reused by
+every caller, instead of each module (or each call) opening its own. Clients
+are created with `connect=False`, so importing a module costs nothing until
+the first query, and a client is never shared across a fork (pool workers get
+their own).
+
+Settings, highest priority first:
+  1. explicit arguments to get_client()/get_db()
+  2. environment: MONGO_URI, MONGO_DB, MONGO_MAX_POOL, MONGO_MIN_POOL,
+     MONGO_IDLE_MS, MONGO_TIMEOUT_MS
+  3. YAML file at $ADAPTTRAP_MONGO_CONFIG or Config/mongo.config.yaml
+     (see Config/mongo.config.example.yaml; ${VAR} placeholders are expanded)
+  4. built-in defaults (localhost, adapttrap)
+
+    from common.mongo import get_db
+    db = get_db()
+"""
+from __future__ import annotations
+
+import os
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+from pymongo import MongoClient
+
+CONFIG_PATH = os.path.abspath(os.path.join(
+    os.path.dirname(__file__), "..", "..", "Config", "mongo.config.yaml"))
+
+DEFAULTS: Dict[str, Any] = {
+    "mongo_uri": "mongodb://localhost:27017/",
+    "db_name": "adapttrap",
+    "max_pool_size": 50,
+    "min_pool_size": 0,
+    "max_idle_ms": 300000,
+    "server_selection_timeout_ms": 5000,
+}
+
+ENV_KEYS = {
+    "mongo_uri": "MONGO_URI",
+    "db_name": "MONGO_DB",
+    "max_pool_size": "MONGO_MAX_POOL",
+    "min_pool_size": "MONGO_MIN_POOL",
+    "max_idle_ms": "MONGO_IDLE_MS",
+    "server_selection_timeout_ms": "MONGO_TIMEOUT_MS",
+}
+
+_lock = threading.Lock()
+_clients: Dict[Tuple[int, str], MongoClient] = {}
+_settings: Optional[Dict[str, Any]] = None
+
+
+def _load_yaml(path: str) -> Dict[str, Any]:
+    if not os.path.isfile(path):
+        return {}
+    try:
+        import yaml
+    except ImportError:
+        print(f"[!] {path} present but PyYAML is not installed; using env/defaults")
+        return {}
+    with open(path, "r") as f:
+        raw = yaml.safe_load(os.path.expandvars(f.read())) or {}
+    flat = dict(raw.pop("pool", None) or {})
+    flat.update(raw)
+    # unset ${VAR} placeholders stay literal after expandvars → ignore them
+    return {k: v for k, v in flat.items() if not (isinstance(v, str) and v.startswith("${"))}
+
+
+def settings() -> Dict[str, Any]:
+    """Effective connection settings (cached after the first call)."""
+    global _settings
+    if _settings is None:
+        merged = dict(DEFAULTS)
+        merged.update({k: v for k, v in _load_yaml(os.getenv("ADAPTTRAP_MONGO_CONFIG", CONFIG_PATH)).items()
+                       if k in DEFAULTS and v not in (None, "")})
+        for key, env in ENV_KEYS.items():
+            if os.getenv(env):
+                merged[key] = os.environ[env]
+        for key in DEFAULTS:
+            if isinstance(DEFAULTS[key], int):
+                merged[key] = int(merged[key])
+        _settings = merged
+    return _settings
+
+
+def get_client(uri: Optional[str] = None) -> MongoClient:
+    """Process-wide pooled client for `uri` (default: configured MONGO_URI)."""
+    cfg = settings()
+    uri = uri or cfg["mongo_uri"]
+    key = (os.getpid(), uri)
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _clients[key] = MongoClient(
+                    uri,
+                    connect=False,
+                    maxPoolSize=cfg["max_pool_size"],
+                    minPoolSize=cfg["min_pool_size"],
+                    maxIdleTimeMS=cfg["max_idle_ms"],
+                    serverSelectionTimeoutMS=cfg["server_selection_timeout_ms"],
+                    appname="adapttrap",
+                )
+    return client
+
+
+def get_db(name: Optional[str] = None, uri: Optional[str] = None):
+    return get_client(uri)[name or settings()["db_name"]]
+
+
+def close_all() -> None:
+    with _lock:
+        for (pid, _), client in list(_clients.items()):
+            if pid == os.getpid():
+                client.close()
+        _clients.clear()
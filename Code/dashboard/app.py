@@ -1,6 +1,8 @@
 import streamlit as st
 import pandas as pd
-from db import get_normalized_logs, get_plugin_states, get_agent_actions
+from db import (get_plugin_states, get_agent_actions, get_filter_options,
+                build_log_filter, count_logs, get_logs_page, get_archive_counts)
+from normalizer.parquet_store import conform
 from utils.summarize_logs import get_summary_metrics
 from utils.tag_insights import get_tag_insights
 from utils.build_charts import build_graphs
@@ -10,18 +12,8 @@ from utils.health_check import run_health_checks
 st.set_page_config(page_title="ADAPT Trap Dashboard", layout="wide")
 st.title("\U0001F6E1 ADAPT Trap Honeypot Dashboard")
 
-# === Load Logs ===
-logs_df = get_normalized_logs()
-
-# 🔧 Fix logs_df for Arrow + timezone issues
-if "_id" in logs_df.columns:
-    logs_df["_id"] = logs_df["_id"].astype(str)
-if "timestamp" in logs_df.columns:
-    logs_df["timestamp"] = pd.to_datetime(logs_df["timestamp"], errors="coerce", utc=True)
-if "port" in logs_df.columns:
-    logs_df["port"] = logs_df["port"].astype(str)
-
-summary = get_summary_metrics(logs_df)
+# === Metrics (aggregated in MongoDB, over all logs) ===
+summary = get_summary_metrics()
 
 # === Top Metrics ===
 st.markdown("### \u2728 Top Metrics")
@@ -42,8 +34,9 @@ for i, (component, (status, color)) in enumerate(health.items()):
 
 # === Filters ===
 st.markdown("### \U0001F50D Filter Logs")
-source_opts = sorted(logs_df['source'].dropna().unique())
-proto_opts = sorted(logs_df['protocol'].dropna().unique())
+filter_opts = get_filter_options()
+source_opts = filter_opts["source"]
+proto_opts = filter_opts["protocol"]
 tag_opts = ["brute-force", "ics-probe", "nmap", "upload", "sql-injection"]
 
 col1, col2, col3 = st.columns(3)
@@ -51,15 +44,22 @@ source_val = col1.multiselect("Source", source_opts)
 proto_val = col2.multiselect("Protocol", proto_opts)
 tag_val = col3.multiselect("Tags", tag_opts)
 
-if source_val:
-    logs_df = logs_df[logs_df['source'].isin(source_val)]
-if proto_val:
-    logs_df = logs_df[logs_df['protocol'].isin(proto_val)]
-if tag_val:
-    logs_df = logs_df[logs_df['tags'].apply(lambda tags: any(t in tags for t in tag_val))]
+log_filter = build_log_filter(source_val, proto_val, tag_val)
 
-# === Logs Table ===
+# === Logs Table (one page at a time) ===
 st.markdown("### \U0001F4D1 Attack Logs")
+total = count_logs(log_filter)
+col1, col2, col3 = st.columns([1, 1, 4])
+page_size = col1.selectbox("Rows per page", [50, 100, 250, 500], index=1)
+pages = max((total + page_size - 1) // page_size, 1)
+page = col2.number_input("Page", min_value=1, max_value=pages, value=1, step=1)
+col3.caption(f"{total:,} matching logs · page {page} of {pages}")
+
+logs_df = get_logs_page(log_filter, page, page_size)
+
+# 🔧 Same column types as the Parquet archive, so Arrow conversion can't trip on _id / mixed ports
+logs_df = conform(logs_df)
+
 st.dataframe(logs_df[["timestamp", "source", "ip", "port", "protocol", "raw_log", "tags"]], use_container_width=True)
 
 # === Plugin States ===
@@ -88,4 +88,10 @@ st.dataframe(rl_df, use_container_width=True)
 
 # === Charts ===
 #st.markdown("### \U0001F4CA Statistics & Visuals")
-build_graphs(logs_df)
+build_graphs(log_filter)
+
+# === Archive (Parquet export, see normalizer/parquet_store.py) ===
+archive = get_archive_counts()
+if not archive.empty:
+    st.subheader("🗄️ Archived Log Volume")
+    st.bar_chart(archive.pivot_table(index="day", columns="source", values="rows", aggfunc="sum").fillna(0))
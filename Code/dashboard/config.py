@@ -1,3 +1,6 @@
 # config.py
-MONGO_URI = "mongodb://localhost:27017"
-DB_NAME = "adapttrap"
+# Connection settings live in common.mongo (MONGO_URI / MONGO_DB / Config/mongo.config.yaml);
+# these mirror them for code that still reads config directly.
+import os
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
+DB_NAME = os.getenv("MONGO_DB", "adapttrap")
@@ -1,30 +1,246 @@
-from pymongo import MongoClient
+import os
+import sys
+import threading
+import time
+from datetime import timedelta
 import pandas as pd
+import streamlit as st
+from bson import ObjectId
 
-def get_db():
-    client = MongoClient("mongodb://localhost:27017")
-    return client["adapttrap"]
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from common.mongo import get_db as _shared_db  # pooled client (MONGO_URI / Config/mongo.config.yaml)
+from normalizer import parquet_store, rollups
 
-def get_normalized_logs():
-    db = get_db()
-    cursor = db["normalized_logs"].find()
-    return pd.DataFrame(list(cursor))
+# Columns the log table shows; raw_log is cut server-side so a page stays small.
+LOG_TABLE_FIELDS = ["timestamp", "source", "ip", "port", "protocol", "raw_log", "tags"]
+RAW_LOG_PREVIEW = 300
+
+# === Caching ===
+# Every query below is cached across sessions and reruns, so widget clicks and
+# extra analysts don't add database load. Seconds a result may be reused:
+CACHE_TTL = {
+    "metrics": 30,
+    "counts": 30,
+    "timeline": 60,
+    "filter_options": 300,
+    "log_count": 15,
+    "logs_page": 15,
+    "recent_logs": 5,
+    "plugin_states": 10,
+    "agent_actions": 10,
+    "archive": 300,
+}
+# Newest logs kept in memory; filtered pages that fall inside it skip MongoDB.
+RECENT_LOGS_MAX = int(os.getenv("DASHBOARD_RECENT_LOGS", "20000"))
+# Seconds below the newest `_id` that each refresh re-reads (see IncrementalFrame).
+RECENT_LOGS_ID_LAG = int(os.getenv("DASHBOARD_ID_LAG_SECONDS", "300"))
+
+@st.cache_resource(show_spinner=False)
+def get_db():
+    return _shared_db()
 
+@st.cache_data(ttl=CACHE_TTL["plugin_states"], show_spinner=False)
 def get_plugin_states():
     db = get_db()
     cursor = db["plugin_states"].find()
     return pd.DataFrame(list(cursor))
 
+@st.cache_data(ttl=CACHE_TTL["agent_actions"], show_spinner=False)
 def get_agent_actions():
     db = get_db()
     cursor = db["agent_actions"].find().sort("created_at", -1).limit(100)
     return pd.DataFrame(list(cursor))
 
+# === normalized_logs: filters, aggregations and pages run in MongoDB ===
+# Without a filter the counts come from the day rollups (normalizer/rollups.py),
+# which the normalizer keeps current; a filter needs the raw logs.
+def _table_projection():
+    projection = {field: 1 for field in LOG_TABLE_FIELDS}
+    projection["raw_log"] = {"$cond": [
+        {"$eq": [{"$type": "$raw_log"}, "string"]},
+        {"$substrCP": ["$raw_log", 0, RAW_LOG_PREVIEW]},
+        "$raw_log",
+    ]}
+    return projection
+
+class IncrementalFrame:
+    """
+    The newest `max_rows` documents of a collection as a DataFrame. Once
+    loaded, a refresh fetches only documents with `_id` above the last one
+    seen, less `id_lag` seconds: ObjectIds come from the writers' clocks, so
+    a document can commit after a larger `_id` was read. Rows already held
+    are dropped, late ones are sorted into place. At most one refresh per
+    `ttl` seconds runs, however many sessions read it.
+    """
+
+    def __init__(self, collection, projection, max_rows, ttl, id_lag=RECENT_LOGS_ID_LAG):
+        self.collection = collection
+        self.projection = projection
+        self.max_rows = max_rows
+        self.ttl = ttl
+        self.id_lag = timedelta(seconds=id_lag)
+        self.columns = ["_id"] + [f for f in projection if f != "_id"]
+        self.df = pd.DataFrame(columns=self.columns)
+        self.last_id = None
+        self.fetched_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self):
+        with self._lock:
+            if time.monotonic() - self.fetched_at >= self.ttl:
+                self._refresh()
+            return self.df
+
+    def _refresh(self):
+        query = {}
+        if self.last_id is not None:
+            query = {"_id": {"$gt": ObjectId.from_datetime(self.last_id.generation_time - self.id_lag)}}
+        cursor = (get_db()[self.collection]
+                  .find(query, self.projection)
+                  .sort("_id", -1)
+                  .limit(self.max_rows))
+        docs = list(cursor)[::-1]
+        if docs:
+            new = pd.DataFrame(docs, columns=self.columns)
+            if len(docs) >= self.max_rows or self.df.empty:
+                self.df = new.reset_index(drop=True)
+            else:
+                new = new[~new["_id"].isin(set(self.df["_id"]))]
+                if not new.empty:
+                    df = pd.concat([self.df, new], ignore_index=True)
+                    if new["_id"].iloc[0] < self.last_id:  # committed late
+                        df = df.sort_values("_id", kind="stable")
+                    self.df = df.tail(self.max_rows).reset_index(drop=True)
+            self.last_id = max(self.last_id or docs[-1]["_id"], docs[-1]["_id"])
+        self.fetched_at = time.monotonic()
+
+@st.cache_resource(show_spinner=False)
+def recent_logs():
+    return IncrementalFrame("normalized_logs", _table_projection(), RECENT_LOGS_MAX, CACHE_TTL["recent_logs"])
+
+def build_log_filter(sources=None, protocols=None, tags=None):
+    query = {}
+    if sources:
+        query["source"] = {"$in": list(sources)}
+    if protocols:
+        query["protocol"] = {"$in": list(protocols)}
+    if tags:
+        query["tags"] = {"$in": list(tags)}
+    return query
 
-# === utils/summarize_logs.py ===
-def get_summary_metrics(df):
+def _filter_frame(df, query):
+    """Apply a build_log_filter() query to a frame of logs."""
+    mask = pd.Series(True, index=df.index)
+    for field in ("source", "protocol"):
+        if field in query:
+            mask &= df[field].isin(query[field]["$in"])
+    if "tags" in query:
+        wanted = set(query["tags"]["$in"])
+        mask &= df["tags"].map(lambda tags: isinstance(tags, list) and not wanted.isdisjoint(tags))
+    return df[mask]
+
+@st.cache_data(ttl=CACHE_TTL["filter_options"], show_spinner=False)
+def get_filter_options():
+    coll = get_db()["normalized_logs"]
     return {
-        "count": len(df),
-        "unique_ips": df["ip"].nunique(),
-        "tagged": df["tags"].apply(lambda x: len(x) > 0).sum()
-    }
\ No newline at end of file
+        "source": sorted(v for v in coll.distinct("source") if v is not None),
+        "protocol": sorted(v for v in coll.distinct("protocol") if v is not None),
+    }
+
+@st.cache_data(ttl=CACHE_TTL["metrics"], show_spinner=False)
+def get_log_metrics(query=None):
+    """Total logs, unique IPs and tagged logs in one pass."""
+    if not query:
+        db = get_db()
+        return {"count": rollups.count(db), "unique_ips": rollups.distinct_keys(db, "ip"),
+                "tagged": rollups.count(db, "tagged")}
+    pipeline = [
+        {"$match": query or {}},
+        {"$facet": {
+            "count": [{"$count": "n"}],
+            "unique_ips": [{"$group": {"_id": "$ip"}}, {"$count": "n"}],
+            "tagged": [{"$match": {"tags.0": {"$exists": True}}}, {"$count": "n"}],
+        }},
+    ]
+    facets = next(get_db()["normalized_logs"].aggregate(pipeline, allowDiskUse=True), {})
+    return {name: (facets.get(name) or [{"n": 0}])[0]["n"] for name in ("count", "unique_ips", "tagged")}
+
+def _counts(pipeline):
+    rows = get_db()["normalized_logs"].aggregate(pipeline, allowDiskUse=True)
+    return pd.Series({row["_id"]: row["n"] for row in rows if row["_id"] is not None}, dtype="int64")
+
+def _rollup_counts(dim):
+    return pd.Series(dict(rollups.totals(get_db(), dim)), dtype="int64")
+
+@st.cache_data(ttl=CACHE_TTL["counts"], show_spinner=False)
+def get_tag_counts(query=None):
+    if not query:
+        return _rollup_counts("tag")
+    return _counts([
+        {"$match": query or {}},
+        {"$unwind": "$tags"},
+        {"$group": {"_id": "$tags", "n": {"$sum": 1}}},
+        {"$sort": {"n": -1}},
+    ])
+
+@st.cache_data(ttl=CACHE_TTL["counts"], show_spinner=False)
+def get_protocol_counts(query=None):
+    if not query:
+        return _rollup_counts("protocol")
+    return _counts([
+        {"$match": query or {}},
+        {"$group": {"_id": "$protocol", "n": {"$sum": 1}}},
+        {"$sort": {"n": -1}},
+    ])
+
+@st.cache_data(ttl=CACHE_TTL["timeline"], show_spinner=False)
+def get_daily_timeline(query=None):
+    """Logs per UTC day; string timestamps are converted, unparsable ones skipped."""
+    if not query:
+        days = rollups.series(get_db(), "day")
+        return pd.Series([n for _, n in days], index=pd.to_datetime([t.date() for t, _ in days]), dtype="int64")
+    series = _counts([
+        {"$match": query or {}},
+        {"$project": {"day": {"$dateToString": {"format": "%Y-%m-%d", "date": {
+            "$convert": {"input": "$timestamp", "to": "date", "onError": None, "onNull": None}}}}}},
+        {"$group": {"_id": "$day", "n": {"$sum": 1}}},
+        {"$sort": {"_id": 1}},
+    ])
+    series.index = pd.to_datetime(series.index)
+    return series
+
+@st.cache_data(ttl=CACHE_TTL["log_count"], show_spinner=False)
+def count_logs(query=None):
+    return get_db()["normalized_logs"].count_documents(query or {})
+
+@st.cache_data(ttl=CACHE_TTL["logs_page"], show_spinner=False)
+def _logs_page_from_db(query, page, page_size):
+    cursor = (get_db()["normalized_logs"]
+              .find(query, _table_projection())
+              .sort("_id", -1)
+              .skip(max(page - 1, 0) * page_size)
+              .limit(page_size))
+    return pd.DataFrame(list(cursor), columns=["_id"] + LOG_TABLE_FIELDS)
+
+def get_logs_page(query=None, page=1, page_size=100):
+    """
+    One page of the log table, newest first, projected to LOG_TABLE_FIELDS.
+    Pages inside the in-memory recent window are sliced from it; older
+    pages are read from MongoDB.
+    """
+    query = query or {}
+    start = max(page - 1, 0) * page_size
+    window = recent_logs().get()
+    matching = _filter_frame(window, query)
+    if start + page_size <= len(matching) or len(window) < RECENT_LOGS_MAX:
+        # the window is the newest RECENT_LOGS_MAX logs, or all of them
+        return matching.iloc[::-1].iloc[start:start + page_size].reset_index(drop=True)
+    return _logs_page_from_db(query, page, page_size)
+
+# === Parquet archive ===
+@st.cache_data(ttl=CACHE_TTL["archive"], show_spinner=False)
+def get_archive_counts():
+    """Rows per (day, source) in the Parquet archive; empty if nothing was exported."""
+    if not os.path.isdir(parquet_store.PARQUET_ROOT):
+        return pd.DataFrame(columns=["day", "source", "rows"])
+    return parquet_store.partition_counts()
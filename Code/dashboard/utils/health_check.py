@@ -1,29 +1,31 @@
 # utils/health_check.py
-from pymongo import MongoClient
 from datetime import datetime, timezone
 import socket
-from pymongo import MongoClient
+import pymongo
+import streamlit as st
+from db import get_db
 from utils.remote_health import cowrie, honeypy, honeytrap, conpot, nodepot_lite
 
 def check_mongodb():
     try:
-        client = MongoClient("mongodb://localhost:27017/", serverSelectionTimeoutMS=1000)
-        client.server_info()
+        with pymongo.timeout(1):
+            get_db().client.admin.command("ping")
         return "✅ Connected", "green"
     except Exception:
         return "❌ Down", "red"
 
 def check_latest_action():
     try:
-        client = MongoClient("mongodb://localhost:27017/")
-        db = client["adapttrap"]
-        latest = db["agent_actions"].find_one(sort=[("created_at", -1)])
+        latest = get_db()["agent_actions"].find_one(sort=[("created_at", -1)])
         if latest:
             return f"🕒 {latest.get('created_at')}", "green"
         return "⚠️ No actions yet", "orange"
     except Exception:
         return "❌ Error", "red"
 
+# remote probes are refreshed in the background (utils/remote_health.py); this
+# only spares every rerun the Mongo ping and latest-action lookup
+@st.cache_data(ttl=10, show_spinner=False)
 def run_health_checks():
     return {
         "MongoDB":       check_mongodb(),
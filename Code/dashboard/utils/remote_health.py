@@ -1,94 +1,207 @@
 # utils/remote_health.py
+"""
+Remote honeypot health for the dashboard.
+
+Each host gets one SSH session per refresh: all probes for the honeypots on
+that host (process, listening port, systemd unit, docker container) are sent
+as a single shell script, and hosts are probed concurrently. Results are
+cached by HealthMonitor; its background thread keeps them fresh, so a
+Streamlit rerun only reads the cache.
+"""
 from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-import json, shlex, subprocess
+import json, os, shlex, subprocess, threading, time
 
 ROOT = Path(__file__).resolve().parents[2]  # .../Code
 CREDS_PATH = ROOT / "configs" / "honeypot_creds.json"
 HOSTS_PATH = ROOT / "configs" / "honeypot_hosts.json"
 
-def _load(name: str):
-    with open(CREDS_PATH, "r") as f: creds = json.load(f)[name]
-    with open(HOSTS_PATH, "r") as f: host = json.load(f)[name]
-    return host["ip"], int(host["ssh_port"]), creds["username"], creds["password"]
-
-def _ssh(hp: str, cmd: str, timeout: int = 8):
-    ip, port, user, pwd = _load(hp)
-    ssh_cmd = (
-        f"sshpass -p {shlex.quote(pwd)} ssh -p {port} "
-        "-o StrictHostKeyChecking=no "
-        "-o ConnectTimeout=5 "
-        "-oHostKeyAlgorithms=+ssh-rsa "
-        "-oPubkeyAcceptedAlgorithms=+ssh-rsa "
-        f"{shlex.quote(user)}@{ip} {shlex.quote(cmd)}"
-    )
-    try:
-        out = subprocess.check_output(ssh_cmd, shell=True, stderr=subprocess.STDOUT, timeout=timeout)
-        return 0, out.decode().strip()
-    except subprocess.CalledProcessError as e:
-        return e.returncode, e.output.decode(errors="ignore").strip()
-    except Exception as e:
-        return 255, str(e)
+HEALTH_REFRESH_SECONDS = float(os.getenv("HEALTH_REFRESH_SECONDS", "15"))
+HEALTH_TTL_SECONDS = float(os.getenv("HEALTH_TTL_SECONDS", "60"))  # older results are re-probed inline
+SSH_TIMEOUT = 15
 
-def _ok(ok: bool, good="✅ Open", bad="❌ Closed"):
-    return (good if ok else bad, "green" if ok else "red")
+# ---------- config (re-read only when the files change) ----------
+_config_cache = {"mtimes": None, "creds": None, "hosts": None}
+_config_lock = threading.Lock()
 
-def _pgrep(hp: str, pattern: str) -> bool:
-    code, _ = _ssh(hp, f"pgrep -f {shlex.quote(pattern)} >/dev/null && echo ok || echo no")
-    return code == 0
+def _config():
+    mtimes = (CREDS_PATH.stat().st_mtime, HOSTS_PATH.stat().st_mtime)
+    with _config_lock:
+        if _config_cache["mtimes"] != mtimes:
+            with open(CREDS_PATH, "r") as f: _config_cache["creds"] = json.load(f)
+            with open(HOSTS_PATH, "r") as f: _config_cache["hosts"] = json.load(f)
+            _config_cache["mtimes"] = mtimes
+        return _config_cache["creds"], _config_cache["hosts"]
 
-def _port(hp: str, port: int, proto="tcp") -> bool:
+def _load(name: str):
+    creds, hosts = _config()
+    return hosts[name]["ip"], int(hosts[name]["ssh_port"]), creds[name]["username"], creds[name]["password"]
+
+# ---------- probes ----------
+# Each probe is a shell condition; the script prints "<index>=1" or "<index>=0" per probe.
+def _pgrep(pattern: str) -> str:
+    return f"pgrep -f {shlex.quote(pattern)} >/dev/null"
+
+def _port(port: int, proto="tcp") -> str:
     if proto == "udp":
-        cmd = f"ss -lun | awk '{{print $5}}' | grep -q ':{port}$'"
-    else:
-        cmd = f"ss -ltn | awk '{{print $4}}' | grep -q ':{port}$'"
-    code, _ = _ssh(hp, cmd)
-    return code == 0
+        return f"ss -lun | awk '{{print $5}}' | grep -q ':{port}$'"
+    return f"ss -ltn | awk '{{print $4}}' | grep -q ':{port}$'"
 
-def _systemd_active(hp: str, unit: str) -> bool:
-    code, out = _ssh(hp, f"systemctl is-active {unit} || true")
-    return out.strip() == "active"
+def _systemd_active(unit: str) -> str:
+    return f"[ \"$(systemctl is-active {shlex.quote(unit)} 2>/dev/null)\" = active ]"
 
-def _docker_up(hp: str, name_substr: str) -> bool:
+def _docker_up(name_substr: str) -> str:
     # considers any container whose name contains the substring
-    cmd = (
+    return (
         "docker ps --format '{{.Names}} {{.Status}}' | "
         f"awk 'index($1, \"{name_substr}\")>0 {{print $2}}' | grep -qi '^Up'"
     )
-    code, _ = _ssh(hp, cmd)
-    return code == 0
+
+def _ok(ok: bool, good="✅ Open", bad="❌ Closed"):
+    return (good if ok else bad, "green" if ok else "red")
 
 # ---- Per-honeypot checks (same logic as your bash script) ----
+# name -> (probes, verdict over the probe results in the same order)
+CHECKS = {
+    "cowrie": (
+        [_pgrep("twistd.*cowrie"), _port(22), _port(23)],
+        lambda running, ssh_ok, tel_ok: _ok(running and (ssh_ok or tel_ok)),
+    ),
+    "honeypy": (
+        [_systemd_active("honeypy-mongo-logger"), _port(2244)],
+        lambda logger, ftp_ok: _ok(logger and ftp_ok),
+    ),
+    "honeytrap": (
+        # matches honeytrap, honeytrap_1, etc.; Honeytrap often binds one of these TCP ports
+        [_docker_up("honeytrap"), _port(21), _port(22), _port(23)],
+        lambda up, p21, p22, p23: _ok(up and (p21 or p22 or p23)),
+    ),
+    "conpot": (
+        [_pgrep("conpot"), _port(502), _port(47808, "udp"), _port(8800)],
+        lambda running, modbus, bacnet, http:
+            ("✅ Active", "green") if running and (modbus or bacnet or http) else ("❌ Down", "red"),
+    ),
+    "nodepot-lite": (
+        [_docker_up("nodepot"), _port(80)],
+        lambda up, http: _ok(up and http),
+    ),
+}
+
+UNREACHABLE = ("❌ Unreachable", "red")
+
+def _script(probes) -> str:
+    return "\n".join(f"if {cond}; then echo {i}=1; else echo {i}=0; fi" for i, cond in enumerate(probes)) + "\n"
+
+def _ssh_script(ip: str, port: int, user: str, pwd: str, script: str):
+    """Run `script` with sh on the host in one SSH session; returns (exit code, output)."""
+    ssh_cmd = [
+        "sshpass", "-e", "ssh", "-p", str(port),
+        "-o", "StrictHostKeyChecking=no",
+        "-o", "ConnectTimeout=5",
+        "-oHostKeyAlgorithms=+ssh-rsa",
+        "-oPubkeyAcceptedAlgorithms=+ssh-rsa",
+        f"{user}@{ip}", "sh -s",
+    ]
+    try:
+        out = subprocess.run(ssh_cmd, input=script, capture_output=True, text=True,
+                             timeout=SSH_TIMEOUT, env=dict(os.environ, SSHPASS=pwd))
+        return out.returncode, out.stdout
+    except Exception as e:
+        return 255, str(e)
+
+def _probe_host(target, names):
+    """All checks of the honeypots sharing one SSH target, in one script."""
+    probes, spans = [], {}
+    for name in names:
+        spans[name] = (len(probes), len(probes) + len(CHECKS[name][0]))
+        probes.extend(CHECKS[name][0])
+
+    code, out = _ssh_script(*target, _script(probes))
+    flags = {}
+    for line in out.splitlines():
+        key, sep, value = line.partition("=")
+        if sep and key.isdigit():
+            flags[int(key)] = value.strip() == "1"
+    if code == 255 or len(flags) < len(probes):
+        return {name: UNREACHABLE for name in names}
+    return {name: CHECKS[name][1](*(flags[i] for i in range(lo, hi))) for name, (lo, hi) in spans.items()}
+
+def check_all():
+    """{honeypot: (status, color)}, one concurrent SSH session per host."""
+    by_target = {}
+    results = {}
+    for name in CHECKS:
+        try:
+            by_target.setdefault(_load(name), []).append(name)
+        except Exception:
+            results[name] = ("⚠️ Not configured", "orange")
+    if by_target:
+        with ThreadPoolExecutor(max_workers=len(by_target)) as pool:
+            for host_results in pool.map(lambda item: _probe_host(*item), by_target.items()):
+                results.update(host_results)
+    return results
+
+# ---------- cache + background refresher ----------
+class HealthMonitor:
+    def __init__(self, refresh_seconds=HEALTH_REFRESH_SECONDS, ttl_seconds=HEALTH_TTL_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self.ttl_seconds = ttl_seconds
+        self.results = {}
+        self.checked_at = 0.0
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._thread = None
+
+    def refresh(self):
+        results = check_all()
+        with self._lock:
+            self.results, self.checked_at = results, time.monotonic()
+        return results
+
+    def _fresh(self):
+        with self._lock:
+            return bool(self.results) and time.monotonic() - self.checked_at < self.ttl_seconds
+
+    def get(self):
+        """Cached results; probes inline only on first use or when the refresher has stalled."""
+        if not self._fresh():
+            with self._refresh_lock:  # concurrent reruns wait for one probe round
+                if not self._fresh():
+                    self.refresh()
+        self.start()
+        with self._lock:
+            return self.results
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="remote-health", daemon=True)
+                self._thread.start()
+        return self
+
+    def _run(self):
+        while True:
+            time.sleep(self.refresh_seconds)
+            try:
+                with self._refresh_lock:
+                    self.refresh()
+            except Exception as e:
+                print(f"[!] Remote health refresh failed: {e}")
+
+monitor = HealthMonitor()
 
 def cowrie():
-    running = _pgrep("cowrie", "twistd.*cowrie")
-    ssh_ok  = _port("cowrie", 22, "tcp")
-    tel_ok  = _port("cowrie", 23, "tcp")
-    return _ok(running and (ssh_ok or tel_ok))
+    return monitor.get()["cowrie"]
 
 def honeypy():
-    logger = _systemd_active("honeypy", "honeypy-mongo-logger")
-    ftp_ok = _port("honeypy", 2244, "tcp")
-    return _ok(logger and ftp_ok)
+    return monitor.get()["honeypy"]
 
 def honeytrap():
-    up = _docker_up("honeytrap", "honeytrap")  # matches honeytrap, honeytrap_1, etc.
-    # Honeytrap often binds one of these TCP ports in your setup
-    p21  = _port("honeytrap", 21, "tcp")
-    p22  = _port("honeytrap", 22, "tcp")
-    p23  = _port("honeytrap", 23, "tcp")
-    any_tcp = p21 or p22 or p23
-    return _ok(up and any_tcp)
+    return monitor.get()["honeytrap"]
 
 def conpot():
-    running = _pgrep("conpot", "conpot")
-    modbus  = _port("conpot", 502, "tcp")
-    bacnet  = _port("conpot", 47808, "udp")
-    http    = _port("conpot", 8800, "tcp")
-    ok = running and (modbus or bacnet or http)
-    return ("✅ Active", "green") if ok else ("❌ Down", "red")
+    return monitor.get()["conpot"]
 
 def nodepot_lite():
-    up   = _docker_up("nodepot-lite", "nodepot")
-    http = _port("nodepot-lite", 80, "tcp")
-    return _ok(up and http)
+    return monitor.get()["nodepot-lite"]
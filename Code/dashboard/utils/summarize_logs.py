@@ -1,6 +1,5 @@
-def get_summary_metrics(df):
-    return {
-        "count": len(df),
-        "unique_ips": df["ip"].nunique(),
-        "tagged": df["tags"].apply(lambda x: len(x) > 0).sum()
-    }
\ No newline at end of file
+from db import get_log_metrics
+
+def get_summary_metrics(query=None):
+    # count / unique_ips / tagged, aggregated in MongoDB
+    return get_log_metrics(query)
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark for the normalization engine.
+
+Replays the recorded honeypot lines in Data/samples/normalizer_samples.jsonl
+(or --samples FILE, one {"collection": ..., "raw_log": ...} object per line)
+through Normalizer.normalize and reports lines/sec per source. No MongoDB needed.
+
+Samples may carry "expect_tags", "expect_ip", ... (any "expect_<field>" of
+the normalized record); --check verifies those before benchmarking
+and exits non-zero on a mismatch.
+
+    python3 Code/normalizer/bench_engine.py --lines 200000
+    python3 Code/normalizer/bench_engine.py --check --lines 0
+"""
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import argparse
+import json
+import time
+from collections import defaultdict
+
+from normalizer.engine import Normalizer, SOURCES
+
+DEFAULT_SAMPLES = os.path.abspath(os.path.join(
+    os.path.dirname(__file__), "..", "..", "Data", "samples", "normalizer_samples.jsonl"))
+
+
+def load_samples(path):
+    by_source = defaultdict(list)
+    with open(path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            doc = json.loads(line)
+            by_source[doc.pop("collection")].append(doc)
+    return by_source
+
+
+def _expected(doc):
+    return {k[len("expect_"):]: v for k, v in doc.items() if k.startswith("expect_")}
+
+
+def _raw(doc):
+    return {k: v for k, v in doc.items() if not k.startswith("expect_")}
+
+
+def check(samples):
+    """
+    Samples whose output differs from their "expect_<field>" keys (tags in any
+    order); returns (line, expected, got) triples.
+    """
+    engine = Normalizer()
+    failures = []
+    for collection, docs in samples.items():
+        for doc in docs:
+            expected = _expected(doc)
+            if not expected:
+                continue
+            rec = engine.normalize(collection, _raw(doc)) or {}
+            got = {field: rec.get(field) for field in expected}
+            if "tags" in expected:
+                got["tags"] = sorted(got["tags"] or [])
+                expected["tags"] = sorted(expected["tags"])
+            if got != expected:
+                failures.append((doc["raw_log"], expected, got))
+    return failures
+
+
+def bench(collection, docs, n_lines):
+    engine = Normalizer()
+    normalize = engine.normalize
+    reps = max(1, n_lines // len(docs))
+    start = time.perf_counter()
+    docs = [_raw(doc) for doc in docs]
+    for _ in range(reps):
+        for doc in docs:
+            normalize(collection, doc)
+    elapsed = time.perf_counter() - start
+    return reps * len(docs), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Normalizer engine microbenchmark")
+    parser.add_argument("--samples", default=DEFAULT_SAMPLES)
+    parser.add_argument("--lines", type=int, default=100000, help="lines per source (0 = skip the benchmark)")
+    parser.add_argument("--check", action="store_true", help="verify expect_<field> keys first")
+    args = parser.parse_args()
+
+    samples = load_samples(args.samples)
+    if args.check:
+        failures = check(samples)
+        for raw, expected, got in failures:
+            print(f"[!] {raw!r}: expected {expected}, got {got}")
+        if failures:
+            sys.exit(1)
+        print("✅ Samples match")
+    if args.lines <= 0:
+        return
+    total_lines, total_time = 0, 0.0
+    print(f"{'source':<14} {'lines':>9} {'seconds':>9} {'lines/sec':>12}")
+    for collection, docs in samples.items():
+        n, elapsed = bench(collection, docs, args.lines)
+        total_lines += n
+        total_time += elapsed
+        print(f"{SOURCES.get(collection, collection):<14} {n:>9} {elapsed:>9.3f} {n / elapsed:>12,.0f}")
+    if total_time:
+        print(f"{'all':<14} {total_lines:>9} {total_time:>9.3f} {total_lines / total_time:>12,.0f}")
+
+
+if __name__ == "__main__":
+    main()
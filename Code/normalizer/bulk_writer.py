@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Buffered writer for normalized_logs.
+
+Records are collected in memory and written with one unordered `insert_many`
+per batch instead of one `insert_one` round trip per log line. With
+`key_fields` set, the batch becomes one unordered `bulk_write` of upserts on
+those fields instead, so writing the same record twice is a no-op. A batch is
+flushed when it reaches `batch_size` or when its oldest record has waited
+`flush_interval` seconds (background thread), and always on `close()`.
+
+Backpressure: flushes run on the producer's thread while it holds the lock,
+so a slow database slows the producer down. If Mongo is unreachable the batch
+is kept and retried; once `max_pending` records are waiting, `add()` blocks
+until a flush succeeds. `close()` gives up after its timeout and drops what
+could not be written.
+
+Each record may carry an opaque `position` (e.g. a change-stream checkpoint).
+`on_flush(positions, session)` is invoked after the batch holding them is
+written, which lets callers commit their read position only for written data.
+With `atomic=True` on a replica set, the batch and the on_flush writes share
+one transaction (`session` is then non-None); elsewhere they run back to back
+and the `key_fields` upsert makes a replayed batch harmless.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from pymongo import ReplaceOne
+from pymongo.errors import BulkWriteError, PyMongoError
+
+DUPLICATE_KEY = 11000
+TRANSACTIONAL_TOPOLOGIES = {"ReplicaSetWithPrimary", "Sharded"}
+
+
+class BulkWriter:
+    def __init__(self, collection, batch_size: int = 500, flush_interval: float = 1.0,
+                 max_pending: int = 10000, retry_delay: float = 1.0,
+                 on_flush: Optional[Callable[[List[Any], Any], None]] = None,
+                 key_fields: Optional[Sequence[str]] = None, atomic: bool = False):
+        self.coll = collection
+        self.key_fields = tuple(key_fields) if key_fields else None
+        self.atomic = atomic
+        self._transactions: Optional[bool] = None
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.retry_delay = retry_delay
+        self.on_flush = on_flush
+
+        self._docs: List[Dict[str, Any]] = []
+        self._positions: List[Any] = []
+        self._oldest: Optional[float] = None
+        self._lock = threading.RLock()
+        self._closed = threading.Event()
+
+        self.inserted = 0
+        self.replaced = 0
+        self.duplicates = 0
+        self.failed = 0
+
+        self._timer = threading.Thread(target=self._flush_periodically, name="bulk-writer", daemon=True)
+        self._timer.start()
+
+    # ---------- producer API ----------
+    def add(self, doc: Dict[str, Any], position: Any = None) -> None:
+        with self._lock:
+            self._docs.append(doc)
+            self._track(position)
+            if len(self._docs) >= self.batch_size:
+                self.flush()
+            while len(self._docs) >= self.max_pending and not self._closed.is_set():
+                time.sleep(self.retry_delay)  # database down → stall the producer
+                self.flush()
+
+    def mark(self, position: Any) -> None:
+        """Record a read position that produced no document (skipped raw log)."""
+        with self._lock:
+            self._track(position)
+
+    def _track(self, position: Any) -> None:
+        if position is not None:
+            self._positions.append(position)
+        if self._oldest is None:
+            self._oldest = time.monotonic()
+
+    # ---------- flushing ----------
+    def flush(self) -> bool:
+        """Write the pending batch. Returns False if it must be retried."""
+        with self._lock:
+            if not self._docs and not self._positions:
+                self._oldest = None
+                return True
+
+            docs, positions = self._docs, self._positions
+            try:
+                if self._use_transactions():
+                    try:
+                        with self.coll.database.client.start_session() as session:
+                            session.with_transaction(lambda s: self._write_batch(docs, positions, s))
+                    except BulkWriteError:
+                        # A rejected record aborts the whole transaction; write the
+                        # batch non-atomically so the good records still land.
+                        self._write_batch(docs, positions, None)
+                else:
+                    self._write_batch(docs, positions, None)
+            except PyMongoError as e:
+                print(f"[!] Bulk write of {len(docs)} records failed, will retry: {e}")
+                return False
+
+            self._docs, self._positions, self._oldest = [], [], None
+            return True
+
+    def _use_transactions(self) -> bool:
+        if not self.atomic:
+            return False
+        if self._transactions is None:
+            client = self.coll.database.client
+            self._transactions = client.topology_description.topology_type_name in TRANSACTIONAL_TOPOLOGIES
+        return self._transactions
+
+    def _write_batch(self, docs, positions, session) -> None:
+        if docs:
+            try:
+                inserted, replaced = self._write(docs, session)
+                self.inserted += inserted
+                self.replaced += replaced
+            except BulkWriteError as e:
+                if session is not None:
+                    raise
+                self._account_bulk_error(e)
+        if self.on_flush and positions:
+            self.on_flush(positions, session)
+
+    def _write(self, docs: List[Dict[str, Any]], session=None):
+        if not self.key_fields:
+            self.coll.insert_many(docs, ordered=False, session=session)
+            return len(docs), 0
+        ops = [ReplaceOne({k: doc.get(k) for k in self.key_fields}, doc, upsert=True) for doc in docs]
+        result = self.coll.bulk_write(ops, ordered=False, session=session)
+        return result.upserted_count, result.matched_count
+
+    def _account_bulk_error(self, e: BulkWriteError) -> None:
+        errors = e.details.get("writeErrors", [])
+        dups = sum(1 for err in errors if err.get("code") == DUPLICATE_KEY)
+        self.duplicates += dups
+        self.failed += len(errors) - dups
+        self.inserted += e.details.get("nInserted", 0) + e.details.get("nUpserted", 0)
+        self.replaced += e.details.get("nMatched", 0)
+        if len(errors) > dups:
+            print(f"[!] {len(errors) - dups} records rejected by MongoDB: {errors[0].get('errmsg')}")
+
+    def _flush_periodically(self) -> None:
+        while not self._closed.wait(min(self.flush_interval, 0.25)):
+            oldest = self._oldest
+            if oldest is not None and time.monotonic() - oldest >= self.flush_interval:
+                if not self.flush():
+                    self._closed.wait(self.retry_delay)
+
+    # ---------- shutdown ----------
+    def close(self, timeout: float = 30.0) -> bool:
+        """
+        Flush what is pending, retrying for up to `timeout` seconds. Returns
+        False if MongoDB stayed unreachable; the records are then dropped and
+        their positions never reach on_flush, so a resumable reader re-reads them.
+        """
+        self._closed.set()
+        self._timer.join(timeout=5)
+        deadline = time.monotonic() + timeout
+        while not self.flush():
+            if time.monotonic() >= deadline:
+                with self._lock:
+                    print(f"[!] MongoDB unreachable for {timeout:g}s at shutdown; "
+                          f"dropping {len(self._docs)} unwritten records")
+                    self.failed += len(self._docs)
+                    self._docs, self._positions, self._oldest = [], [], None
+                return False
+            time.sleep(self.retry_delay)
+        return True
+
+    def __enter__(self) -> "BulkWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -1,12 +1,15 @@
 #!/usr/bin/env python3
 
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 import time
-from pymongo import MongoClient
 from bson.objectid import ObjectId
 
+from common.mongo import get_db
+
 # Connect to MongoDB
-client = MongoClient("mongodb://localhost:27017/")
-db = client["adapttrap"]
+db = get_db()
 normalized = db["normalized_logs"]
 
 print("📡 Watching normalized_logs in real-time...\n")
@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+"""
+Normalization engine shared by the backfill (normalized_logs.py) and the live
+loop (normalizer_loop.py).
+
+All patterns are compiled once at import time. Tagging is a single pass of one
+combined, case-insensitive alternation over the raw line; the rules are then
+evaluated against the set of keywords that matched. IP/port extraction tries
+the pattern that fits the source first and guards every regex with a cheap
+substring check, so the common Cowrie/HoneyPy/Conpot lines hit exactly one
+regex.
+
+    engine = Normalizer()
+    rec = engine.normalize("cowrie_logs", raw_doc)   # dict or None (skip)
+"""
+from __future__ import annotations
+
+import ipaddress
+import re
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from normalizer.scan_tracker import PortScanTracker
+
+# Honeypot VM IPs (kept but tagged as internal_honeypot for filtering)
+HONEYPOT_IPS = frozenset({
+    "192.168.186.136",  # cowrie
+    "192.168.186.137",  # honeypy / nodepot-lite
+    "192.168.186.138",  # honeytrap
+    "192.168.186.139",  # conpot
+})
+LOCAL_BINDS = frozenset({"0.0.0.0", "127.0.0.1"})
+NOT_ATTACKER = HONEYPOT_IPS | LOCAL_BINDS
+
+# raw collection → source tag
+SOURCES = {
+    "cowrie_logs": "cowrie",
+    "honeypy_logs": "honeypy",
+    "honeytrap_logs": "honeytrap",
+    "conpot_logs": "conpot",
+    "nodepot_logs": "nodepot-lite",
+}
+
+COLLECTIONS = {tag: coll for coll, tag in SOURCES.items()}
+
+# (raw collection, raw _id) identifies a normalized record; writers upsert on it
+# so replays and re-runs never duplicate rows.
+IDEMPOTENCY_KEY = ("raw_collection", "raw_id")
+
+
+# ---------- compiled patterns ----------
+_IPV4 = r"\d{1,3}(?:\.\d{1,3}){3}"
+RE_COWRIE_CONN = re.compile(r"New connection:\s+([\d\.]+):(\d+)\s+\(([\d\.]+):(\d+)\)")
+RE_FROM_IP_PORT = re.compile(r"FTP connection from\s+([\d\.]+):(\d+)")
+RE_TUPLE = re.compile(r"\('(" + _IPV4 + r")'\s*,\s*(\d+)\)")
+RE_IP_PORT = re.compile(r"\b(" + _IPV4 + r"):(\d+)\b")
+RE_IP = re.compile(r"(" + _IPV4 + r")")
+RE_PORT_WORD = re.compile(r"port\s+(\d+)", re.IGNORECASE)
+
+# Every keyword the tag and protocol rules look at. They are matched in a
+# single pass over the lower-cased line by one alternation grouped by first
+# character (a one-level trie), which lets the regex engine skip positions
+# that cannot start a keyword. The alternation sits in a lookahead, so matches
+# may overlap: "failed login attempt" yields both "failed login" and
+# "login attempt", and "libssh" also yields "ssh", as plain substring checks would.
+TAG_KEYWORDS = (
+    "nmap", "masscan", "libssh",
+    "failed login", "authentication failed",
+    "login attempt", "user root",
+    "multipart/form-data", "file saved", "upload",
+    "union select", " or 1=1", "select", "--",
+    "../", "/etc/passwd",
+)
+WORD_KEYWORDS = ("netcat", "nc")  # only as whole words
+PROTOCOL_KEYWORDS = ("ssh", "http", "ftp", "modbus", "bacnet", "telnet")
+
+
+def _first_char_trie(keywords, whole_words=()):
+    groups: Dict[str, list] = {}
+    for k in (*keywords, *whole_words):
+        groups.setdefault(k[0], []).append(k)
+    parts = []
+    for first, words in groups.items():
+        alts = []
+        for w in sorted(words, key=len, reverse=True):
+            rest = re.escape(w[1:])
+            if w in whole_words:
+                rest = r"(?<!\w" + re.escape(first) + ")" + rest + r"(?!\w)"
+            alts.append(rest)
+        parts.append(re.escape(first) + "(?:" + "|".join(alts) + ")")
+    return re.compile("(?=(" + "|".join(parts) + "))")
+
+
+RE_KEYWORDS = _first_char_trie(TAG_KEYWORDS + PROTOCOL_KEYWORDS, WORD_KEYWORDS)
+
+_CONPOT_NOISE = re.compile(
+    r"server started on|serving tcp/ip|responding to external done/disable signal",
+    re.IGNORECASE,
+)
+_SUSPICIOUS_URI = re.compile(r"admin|upload|shell|config|\.php|\.asp|\.jspx|\.aspx")
+
+PROTOCOL_PORTS = (
+    ("ssh", frozenset({22, 2222})),
+    ("http", frozenset({80, 8080, 8800, 9999})),
+    ("ftp", frozenset({21, 2244})),
+    ("modbus", frozenset({502, 5020})),
+    ("bacnet", frozenset({47808})),
+    ("telnet", frozenset({23})),
+)
+
+
+# ---------- helpers ----------
+def ipv4_mapped_to_ipv4(ip: str) -> str:
+    if isinstance(ip, str) and ip.startswith("::ffff:"):
+        cand = ip[7:]
+        if is_valid_ip(cand):
+            return cand
+    return ip
+
+
+@lru_cache(maxsize=65536)
+def _valid_ip(ip: str) -> bool:
+    try:
+        ipaddress.ip_address(ip)
+        return True
+    except ValueError:
+        return False
+
+
+def is_valid_ip(ip: str) -> bool:
+    if not isinstance(ip, str):
+        return False
+    if ip.startswith("::ffff:"):
+        ip = ip[7:]
+    return _valid_ip(ip)
+
+
+def _attacker(ip: str) -> bool:
+    return ip not in NOT_ATTACKER and is_valid_ip(ip)
+
+
+def _to_port(port) -> Any:
+    if isinstance(port, int):
+        return port
+    if isinstance(port, str) and port.isdigit():
+        return int(port)
+    return "unknown"
+
+
+def _cowrie_conn(text: str) -> Optional[Tuple[str, int]]:
+    if "New connection" not in text:
+        return None
+    m = RE_COWRIE_CONN.search(text)
+    if m:
+        a, ap, b, bp = m.groups()
+        if _attacker(a):
+            return a, int(ap)
+        if _attacker(b):
+            return b, int(bp)
+    return None
+
+
+def _from_conn(text: str) -> Optional[Tuple[str, int]]:
+    if "FTP connection from" not in text:
+        return None
+    m = RE_FROM_IP_PORT.search(text)
+    if m and _attacker(m.group(1)):
+        return m.group(1), int(m.group(2))
+    return None
+
+
+def _tuple_addr(text: str) -> Optional[Tuple[str, int]]:
+    if "('" not in text:
+        return None
+    m = RE_TUPLE.search(text)
+    if m and _attacker(m.group(1)):
+        return m.group(1), int(m.group(2))
+    return None
+
+
+def _generic(text: str) -> Optional[Tuple[str, int]]:
+    # only the first "A.B.C.D:p" counts, as before
+    if ":" not in text:
+        return None
+    m = RE_IP_PORT.search(text)
+    if m and _attacker(m.group(1)):
+        return m.group(1), int(m.group(2))
+    return None
+
+
+# Same order and first-match rules as the original parser; the substring
+# guards in each extractor skip the regex on lines that can't match.
+_EXTRACTORS = (_cowrie_conn, _from_conn, _tuple_addr, _generic)
+
+
+def parse_any_ip_port(text: str) -> Tuple[str, Optional[int]]:
+    """
+    Best-effort attacker IP/port extraction from free-form logs.
+
+    Handles:
+      - Cowrie: "New connection: A.B.C.D:p (X.Y.Z.W:q)"
+      - HoneyPy: "FTP connection from A.B.C.D:p"
+      - Tuple-style: "('A.B.C.D', p)" or "from ('A.B.C.D', p)"
+      - Generic: "A.B.C.D:p"
+      - Bracketed: "[..., A.B.C.D]" + "port N"
+    """
+    if not text:
+        return "unknown", None
+
+    for extract in _EXTRACTORS:
+        hit = extract(text)
+        if hit:
+            return hit
+
+    m = RE_IP.search(text)
+    if m and _attacker(m.group(1)):
+        m_po = RE_PORT_WORD.search(text)
+        return m.group(1), int(m_po.group(1)) if m_po else None
+
+    return "unknown", None
+
+
+def keyword_hits(text: str) -> frozenset:
+    """All tag/protocol keywords present in `text` (one regex pass)."""
+    return frozenset(RE_KEYWORDS.findall(text.lower())) if text else frozenset()
+
+
+def detect_protocol(text: str, port: Optional[int], hits: Optional[Iterable[str]] = None) -> str:
+    h = keyword_hits(text) if hits is None else hits
+    for proto, ports in PROTOCOL_PORTS:
+        if proto in h or port in ports:
+            return proto
+    return "unknown"
+
+
+def tag_rules(text: str, hits: Optional[Iterable[str]] = None) -> list[str]:
+    h = keyword_hits(text) if hits is None else hits
+    tags = []
+    if "nmap" in h or "masscan" in h:
+        tags.append("nmap")
+    if "netcat" in h or "nc" in h:
+        tags.append("netcat")
+    if "libssh" in h:
+        tags.append("libssh")
+    if "failed login" in h or "authentication failed" in h:
+        tags.append("ssh_brute")
+    if "login attempt" in h or "user root" in h:
+        tags.append("login_attempt")
+    if "upload" in h or "multipart/form-data" in h or "file saved" in h:
+        tags.append("upload")
+    if ("select" in h and "--" in h) or "union select" in h or " or 1=1" in h:
+        tags.append("sqli")
+    if "../" in h or "/etc/passwd" in h:
+        tags.append("dir_traversal")
+    return tags
+
+
+# ---------- engine ----------
+class Normalizer:
+    """Per-process normalizer; owns the port-scan state."""
+
+    def __init__(self, scan_tracker: Optional[PortScanTracker] = None):
+        self.scans = scan_tracker or PortScanTracker()
+        self._dispatch = {
+            "cowrie": self.normalize_generic,
+            "honeypy": self.normalize_honeypy,
+            "honeytrap": self.normalize_honeytrap,
+            "conpot": self.normalize_conpot,
+            "nodepot-lite": self.normalize_nodepot,
+        }
+
+    def normalize(self, source: str, doc: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Normalize one raw document. `source` is a collection name or source tag."""
+        src = SOURCES.get(source, source)
+        rec = self._dispatch.get(src, self.normalize_generic)(doc, src)
+        if rec is not None and "_id" in doc:
+            rec["raw_collection"] = COLLECTIONS.get(src, source)
+            rec["raw_id"] = doc["_id"]
+        return rec
+
+    def finalize_record(self, ts, src, ip, port, proto, raw, extra_tags=None, hits=None):
+        tags = tag_rules(raw, hits)
+        if ip != "unknown":
+            # as before: judged on the ports seen so far, then this one is recorded
+            if self.scans.is_scanning(ip, ts):
+                tags.append("port_scan")
+            if isinstance(port, int):
+                self.scans.observe(ip, port, ts)
+        if extra_tags:
+            tags.extend([t for t in extra_tags if t not in tags])
+        # Tag internal honeypot traffic (kept visible)
+        if ip in HONEYPOT_IPS:
+            tags.append("internal_honeypot")
+        return {
+            "timestamp": ts,
+            "source": src,
+            "ip": ip,
+            "port": port if port is not None else "unknown",
+            "protocol": proto,
+            "raw_log": raw,
+            "tags": tags,
+        }
+
+    # ---------- per-source ----------
+    def normalize_generic(self, doc: Dict[str, Any], src: str = "cowrie") -> Dict[str, Any]:
+        raw = str(doc.get("raw_log", ""))
+        ts = doc.get("timestamp") or datetime.now(timezone.utc)
+        hits = keyword_hits(raw)
+        ip, port = parse_any_ip_port(raw)
+        proto = detect_protocol(raw, port, hits)
+        return self.finalize_record(ts, src, ip if is_valid_ip(ip) else "unknown",
+                                    port if port is not None else "unknown", proto, raw, hits=hits)
+
+    def normalize_nodepot(self, doc: Dict[str, Any], src: str = "nodepot-lite") -> Dict[str, Any]:
+        raw = doc.get("raw_log") or ""
+        uri = (doc.get("uri") or "").lower()
+        event_type = (doc.get("event_type") or "").lower()
+        ts = doc.get("timestamp") or datetime.now(timezone.utc)
+
+        ip_struct = ipv4_mapped_to_ipv4(doc.get("ip", "unknown"))
+        if is_valid_ip(ip_struct):
+            ip = ip_struct
+        else:
+            ip_parsed, _ = parse_any_ip_port(raw)
+            ip = ip_parsed if is_valid_ip(ip_parsed) else "unknown"
+
+        hits = keyword_hits(raw)
+        extra = []
+        if "upload" in event_type or "upload" in uri or "multipart/form-data" in hits:
+            extra.append("upload")
+        if "login" in event_type or "login attempt" in hits:
+            extra.append("login_attempt")
+        if _SUSPICIOUS_URI.search(uri):
+            extra.append("suspicious_uri")
+
+        text = raw if raw else f"{event_type} {uri}"
+        return self.finalize_record(ts, src, ip, 80, "http", text, extra,
+                                    hits=hits if raw else None)
+
+    def normalize_honeypy(self, doc: Dict[str, Any], src: str = "honeypy") -> Dict[str, Any]:
+        ip = ipv4_mapped_to_ipv4(doc.get("src_ip") or doc.get("ip") or "unknown")
+        port = doc.get("src_port") or doc.get("port")
+        raw = doc.get("raw_log") or doc.get("message") or ""
+        ts = doc.get("timestamp") or datetime.now(timezone.utc)
+
+        if not _attacker(ip):
+            ip, port = parse_any_ip_port(raw)
+
+        hits = keyword_hits(raw)
+        port = _to_port(port)
+        proto = "ftp" if port in {21, 2244} or "ftp" in hits else detect_protocol(raw, port, hits)
+        return self.finalize_record(ts, src, ip if is_valid_ip(ip) else "unknown", port, proto, raw,
+                                    ["ftp_connection"] if proto == "ftp" else None, hits=hits)
+
+    def normalize_honeytrap(self, doc: Dict[str, Any], src: str = "honeytrap") -> Optional[Dict[str, Any]]:
+        raw = doc.get("raw_log") or doc.get("message") or ""
+        # skip heartbeats
+        if "heartbeat" in raw.lower():
+            return None
+
+        ip = ipv4_mapped_to_ipv4(doc.get("src_ip") or doc.get("remote_host") or doc.get("ip") or "unknown")
+        port = doc.get("src_port") or doc.get("remote_port") or doc.get("port")
+        ts = doc.get("timestamp") or datetime.now(timezone.utc)
+
+        if not _attacker(ip):
+            ip, port = parse_any_ip_port(raw)
+
+        hits = keyword_hits(raw)
+        port = _to_port(port)
+        return self.finalize_record(ts, src, ip if is_valid_ip(ip) else "unknown", port,
+                                    detect_protocol(raw, port, hits), raw, hits=hits)
+
+    def normalize_conpot(self, doc: Dict[str, Any], src: str = "conpot") -> Dict[str, Any]:
+        raw = str(doc.get("raw_log", ""))
+        ts = doc.get("timestamp") or datetime.now(timezone.utc)
+
+        hits = keyword_hits(raw)
+
+        # Treat obvious startup/noise as non-attacker → still record, but IP stays unknown
+        if _CONPOT_NOISE.search(raw):
+            return self.finalize_record(ts, src, "unknown", "unknown",
+                                        detect_protocol(raw, None, hits), raw, hits=hits)
+
+        ip, port = parse_any_ip_port(raw)
+        return self.finalize_record(ts, src, ip, port, detect_protocol(raw, port, hits), raw, hits=hits)
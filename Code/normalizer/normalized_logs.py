@@ -1,281 +1,213 @@
 #!/usr/bin/env python3
+"""
+Historical (backfill) normalization of the raw honeypot collections.
+
+Every raw collection is split into `_id` ranges which are normalized by a
+process pool; each worker has its own MongoClient and bulk-upserts its output.
+Records are keyed on (raw_collection, raw_id), so re-running after a rule
+change rewrites rows in place instead of duplicating them — no wipe needed.
+
+    python3 Code/normalizer/normalized_logs.py                      # everything
+    python3 Code/normalizer/normalized_logs.py --since 2025-07-01 --until 2025-08-01
+    python3 Code/normalizer/normalized_logs.py --workers 8 --sources cowrie_logs
+
+--since/--until select raw documents by `_id` creation time (the forwarders
+stamp `timestamp` at insert, so the two agree).
+
+Rewritten rows keep their `_id`, so the rollups' incremental refresh would
+never see them; the backfill recomputes the rollup buckets spanned by the
+rows it touched (before and after) when it is done, unless --no-rollups.
+"""
 from __future__ import annotations
 
-import re, ipaddress
+import os, sys
+import argparse
+import time
 from datetime import datetime, timezone
-from collections import defaultdict
-from typing import Any, Dict, Optional, Tuple
-from pymongo import MongoClient
-
-client = MongoClient("mongodb://localhost:27017/")
-db = client["adapttrap"]
-normalized = db["normalized_logs"]
-
-# ------------------------------------------------------------------
-# SAFETY: do NOT wipe by default. Set to True only if you intend to rebuild.
-# ------------------------------------------------------------------
-SAFE_CLEAR = False
-if SAFE_CLEAR:
-    print("[!] Clearing existing normalized_logs (SAFE_CLEAR=True)")
-    normalized.delete_many({})
-
-# Honeypot VM IPs (kept but tagged as internal_honeypot for filtering)
-HONEYPOT_IPS = {
-    "192.168.186.136",
-    "192.168.186.137",
-    "192.168.186.138",
-    "192.168.186.139",
-}
-LOCAL_BINDS = {"0.0.0.0", "127.0.0.1"}
-
-sources = {
-    "cowrie_logs": "cowrie",
-    "honeypy_logs": "honeypy",
-    "honeytrap_logs": "honeytrap",
-    "conpot_logs": "conpot",
-    "nodepot_logs": "nodepot-lite",
-}
-
-ip_to_ports = defaultdict(set)
-
-# ---------- helpers ----------
-def ipv4_mapped_to_ipv4(ip: str) -> str:
-    if isinstance(ip, str) and ip.startswith("::ffff:"):
-        cand = ip.split("::ffff:")[-1]
-        try:
-            ipaddress.ip_address(cand)
-            return cand
-        except ValueError:
-            pass
-    return ip
-
-def is_valid_ip(ip: str) -> bool:
-    if not isinstance(ip, str):
-        return False
-    ip = ipv4_mapped_to_ipv4(ip)
-    try:
-        ipaddress.ip_address(ip)
-        return True
-    except ValueError:
-        return False
-
-def parse_any_ip_port(text: str) -> Tuple[str, Optional[int]]:
-    """
-    Best-effort attacker IP/port extraction from free-form logs.
-
-    Handles:
-      - Cowrie: "New connection: A.B.C.D:p (X.Y.Z.W:q)"
-      - HoneyPy: "FTP connection from A.B.C.D:p"
-      - Generic: "A.B.C.D:p"
-      - Tuple-style: "('A.B.C.D', p)" or "from ('A.B.C.D', p)"
-      - Bracketed: "[..., A.B.C.D]" + "port N"
-    """
-    text = text or ""
-
-    # 1) Cowrie style
-    m = re.search(r"New connection:\s+([\d\.]+):(\d+)\s+\(([\d\.]+):(\d+)\)", text)
-    if m:
-        a, ap, b, bp = m.groups()
-        a, b = ipv4_mapped_to_ipv4(a), ipv4_mapped_to_ipv4(b)
-        if a not in HONEYPOT_IPS | LOCAL_BINDS and is_valid_ip(a):
-            return a, int(ap)
-        if b not in HONEYPOT_IPS | LOCAL_BINDS and is_valid_ip(b):
-            return b, int(bp)
-
-    # 2) HoneyPy FTP line
-    m = re.search(r"FTP connection from\s+([\d\.]+):(\d+)", text)
-    if m:
-        ip, p = m.groups()
-        ip = ipv4_mapped_to_ipv4(ip)
-        if ip not in HONEYPOT_IPS | LOCAL_BINDS and is_valid_ip(ip):
-            return ip, int(p)
-
-    # 3) Tuple style "('A.B.C.D', 12345)" (Conpot & generic Python logs)
-    m = re.search(r"\('(\d{1,3}(?:\.\d{1,3}){3})'\s*,\s*(\d+)\)", text)
-    if m:
-        ip, p = m.groups()
-        ip = ipv4_mapped_to_ipv4(ip)
-        if ip not in HONEYPOT_IPS | LOCAL_BINDS and is_valid_ip(ip):
-            return ip, int(p)
-
-    # 4) Generic "A.B.C.D:PORT"
-    m = re.search(r"\b(\d{1,3}(?:\.\d{1,3}){3}):(\d+)\b", text)
-    if m:
-        ip, p = m.groups()
-        ip = ipv4_mapped_to_ipv4(ip)
-        if ip not in HONEYPOT_IPS | LOCAL_BINDS and is_valid_ip(ip):
-            return ip, int(p)
-
-    # 5) Standalone IP + "port N"
-    m_ip = re.search(r"(\d{1,3}(?:\.\d{1,3}){3})", text)
-    m_po = re.search(r"port\s+(\d+)", text.lower())
-    if m_ip:
-        ip = ipv4_mapped_to_ipv4(m_ip.group(1))
-        if ip not in HONEYPOT_IPS | LOCAL_BINDS and is_valid_ip(ip):
-            return ip, int(m_po.group(1)) if m_po else None
-
-    return "unknown", None
-
-def detect_protocol(text: str, port: Optional[int]) -> str:
-    t = (text or "").lower()
-    if "ssh" in t or port in {22, 2222}:
-        return "ssh"
-    if "http" in t or port in {80, 8080, 8800, 9999}:
-        return "http"
-    if "ftp" in t or port in {21, 2244}:
-        return "ftp"
-    if "modbus" in t or port in {502, 5020}:
-        return "modbus"
-    if "bacnet" in t or port in {47808}:
-        return "bacnet"
-    if port == 23 or "telnet" in t:
-        return "telnet"
-    return "unknown"
-
-def tag_rules(text: str, ip: str) -> list[str]:
-    tags = []
-    t = (text or "").lower()
-    if any(k in t for k in ("nmap", "masscan")):
-        tags.append("nmap")
-    if re.search(r"\b(netcat|nc)\b", t):
-        tags.append("netcat")
-    if "libssh" in t:
-        tags.append("libssh")
-    if "failed login" in t or "authentication failed" in t:
-        tags.append("ssh_brute")
-    if "login attempt" in t or "user root" in t:
-        tags.append("login_attempt")
-    if "upload" in t or "multipart/form-data" in t or "file saved" in t:
-        tags.append("upload")
-    if ("select" in t and "--" in t) or "union select" in t or " or 1=1" in t:
-        tags.append("sqli")
-    if "../" in t or "/etc/passwd" in t:
-        tags.append("dir_traversal")
-    if ip != "unknown" and len(ip_to_ports[ip]) > 10:
-        tags.append("port_scan")
-    return tags
-
-# ---------- per-source ----------
-def finalize_record(ts, src, ip, port, proto, raw, extra_tags=None):
-    tags = tag_rules(raw, ip)
-    if extra_tags:
-        tags.extend([t for t in extra_tags if t not in tags])
-    # Tag internal honeypot traffic (kept visible)
-    if ip in HONEYPOT_IPS:
-        tags.append("internal_honeypot")
-    rec = {
-        "timestamp": ts,
-        "source": src,
-        "ip": ip,
-        "port": port if port is not None else "unknown",
-        "protocol": proto,
-        "raw_log": raw,
-        "tags": tags,
-    }
-    return rec
-
-def normalize_nodepot(doc: Dict[str, Any]) -> Dict[str, Any]:
-    raw = doc.get("raw_log") or ""
-    uri = (doc.get("uri") or "").lower()
-    event_type = (doc.get("event_type") or "").lower()
-    ts = doc.get("timestamp") or datetime.now(timezone.utc)
-
-    ip_struct = ipv4_mapped_to_ipv4(doc.get("ip", "unknown"))
-    ip_parsed, _ = parse_any_ip_port(raw)
-
-    if is_valid_ip(ip_struct):
-        ip = ip_struct
-    elif is_valid_ip(ip_parsed):
-        ip = ip_parsed
-    else:
-        ip = "unknown"
-
-    extra = []
-    if "upload" in event_type or "upload" in uri or "multipart/form-data" in raw.lower():
-        extra.append("upload")
-    if "login" in event_type or "login attempt" in raw.lower():
-        extra.append("login_attempt")
-    if any(k in uri for k in ("admin", "upload", "shell", "config", ".php", ".asp", ".jspx", ".aspx")):
-        extra.append("suspicious_uri")
-
-    return finalize_record(ts, "nodepot-lite", ip, 80, "http", raw if raw else f"{event_type} {uri}", extra)
-
-def normalize_honeypy(doc: Dict[str, Any]) -> Dict[str, Any]:
-    ip = ipv4_mapped_to_ipv4(doc.get("src_ip") or doc.get("ip") or "unknown")
-    port = doc.get("src_port") or doc.get("port")
-    raw = doc.get("raw_log") or doc.get("message") or ""
-    ts = doc.get("timestamp") or datetime.now(timezone.utc)
-
-    if (not is_valid_ip(ip)) or ip in HONEYPOT_IPS | LOCAL_BINDS:
-        ip, port = parse_any_ip_port(raw)
-
-    proto = "ftp" if (port in {21, 2244}) or ("ftp" in (raw or "").lower()) else detect_protocol(raw, port)
-    return finalize_record(ts, "honeypy",
-                           ip if is_valid_ip(ip) else "unknown",
-                           int(port) if isinstance(port, (int,)) or (isinstance(port, str) and port.isdigit()) else "unknown",
-                           proto, raw, ["ftp_connection"] if proto == "ftp" else None)
-
-def normalize_honeytrap(doc: Dict[str, Any]) -> Dict[str, Any]:
-    ip = ipv4_mapped_to_ipv4(doc.get("src_ip") or doc.get("remote_host") or doc.get("ip") or "unknown")
-    port = doc.get("src_port") or doc.get("remote_port") or doc.get("port")
-    raw = doc.get("raw_log") or doc.get("message") or ""
-    ts = doc.get("timestamp") or datetime.now(timezone.utc)
-
-    # skip heartbeats on backfill too
-    if "heartbeat" in (raw or "").lower():
-        return None
+from multiprocessing import Pool
+from typing import Optional
 
-    if (not is_valid_ip(ip)) or ip in HONEYPOT_IPS | LOCAL_BINDS:
-        ip, port = parse_any_ip_port(raw)
+from bson.objectid import ObjectId
+from pymongo import ASCENDING
 
-    proto = detect_protocol(raw, port)
-    return finalize_record(ts, "honeytrap",
-                           ip if is_valid_ip(ip) else "unknown",
-                           int(port) if isinstance(port, (int,)) or (isinstance(port, str) and port.isdigit()) else "unknown",
-                           proto, raw, None)
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from common.indexes import ensure_indexes
+from common.mongo import get_db, settings
+from normalizer import rollups
+from normalizer.bulk_writer import BulkWriter
+from normalizer.engine import IDEMPOTENCY_KEY, Normalizer, SOURCES
+from normalizer.scan_tracker import PortScanTracker
 
-def normalize_conpot(doc: Dict[str, Any]) -> Dict[str, Any]:
-    raw = str(doc.get("raw_log", ""))
-    ts = doc.get("timestamp") or datetime.now(timezone.utc)
+# ---------- worker side ----------
+_worker_db = None
 
-    # Treat obvious startup/noise as non-attacker → still record, but IP stays unknown
-    if any(k in raw.lower() for k in (
-        "server started on", "serving tcp/ip", "responding to external done/disable signal"
-    )):
-        return finalize_record(ts, "conpot", "unknown", "unknown", detect_protocol(raw, None), raw, None)
 
-    ip, port = parse_any_ip_port(raw)
-    proto = detect_protocol(raw, port)
-    return finalize_record(ts, "conpot", ip, port, proto, raw, None)
+def _init_worker(mongo_uri: str) -> None:
+    # get_db keys clients by pid, so each worker builds its own after fork.
+    global _worker_db
+    _worker_db = get_db(uri=mongo_uri)
 
-# ---------- main run ----------
-inserted = 0
-for coll_name, src in sources.items():
-    for doc in db[coll_name].find({}):
-        if src == "nodepot-lite":
-            norm = normalize_nodepot(doc)
-        elif src == "honeypy":
-            norm = normalize_honeypy(doc)
-        elif src == "honeytrap":
-            norm = normalize_honeytrap(doc)
+
+def backfill_range(task) -> tuple:
+    """Normalize raw docs of one collection with lo <= _id < hi (hi inclusive for the last range)."""
+    coll_name, lo, hi, last, batch_size, scan_ports, scan_window = task
+    db = _worker_db
+    id_filter = {"$gte": lo, "$lte" if last else "$lt": hi}
+
+    engine = Normalizer(PortScanTracker(scan_ports, scan_window))
+    normalized = 0
+    writer = BulkWriter(db["normalized_logs"], batch_size=batch_size, flush_interval=5.0,
+                        key_fields=IDEMPOTENCY_KEY)
+    try:
+        for doc in db[coll_name].find({"_id": id_filter}).sort("_id", 1):
+            norm = engine.normalize(coll_name, doc)
             if norm is None:  # heartbeat skip
                 continue
-        elif src == "conpot":
-            norm = normalize_conpot(doc)
-        else:
-            raw = str(doc.get("raw_log", ""))
-            ts = doc.get("timestamp") or datetime.now(timezone.utc)
-            ip, port = parse_any_ip_port(raw)
-            if ip != "unknown" and isinstance(port, int):
-                ip_to_ports[ip].add(port)
-            proto = detect_protocol(raw, port)
-            norm = finalize_record(ts, src, ip if is_valid_ip(ip) else "unknown",
-                                   port if port is not None else "unknown",
-                                   proto, raw, None)
-
-        normalized.insert_one(norm)
-        inserted += 1
-        if inserted % 1000 == 0:
-            print(f"[+] Backfilled {inserted} records...")
-
-print(f"\n✅ Historical normalization complete. Inserted: {inserted}")
+            writer.add(norm)
+            normalized += 1
+    finally:
+        writer.close()
+    return coll_name, normalized, writer.inserted, writer.replaced
+
+
+# ---------- planning ----------
+def parse_when(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    dt = datetime.fromisoformat(value)
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+def id_bounds(coll, since: Optional[datetime], until: Optional[datetime]):
+    """Smallest and largest raw `_id` inside the window, or None if empty."""
+    id_filter = {}
+    if since:
+        id_filter["$gte"] = ObjectId.from_datetime(since)
+    if until:
+        id_filter["$lt"] = ObjectId.from_datetime(until)
+    query = {"_id": id_filter} if id_filter else {}
+    first = coll.find_one(query, {"_id": 1}, sort=[("_id", ASCENDING)])
+    if first is None:
+        return None
+    last = coll.find_one(query, {"_id": 1}, sort=[("_id", -1)])
+    return first["_id"], last["_id"]
+
+
+def split_range(lo: ObjectId, hi: ObjectId, parts: int):
+    """Split [lo, hi] into `parts` contiguous ranges by ObjectId timestamp."""
+    t0, t1 = lo.generation_time.timestamp(), hi.generation_time.timestamp()
+    step = (t1 - t0) / parts
+    cuts = [lo]
+    for i in range(1, parts):
+        cut = ObjectId.from_datetime(datetime.fromtimestamp(t0 + i * step, tz=timezone.utc))
+        if cut > cuts[-1]:
+            cuts.append(cut)
+    ranges = [(a, b, False) for a, b in zip(cuts, cuts[1:])]
+    ranges.append((cuts[-1], hi, True))
+    return ranges
+
+
+def log_span(db, collections, since, until):
+    """Earliest and latest `timestamp` of the normalized rows of these raw documents, or None."""
+    match = {"raw_collection": {"$in": list(collections)}, "timestamp": {"$type": "date"}}
+    raw_id = {}
+    if since:
+        raw_id["$gte"] = ObjectId.from_datetime(since)
+    if until:
+        raw_id["$lt"] = ObjectId.from_datetime(until)
+    if raw_id:
+        match["raw_id"] = raw_id
+    row = next(db["normalized_logs"].aggregate([
+        {"$match": match},
+        {"$group": {"_id": None, "first": {"$min": "$timestamp"}, "last": {"$max": "$timestamp"}}},
+    ], allowDiskUse=True), None)
+    return (row["first"], row["last"]) if row and row["first"] is not None else None
+
+
+def plan_tasks(db, collections, since, until, chunks: int, *task_args):
+    tasks = []
+    for coll_name in collections:
+        bounds = id_bounds(db[coll_name], since, until)
+        if bounds is None:
+            print(f"[=] {coll_name}: nothing in window")
+            continue
+        for lo, hi, last in split_range(*bounds, chunks):
+            tasks.append((coll_name, lo, hi, last, *task_args))
+    return tasks
+
+
+# ---------- main run ----------
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Backfill normalized_logs from the raw honeypot collections")
+    parser.add_argument("--since", help="ISO date/datetime (UTC if no offset), inclusive")
+    parser.add_argument("--until", help="ISO date/datetime (UTC if no offset), exclusive")
+    parser.add_argument("--sources", nargs="+", choices=list(SOURCES), default=list(SOURCES),
+                        help="raw collections to backfill (default: all)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunks", type=int, default=0,
+                        help="_id ranges per collection (default: 4 x workers)")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--scan-ports", type=int, default=10,
+                        help="tag port_scan once more than this many distinct ports came from one IP ...")
+    parser.add_argument("--scan-window", type=float, default=300,
+                        help="... within this many seconds (log time)")
+    parser.add_argument("--drop-unkeyed", action="store_true",
+                        help="one-time migration: delete normalized rows of these sources that predate raw_id keys")
+    parser.add_argument("--no-rollups", action="store_true",
+                        help="don't recompute the rollup buckets the backfill touched")
+    parser.add_argument("--mongo-uri", default=settings()["mongo_uri"])
+    args = parser.parse_args()
+
+    since, until = parse_when(args.since), parse_when(args.until)
+    db = get_db(uri=args.mongo_uri)
+    normalized = db["normalized_logs"]
+    # Partial: legacy rows written before the key existed have no raw_id.
+    ensure_indexes(db, ["normalized_logs"])
+
+    if args.drop_unkeyed:
+        tags = [SOURCES[c] for c in args.sources]
+        res = normalized.delete_many({"raw_id": {"$exists": False}, "source": {"$in": tags}})
+        print(f"[!] Removed {res.deleted_count} legacy normalized rows without raw_id")
+
+    # rows may move to other buckets when rewritten: remember where they were
+    spans = [] if args.no_rollups else [log_span(db, args.sources, since, until)]
+
+    tasks = plan_tasks(db, args.sources, since, until, args.chunks or 4 * args.workers,
+                       args.batch_size, args.scan_ports, args.scan_window)
+    print(f"[*] {len(tasks)} ranges across {len(args.sources)} collections, {args.workers} workers")
+
+    started = time.time()
+    totals = {"normalized": 0, "inserted": 0, "replaced": 0}
+    if args.workers <= 1:
+        _init_worker(args.mongo_uri)
+        results = map(backfill_range, tasks)
+        pool = None
+    else:
+        pool = Pool(args.workers, initializer=_init_worker, initargs=(args.mongo_uri,))
+        results = pool.imap_unordered(backfill_range, tasks)
+
+    try:
+        for done, (coll_name, n, ins, rep) in enumerate(results, 1):
+            totals["normalized"] += n
+            totals["inserted"] += ins
+            totals["replaced"] += rep
+            print(f"[+] {done}/{len(tasks)} {coll_name}: {n} normalized "
+                  f"(total {totals['normalized']}, {totals['normalized'] / max(time.time() - started, 1e-6):.0f}/s)")
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    print(f"\n✅ Historical normalization complete. Normalized: {totals['normalized']}, "
+          f"new: {totals['inserted']}, rewritten: {totals['replaced']} in {time.time() - started:.1f}s")
+
+    if not args.no_rollups:
+        spans = [s for s in spans + [log_span(db, args.sources, since, until)] if s]
+        if spans:
+            first, last = min(s[0] for s in spans), max(s[1] for s in spans)
+            rollups.refresh_range(db, first, last)
+            print(f"[+] Rollups recomputed for {first:%Y-%m-%d %H:%M} – {last:%Y-%m-%d %H:%M}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,111 +1,47 @@
 #normalizer_loop.py
 #!/usr/bin/env python3
 
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import argparse
 import time
-from datetime import datetime, timezone
-import re
-import ipaddress
-from collections import defaultdict
-from pymongo import MongoClient
-from bson.objectid import ObjectId
+
+from common.indexes import ensure_indexes
+from common.mongo import get_db
+from normalizer.bulk_writer import BulkWriter
+from normalizer.checkpoints import CheckpointStore
+from normalizer.engine import IDEMPOTENCY_KEY, Normalizer, SOURCES
+from normalizer.rollups import RollupRefresher
+from normalizer.scan_tracker import PortScanTracker
+from normalizer.stream import SourceStream
 
 # === MongoDB Setup ===
-client = MongoClient("mongodb://localhost:27017/")
-db = client["adapttrap"]
+db = get_db()
 normalized = db["normalized_logs"]
 
-# === Honeypot IPs to ignore ===
-HONEYPOT_IPS = {
-    "192.168.186.135",  # adapttrapmain
-    "192.168.186.136",  # cowrie
-    "192.168.186.137",  # honeypy
-    "192.168.186.138",  # honeytrap
-    "192.168.186.139",  # conpot
-}
-
-# === Honeypot source collections ===
-sources = {
-    "cowrie_logs": "cowrie",
-    "honeypy_logs": "honeypy",
-    "honeytrap_logs": "honeytrap",
-    "conpot_logs": "conpot",
-    "nodepot_logs": "nodepot-lite"
-}
-
 # === State tracking ===
-last_ids = {}
-ip_to_ports = defaultdict(set)
-print("🔁 Real-time normalization started... Press Ctrl+C to stop.\n")
+checkpoints = CheckpointStore(db)
+engine = Normalizer()
 
-# === Utility Functions ===
-def is_valid_ip(ip_str):
-    try:
-        ipaddress.ip_address(ip_str)
-        return True
-    except ValueError:
-        return False
-
-def extract_ip_port(log_str):
-    match = re.search(r'New connection: ([\d.]+):(\d+) \(([\d.]+):(\d+)\)', log_str)
-    if match:
-        src_ip, src_port, dst_ip, dst_port = match.groups()
-        if src_ip not in HONEYPOT_IPS and is_valid_ip(src_ip):
-            return src_ip, int(src_port)
-        elif dst_ip not in HONEYPOT_IPS and is_valid_ip(dst_ip):
-            return dst_ip, int(dst_port)
-
-    for m in re.finditer(r'([\d.]+):(\d+)', log_str):
-        ip, port = m.groups()
-        if ip not in HONEYPOT_IPS and is_valid_ip(ip):
-            return ip, int(port)
-
-    match_ip = re.search(r'\[.*?,\d+,([\d.]+)\]', log_str)
-    match_port = re.search(r'port (\d+)', log_str.lower())
-    ip = match_ip.group(1) if match_ip and is_valid_ip(match_ip.group(1)) else "unknown"
-    port = int(match_port.group(1)) if match_port else "unknown"
-    return ip, port
-
-def detect_protocol(log_str, port=None):
-    l = log_str.lower()
-    if "ssh" in l or port == 22 or port == 2222:
-        return "ssh"
-    elif "http" in l or port in [80, 8080, 8808, 9999]:
-        return "http"
-    elif "ftp" in l or port == 21 or port == 2244:
-        return "ftp"
-    elif "modbus" in l or port in [502, 5020]:
-        return "modbus"
-    elif port == 2223:
-        return "telnet"
-    return "unknown"
-
-def generate_tags(log_str, ip):
-    tags = []
-    l = log_str.lower()
-    if "nmap" in l or "masscan" in l:
-        tags.append("nmap")
-    if "netcat" in l or "nc" in l:
-        tags.append("netcat")
-    if "libssh" in l:
-        tags.append("libssh")
-    if "failed login" in l or "authentication failed" in l:
-        tags.append("ssh_brute")
-    if "user root" in l or "login attempt" in l:
-        tags.append("login_attempt")
-    if "upload" in l or "file saved" in l:
-        tags.append("upload")
-    if "sqli" in l or "select" in l and "--" in l:
-        tags.append("sqli")
-    if "../" in l or "etc/passwd" in l:
-        tags.append("dir_traversal")
-    if ip != "unknown" and len(ip_to_ports[ip]) > 10:
-        tags.append("port_scan")
-    return tags
-
-# === Main Loop ===
-try:
+def process_log(log, collection_name, writer, position=None):
+    record = engine.normalize(collection_name, log)
+
+    # heartbeats and lines with neither an IP nor a port are not worth keeping
+    if record is None or (record["ip"] == "unknown" and record["port"] == "unknown"):
+        writer.mark(position)
+        return
+
+    writer.add(record, position)
+    print(f"[+] Normalized: {record['source']} | {record['ip']}:{record['port']} | "
+          f"{record['protocol']} | Tags: {record['tags']}")
+
+# === Ingest modes ===
+def run_polling(writer, poll_interval=3):
+    # Resume from the persisted checkpoints instead of re-reading everything.
+    last_ids = checkpoints.last_ids(SOURCES)
     while True:
-        for collection_name, source_tag in sources.items():
+        for collection_name in SOURCES:
             collection = db[collection_name]
             query = {}
             if last_ids.get(collection_name):
@@ -114,33 +50,71 @@ try:
             cursor = collection.find(query).sort("_id", 1)
             for log in cursor:
                 last_ids[collection_name] = log["_id"]
-
-                raw_log = str(log.get("raw_log", ""))
-                timestamp = log.get("timestamp", datetime.now(timezone.utc))
-                ip, port = extract_ip_port(raw_log)
-
-                if ip == "unknown" and port == "unknown":
-                    continue
-
-                protocol = detect_protocol(raw_log, port)
-                tags = generate_tags(raw_log, ip)
-
-                if ip != "unknown" and isinstance(port, int):
-                    ip_to_ports[ip].add(port)
-
-                normalized.insert_one({
-                    "timestamp": timestamp,
-                    "source": source_tag,
-                    "ip": ip,
-                    "port": port,
-                    "protocol": protocol,
-                    "raw_log": raw_log,
-                    "tags": tags
-                })
-
-                print(f"[+] Normalized: {source_tag} | {ip}:{port} | {protocol} | Tags: {tags}")
-
-        time.sleep(3)  # Poll interval
-
-except KeyboardInterrupt:
-    print("\n👋 Stopping normalizer loop. Goodbye.")
+                process_log(log, collection_name, writer, (collection_name, {"last_id": log["_id"]}))
+
+        time.sleep(poll_interval)  # Poll interval
+
+def run_streaming(writer, stream):
+    # Change streams (tailable/poll fallback on standalone mongod). Positions
+    # ride along with the buffered records and are committed by the writer's
+    # on_flush hook, i.e. only once the batch holding them is in Mongo.
+    for collection_name, log, position in stream:
+        process_log(log, collection_name, writer, (collection_name, position))
+
+def commit_positions(positions, session=None):
+    # Called by the writer right after a batch is written (same transaction
+    # on a replica set): advance each collection to its newest position.
+    latest = {}
+    for collection_name, position in positions:
+        latest[collection_name] = position
+    for collection_name, position in latest.items():
+        checkpoints.save(collection_name, session=session, **position)
+
+# === Main ===
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Real-time honeypot log normalizer")
+    parser.add_argument("--mode", choices=["stream", "poll"],
+                        default=os.getenv("NORMALIZER_MODE", "stream"),
+                        help="stream = change streams with resume tokens (default), poll = legacy 3s polling")
+    parser.add_argument("--poll-interval", type=float, default=3,
+                        help="seconds between polls (poll mode / standalone fallback)")
+    parser.add_argument("--batch-size", type=int, default=500,
+                        help="flush normalized_logs after this many records")
+    parser.add_argument("--flush-interval", type=float, default=0.5,
+                        help="flush a partial batch after this many seconds")
+    parser.add_argument("--scan-ports", type=int, default=10,
+                        help="tag port_scan once more than this many distinct ports came from one IP ...")
+    parser.add_argument("--scan-window", type=float, default=300,
+                        help="... within this many seconds")
+    parser.add_argument("--rollup-interval", type=float, default=float(os.getenv("ROLLUP_INTERVAL", "10")),
+                        help="refresh the minute/hour/day rollups every N seconds (0 = off)")
+    args = parser.parse_args()
+
+    engine = Normalizer(PortScanTracker(args.scan_ports, args.scan_window))
+
+    # (raw_collection, raw_id) is unique, so a batch replayed after a crash
+    # upserts onto itself instead of duplicating rows.
+    ensure_indexes(db, ["normalized_logs"])
+
+    stream = None
+    if args.mode == "stream":
+        stream = SourceStream(db, list(SOURCES), poll_interval=args.poll_interval, checkpoints=checkpoints)
+    writer = BulkWriter(normalized, batch_size=args.batch_size, flush_interval=args.flush_interval,
+                        on_flush=commit_positions, key_fields=IDEMPOTENCY_KEY, atomic=True)
+    rollups = RollupRefresher(db, args.rollup_interval).start() if args.rollup_interval > 0 else None
+
+    print(f"🔁 Real-time normalization started ({args.mode} mode)... Press Ctrl+C to stop.\n")
+    try:
+        if stream is not None:
+            run_streaming(writer, stream.start())
+        else:
+            run_polling(writer, args.poll_interval)
+    except KeyboardInterrupt:
+        print("\n👋 Stopping normalizer loop. Goodbye.")
+    finally:
+        if stream is not None:
+            stream.stop()
+        writer.close()
+        if rollups is not None:
+            rollups.stop()
+        print(f"[=] Flushed. Inserted: {writer.inserted}, already present: {writer.replaced + writer.duplicates}")
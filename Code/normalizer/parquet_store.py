@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+Columnar archive of normalized_logs for offline analysis.
+
+`export` streams normalized_logs in `_id` order into Parquet files partitioned
+by UTC day and source (hive layout), all with one fixed schema:
+
+    Data/parquet/normalized_logs/day=2025-07-14/source=cowrie/part-<first _id>.parquet
+
+    _id           string               ObjectId hex
+    timestamp     timestamp[ms, UTC]   null if unparsable
+    protocol      dictionary<string>
+    ip            string
+    port          int32                PORT_NULL (-1) when missing / not a port number
+    tags          list<string>
+    raw_collection, raw_log  string
+
+(`day` and `source` come from the directory names.) Runs are incremental:
+the last exported `_id` is kept in `_state.json`, and each batch is written
+under a name derived from its first `_id`, so a run interrupted before the
+state was saved rewrites the same files on the next run. ObjectIds come from
+the writers' clocks, so a log can commit after a larger `_id` was exported;
+each run re-reads PARQUET_ID_LAG_SECONDS below the last `_id` and skips the
+ids the state lists as already exported from that window. `compact` merges
+the small files that frequent runs leave behind (dropping any duplicate
+`_id`).
+
+    python3 Code/normalizer/parquet_store.py export              # append what's new
+    python3 Code/normalizer/parquet_store.py compact --day 2025-07-14
+    python3 Code/normalizer/parquet_store.py sql "SELECT source, count(*) FROM logs GROUP BY 1"
+
+Reading: `read_logs()` (pyarrow, prunes partitions by day/source),
+`partition_counts()` (row counts from Parquet footers only) and `sql()`
+(DuckDB over a `logs` view, if duckdb is installed).
+"""
+from __future__ import annotations
+
+import os
+import sys
+import argparse
+import glob
+import json
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+PARQUET_ROOT = os.getenv("PARQUET_ROOT", os.path.abspath(os.path.join(
+    os.path.dirname(__file__), "..", "..", "Data", "parquet", "normalized_logs")))
+STATE_FILE = "_state.json"
+ID_LAG_SECONDS = int(os.getenv("PARQUET_ID_LAG_SECONDS", "300"))
+PORT_NULL = -1
+UNKNOWN_DAY = "unknown"
+
+SCHEMA = pa.schema([
+    ("_id", pa.string()),
+    ("timestamp", pa.timestamp("ms", tz="UTC")),
+    ("protocol", pa.dictionary(pa.int16(), pa.string())),
+    ("ip", pa.string()),
+    ("port", pa.int32()),
+    ("tags", pa.list_(pa.string())),
+    ("raw_collection", pa.string()),
+    ("raw_log", pa.string()),
+])
+PARTITION_SCHEMA = pa.schema([("day", pa.string()), ("source", pa.string())])
+PARTITIONING = ds.partitioning(PARTITION_SCHEMA, flavor="hive")
+
+
+# ---------- schema ----------
+def _missing(value: Any) -> bool:
+    return value is None or (isinstance(value, float) and value != value)
+
+
+def _port(value: Any) -> int:
+    try:
+        port = int(value)
+    except (TypeError, ValueError, OverflowError):  # OverflowError: inf
+        return PORT_NULL
+    # anything else would wrap in the int32 column
+    return port if 0 <= port <= 65535 else PORT_NULL
+
+
+def _tags(value: Any) -> List[str]:
+    if isinstance(value, (list, tuple)):
+        return [str(t) for t in value]
+    return [] if _missing(value) or value == "" else [str(value)]
+
+
+def _text(value: Any) -> Optional[str]:
+    if _missing(value):
+        return None
+    if isinstance(value, str):
+        return value
+    return json.dumps(value, default=str) if isinstance(value, (dict, list)) else str(value)
+
+
+def conform(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Coerce a frame of normalized logs to the archive's column types: string
+    `_id`, UTC timestamps, categorical source/protocol, int port with
+    PORT_NULL, list tags. Columns the frame lacks are left out. Also what
+    st.dataframe needs to convert a Mongo result to Arrow without errors.
+    """
+    df = df.copy()
+    if "_id" in df:
+        df["_id"] = df["_id"].astype(str)
+    if "timestamp" in df:
+        df["timestamp"] = pd.to_datetime(df["timestamp"], errors="coerce", utc=True, format="mixed")
+    for col in ("source", "protocol"):
+        if col in df:
+            df[col] = df[col].fillna("unknown").astype(str).astype("category")
+    if "port" in df:
+        df["port"] = df["port"].map(_port).astype("int32")
+    if "tags" in df:
+        df["tags"] = df["tags"].map(_tags)
+    for col in ("ip", "raw_collection", "raw_log"):
+        if col in df:
+            df[col] = df[col].map(_text)
+    return df
+
+
+# ---------- export ----------
+def _load_state(root: str) -> Dict[str, Any]:
+    path = os.path.join(root, STATE_FILE)
+    if not os.path.isfile(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def _save_state(root: str, state: Dict[str, Any]) -> None:
+    path = os.path.join(root, STATE_FILE)
+    with open(path + ".tmp", "w") as f:
+        json.dump(state, f)
+    os.replace(path + ".tmp", path)
+
+
+def _partition_dir(root: str, day: str, source: str) -> str:
+    return os.path.join(root, f"day={day}", f"source={source}")
+
+
+def _write_batch(root: str, docs: List[Dict[str, Any]]) -> int:
+    df = conform(pd.DataFrame(docs).reindex(columns=SCHEMA.names + ["source"]))
+    df["day"] = df["timestamp"].dt.strftime("%Y-%m-%d").fillna(UNKNOWN_DAY)
+    name = f"part-{df['_id'].iloc[0]}.parquet"
+    for (day, source), part in df.groupby(["day", "source"], observed=True, sort=False):
+        out_dir = _partition_dir(root, day, source)
+        os.makedirs(out_dir, exist_ok=True)
+        table = pa.Table.from_pandas(part[SCHEMA.names], schema=SCHEMA, preserve_index=False)
+        pq.write_table(table, os.path.join(out_dir, name + ".tmp"), compression="zstd")
+        os.replace(os.path.join(out_dir, name + ".tmp"), os.path.join(out_dir, name))
+    return len(df)
+
+
+def export(db, root: str = PARQUET_ROOT, batch_size: int = 100_000) -> int:
+    """Append normalized_logs newer than the last export; returns the rows written."""
+    from bson import ObjectId
+
+    def lag_floor(last_id: str) -> str:
+        return str(ObjectId.from_datetime(ObjectId(last_id).generation_time - timedelta(seconds=ID_LAG_SECONDS)))
+
+    os.makedirs(root, exist_ok=True)
+    state = _load_state(root)
+    query: Dict[str, Any] = {}
+    recent = set(state.get("recent_ids", []))
+    if state.get("last_id"):
+        # ids inside the lag window were either exported (in `recent`) or committed late
+        query["_id"] = {"$gt": ObjectId(lag_floor(state["last_id"]))}
+    projection = {name: 1 for name in SCHEMA.names + ["source"]}
+
+    def save(batch: List[Dict[str, Any]]) -> None:
+        nonlocal recent
+        last_id = max(str(batch[-1]["_id"]), state.get("last_id", ""))
+        floor = lag_floor(last_id)
+        recent = {i for i in recent.union(str(d["_id"]) for d in batch) if i > floor}
+        state.update(last_id=last_id, recent_ids=sorted(recent), updated_at=datetime.now(timezone.utc).isoformat())
+        _save_state(root, state)
+
+    written = 0
+    batch: List[Dict[str, Any]] = []
+    cursor = db["normalized_logs"].find(query, projection, batch_size=5000).sort("_id", 1)
+    for doc in cursor:
+        if str(doc["_id"]) in recent:
+            continue
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            written += _write_batch(root, batch)
+            save(batch)
+            print(f"[+] Exported {written} rows (up to {batch[-1]['_id']})")
+            batch = []
+    if batch:
+        written += _write_batch(root, batch)
+        save(batch)
+    return written
+
+
+def compact(root: str = PARQUET_ROOT, day: Optional[str] = None) -> int:
+    """Merge each partition's files into one; returns the number of partitions rewritten."""
+    # Only batches recorded in the state: an unrecorded one is rewritten under
+    # its own name by the next export and must still be there to be replaced.
+    last_id = _load_state(root).get("last_id", "")
+    merged = 0
+    for part_dir in sorted(glob.glob(os.path.join(root, f"day={day or '*'}", "source=*"))):
+        files = sorted(f for f in glob.glob(os.path.join(part_dir, "part-*.parquet"))
+                       if os.path.basename(f)[5:-8] <= last_id)
+        if len(files) < 2:
+            continue
+        table = pa.concat_tables([pq.read_table(f, schema=SCHEMA) for f in files]).sort_by("_id")
+        # a crashed export can leave a row in two batch files
+        ids = table.column("_id").to_numpy(zero_copy_only=False)
+        table = table.filter(pa.array(np.r_[True, ids[1:] != ids[:-1]]))
+        # named after the first file: a later export batch always sorts after it
+        target = files[0]
+        pq.write_table(table, target + ".tmp", compression="zstd")
+        os.replace(target + ".tmp", target)
+        for f in files[1:]:
+            os.remove(f)
+        merged += 1
+    return merged
+
+
+# ---------- reading ----------
+def dataset(root: str = PARQUET_ROOT) -> ds.Dataset:
+    schema = pa.unify_schemas([SCHEMA, PARTITION_SCHEMA])
+    return ds.dataset(root, format="parquet", schema=schema, partitioning=PARTITIONING,
+                      ignore_prefixes=["_", "."])
+
+
+def _day(value) -> Optional[str]:
+    if value is None:
+        return None
+    return value if isinstance(value, str) else value.strftime("%Y-%m-%d")
+
+
+def read_logs(root: str = PARQUET_ROOT, since=None, until=None, sources: Optional[Iterable[str]] = None,
+              columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Logs from the archive as a DataFrame. `since`/`until` (dates, datetimes or
+    YYYY-MM-DD, inclusive) and `sources` only open the matching partitions.
+    """
+    expr = None
+    conditions = []
+    if since is not None:
+        conditions.append(ds.field("day") >= _day(since))
+    if until is not None:
+        conditions.append(ds.field("day") <= _day(until))
+    if sources:
+        conditions.append(ds.field("source").isin(list(sources)))
+    for cond in conditions:
+        expr = cond if expr is None else expr & cond
+    df = dataset(root).to_table(columns=columns, filter=expr).to_pandas()
+    if "source" in df:
+        df["source"] = df["source"].astype("category")
+    return df
+
+
+def partition_counts(root: str = PARQUET_ROOT) -> pd.DataFrame:
+    """Rows per (day, source), read from the Parquet footers without scanning any data."""
+    rows: Dict[tuple, int] = {}
+    for path in glob.glob(os.path.join(root, "day=*", "source=*", "part-*.parquet")):
+        source_dir = os.path.dirname(path)
+        key = (os.path.basename(os.path.dirname(source_dir))[4:], os.path.basename(source_dir)[7:])
+        rows[key] = rows.get(key, 0) + pq.ParquetFile(path).metadata.num_rows
+    return pd.DataFrame([(day, source, n) for (day, source), n in sorted(rows.items())],
+                        columns=["day", "source", "rows"])
+
+
+def sql(query: str, root: str = PARQUET_ROOT) -> pd.DataFrame:
+    """Run `query` in DuckDB against a `logs` view over the archive."""
+    try:
+        import duckdb
+    except ImportError:
+        raise ImportError("sql() needs duckdb (pip install duckdb); read_logs() works with pyarrow alone")
+    con = duckdb.connect()
+    pattern = os.path.join(root, "day=*", "source=*", "*.parquet").replace("'", "''")
+    con.execute(f"CREATE VIEW logs AS SELECT * FROM read_parquet('{pattern}', hive_partitioning = true)")
+    try:
+        return con.execute(query).df()
+    finally:
+        con.close()
+
+
+# ---------- CLI ----------
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Export normalized_logs to partitioned Parquet / query it")
+    parser.add_argument("action", choices=["export", "compact", "counts", "sql"])
+    parser.add_argument("query", nargs="?", help="SQL for `sql` (table: logs)")
+    parser.add_argument("--root", default=PARQUET_ROOT)
+    parser.add_argument("--batch-size", type=int, default=100_000, help="rows per export batch / file")
+    parser.add_argument("--day", help="compact only this day (YYYY-MM-DD)")
+    args = parser.parse_args()
+
+    if args.action == "export":
+        from common.mongo import get_db
+        print(f"✅ Exported {export(get_db(), args.root, args.batch_size)} normalized logs to {args.root}")
+    elif args.action == "compact":
+        print(f"✅ Compacted {compact(args.root, args.day)} partitions")
+    elif args.action == "counts":
+        print(partition_counts(args.root).to_string(index=False))
+    else:
+        if not args.query:
+            parser.error("sql needs a query")
+        print(sql(args.query, args.root).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+Pre-aggregated counters over normalized_logs.
+
+rollup_minute / rollup_hour / rollup_day hold one document per
+(bucket, dimension, key):
+
+    {_id: {t, dim, key}, t: <bucket start, UTC>, dim: "ip", key: "203.0.113.7", count: 42}
+
+Dimensions: total (key "all"), tagged (logs with at least one tag, key
+"all"), source, protocol, port, ip, tag.
+
+`refresh()` is incremental. It finds the minutes touched by logs inserted
+since the last run (normalized_logs `_id` watermark in
+normalizer_checkpoints, re-read ROLLUP_ID_LAG_SECONDS back for ids that
+committed late), recomputes exactly those minute buckets from the raw logs,
+then the touched hours from rollup_minute and the touched days from
+rollup_hour. Every bucket range is cleared and recomputed whole (written
+with `$merge`), so a rerun, a replayed normalizer batch, a late log or a
+re-tagged one never double counts. Minute buckets expire after ROLLUP_MINUTE_TTL_DAYS (see
+common/indexes.py); hours that old are recomputed from the raw logs.
+Logs rewritten in place keep their `_id`, so the backfill calls
+`refresh_range()` over the time span it rewrote.
+
+    python3 Code/normalizer/rollups.py refresh               # catch up once
+    python3 Code/normalizer/rollups.py rebuild               # drop and recompute everything
+    python3 Code/normalizer/rollups.py top --dim ip --days 7 # read back
+
+normalizer_loop.py runs a RollupRefresher next to the writer, so the
+rollups trail the raw logs by at most --rollup-interval seconds.
+"""
+from __future__ import annotations
+
+import os
+import sys
+import argparse
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from common.indexes import ROLLUP_MINUTE_TTL_DAYS, ensure_indexes
+from normalizer.checkpoints import CheckpointStore
+
+GRAINS = {"minute": 60_000, "hour": 3_600_000, "day": 86_400_000}  # bucket size, ms
+ROLLUP_COLLECTIONS = {grain: f"rollup_{grain}" for grain in GRAINS}
+DIMENSIONS = ["total", "tagged", "source", "protocol", "port", "ip", "tag"]
+CHECKPOINT_NAME = "rollups"
+ROLLUP_ID_LAG_SECONDS = int(os.getenv("ROLLUP_ID_LAG_SECONDS", "300"))
+
+
+# ---------- pipeline pieces ----------
+def _bucket(field: str, ms: int) -> Dict[str, Any]:
+    millis = {"$toLong": field}
+    return {"$toDate": {"$subtract": [millis, {"$mod": [millis, ms]}]}}
+
+
+def _key(field: str) -> Dict[str, Any]:
+    return {"$toString": {"$ifNull": [field, "unknown"]}}
+
+
+def _merge_into(coll_name: str) -> List[Dict[str, Any]]:
+    return [
+        {"$project": {"t": "$_id.t", "dim": "$_id.dim", "key": "$_id.key", "count": 1}},
+        {"$merge": {"into": coll_name, "on": "_id", "whenMatched": "replace", "whenNotMatched": "insert"}},
+    ]
+
+
+def _from_logs(grain: str, start: datetime, end: datetime) -> List[Dict[str, Any]]:
+    """normalized_logs in [start, end) → rollup_<grain>."""
+    pairs = {"$concatArrays": [
+        [
+            {"dim": "total", "key": "all"},
+            {"dim": "source", "key": _key("$source")},
+            {"dim": "protocol", "key": _key("$protocol")},
+            {"dim": "port", "key": _key("$port")},
+            {"dim": "ip", "key": _key("$ip")},
+        ],
+        {"$cond": [{"$gt": [{"$size": {"$ifNull": ["$tags", []]}}, 0]}, [{"dim": "tagged", "key": "all"}], []]},
+        {"$map": {"input": {"$ifNull": ["$tags", []]}, "as": "tag", "in": {"dim": "tag", "key": _key("$$tag")}}},
+    ]}
+    return [
+        {"$match": {"timestamp": {"$gte": start, "$lt": end}}},
+        {"$project": {"_id": 0, "t": _bucket("$timestamp", GRAINS[grain]), "pairs": pairs}},
+        {"$unwind": "$pairs"},
+        {"$group": {"_id": {"t": "$t", "dim": "$pairs.dim", "key": "$pairs.key"}, "count": {"$sum": 1}}},
+    ] + _merge_into(ROLLUP_COLLECTIONS[grain])
+
+
+def _coarser_from_finer(grain: str, start: datetime, end: datetime) -> List[Dict[str, Any]]:
+    """rollup_<finer> in [start, end) → rollup_<grain>."""
+    return [
+        {"$match": {"t": {"$gte": start, "$lt": end}}},
+        {"$group": {"_id": {"t": _bucket("$t", GRAINS[grain]), "dim": "$dim", "key": "$key"},
+                    "count": {"$sum": "$count"}}},
+    ] + _merge_into(ROLLUP_COLLECTIONS[grain])
+
+
+def _floor(t: datetime, grain: str) -> datetime:
+    ms = GRAINS[grain]
+    epoch = int(_utc(t).timestamp() * 1000)
+    return datetime.fromtimestamp((epoch - epoch % ms) / 1000, tz=timezone.utc)
+
+
+def _ceil(t: datetime, grain: str) -> datetime:
+    floor = _floor(t, grain)
+    return floor if floor == _utc(t) else floor + timedelta(milliseconds=GRAINS[grain])
+
+
+def _utc(t: datetime) -> datetime:
+    # Mongo hands back naive UTC datetimes
+    return t if t.tzinfo else t.replace(tzinfo=timezone.utc)
+
+
+def _ranges(buckets, grain: str, max_gap: int = 60) -> List[Tuple[datetime, datetime]]:
+    """
+    Bucket starts → [start, end) ranges to recompute. Buckets up to `max_gap`
+    steps apart share a range: recomputing the quiet buckets between them is
+    cheap, one aggregate per stray minute during a rebuild is not.
+    """
+    step = timedelta(milliseconds=GRAINS[grain])
+    ranges: List[Tuple[datetime, datetime]] = []
+    for t in sorted(buckets):
+        if ranges and t - ranges[-1][1] <= step * max_gap:
+            ranges[-1] = (ranges[-1][0], t + step)
+        else:
+            ranges.append((t, t + step))
+    return ranges
+
+
+def _cover(ranges, grain: str) -> List[Tuple[datetime, datetime]]:
+    """Sorted [start, end) ranges rounded out to whole `grain` buckets and merged."""
+    out: List[Tuple[datetime, datetime]] = []
+    for start, end in sorted(ranges):
+        start, end = _floor(start, grain), _ceil(end, grain)
+        if out and start <= out[-1][1]:
+            out[-1] = (out[-1][0], max(out[-1][1], end))
+        else:
+            out.append((start, end))
+    return out
+
+
+def _split(ranges, at: datetime):
+    """(parts before `at`, parts from `at` on)."""
+    before, after = [], []
+    for start, end in ranges:
+        if start < at:
+            before.append((start, min(end, at)))
+        if end > at:
+            after.append((max(start, at), end))
+    return before, after
+
+
+# ---------- maintenance ----------
+def _rewrite(db, grain: str, start: datetime, end: datetime, source: str, pipeline) -> None:
+    """
+    Replace rollup_<grain> in [start, end) with `pipeline`'s output. `$merge`
+    alone only upserts the keys still present, so a key whose last log was
+    re-tagged, moved or deleted would keep its old count.
+    """
+    db[ROLLUP_COLLECTIONS[grain]].delete_many({"dim": {"$in": DIMENSIONS}, "t": {"$gte": start, "$lt": end}})
+    db[source].aggregate(pipeline, allowDiskUse=True)
+
+
+def recompute(db, minute_ranges, now: Optional[datetime] = None) -> None:
+    """
+    Rebuild every minute, hour and day bucket overlapping `minute_ranges`.
+    Minute buckets are only rewritten while the TTL index would keep them.
+    Hours whose minutes may already have expired are counted from
+    normalized_logs instead, so a late or backfilled log never shrinks an
+    old hour to the few minutes that are left.
+    """
+    now = now or datetime.now(timezone.utc)
+    minute_ranges = _cover(minute_ranges, "minute")
+    _, kept_minutes = _split(minute_ranges, now - timedelta(days=ROLLUP_MINUTE_TTL_DAYS))
+    for start, end in kept_minutes:
+        _rewrite(db, "minute", start, end, "normalized_logs", _from_logs("minute", start, end))
+
+    hours = _cover(minute_ranges, "hour")
+    # a day of slack before the TTL, so no hour is summed while its minutes are expiring
+    old_hours, recent_hours = _split(hours, _floor(now - timedelta(days=ROLLUP_MINUTE_TTL_DAYS - 1), "hour"))
+    for start, end in old_hours:
+        _rewrite(db, "hour", start, end, "normalized_logs", _from_logs("hour", start, end))
+    for start, end in recent_hours:
+        _rewrite(db, "hour", start, end, ROLLUP_COLLECTIONS["minute"], _coarser_from_finer("hour", start, end))
+
+    for start, end in _cover(hours, "day"):
+        _rewrite(db, "day", start, end, ROLLUP_COLLECTIONS["hour"], _coarser_from_finer("day", start, end))
+
+
+def refresh_range(db, start: datetime, end: datetime) -> None:
+    """Recompute all buckets between `start` and `end` (e.g. after a backfill rewrote logs in place)."""
+    recompute(db, [(_utc(start), _utc(end))])
+
+
+def refresh(db, checkpoints: Optional[CheckpointStore] = None) -> int:
+    """Recompute the buckets touched since the last run; returns the number of minute buckets."""
+    from bson import ObjectId
+
+    checkpoints = checkpoints or CheckpointStore(db)
+    logs = db["normalized_logs"]
+    last_id = checkpoints.load(CHECKPOINT_NAME).get("last_id")
+    newest = logs.find_one({}, {"_id": 1}, sort=[("_id", -1)])
+    if newest is None or newest["_id"] == last_id:
+        return 0
+    id_range: Dict[str, Any] = {"$lte": newest["_id"]}
+    if last_id is not None:
+        # ObjectIds carry the writer's clock, so a log committed late (another
+        # backfill worker, a slow batch) can sort below ids already seen. Re-read
+        # ROLLUP_ID_LAG_SECONDS below the watermark; buckets are recomputed whole,
+        # so touching one twice costs time, not correctness.
+        id_range["$gt"] = ObjectId.from_datetime(last_id.generation_time - timedelta(seconds=ROLLUP_ID_LAG_SECONDS))
+
+    touched = [_utc(d["_id"]) for d in logs.aggregate([
+        {"$match": {"_id": id_range, "timestamp": {"$type": "date"}}},
+        {"$group": {"_id": _bucket("$timestamp", GRAINS["minute"])}},
+    ], allowDiskUse=True)]
+    recompute(db, _ranges(touched, "minute"))
+
+    checkpoints.save(CHECKPOINT_NAME, last_id=newest["_id"])
+    return len(touched)
+
+
+def rebuild(db) -> int:
+    for name in ROLLUP_COLLECTIONS.values():
+        db[name].drop()
+    CheckpointStore(db).coll.delete_one({"_id": CHECKPOINT_NAME})
+    ensure_indexes(db, ROLLUP_COLLECTIONS.values())
+    return refresh(db)
+
+
+class RollupRefresher:
+    """Background refresh() every `interval` seconds."""
+
+    def __init__(self, db, interval: float = 10.0):
+        self.db = db
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rollups", daemon=True)
+
+    def start(self) -> "RollupRefresher":
+        ensure_indexes(self.db, ROLLUP_COLLECTIONS.values())
+        self._thread.start()
+        return self
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                refresh(self.db)
+            except Exception as e:
+                print(f"[!] Rollup refresh failed: {e}")
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join(timeout=self.interval + 5)
+
+
+# ---------- readers ----------
+def _time_match(since: Optional[datetime], until: Optional[datetime]) -> Dict[str, Any]:
+    t: Dict[str, Any] = {}
+    if since:
+        t["$gte"] = since
+    if until:
+        t["$lt"] = until
+    return {"t": t} if t else {}
+
+
+def totals(db, dim: str, grain: str = "day", since: Optional[datetime] = None,
+           until: Optional[datetime] = None, limit: Optional[int] = None) -> List[Tuple[str, int]]:
+    """[(key, count)] for one dimension over a time range, largest first."""
+    pipeline: List[Dict[str, Any]] = [
+        {"$match": {"dim": dim, **_time_match(since, until)}},
+        {"$group": {"_id": "$key", "count": {"$sum": "$count"}}},
+        {"$sort": {"count": -1, "_id": 1}},
+    ]
+    if limit:
+        pipeline.append({"$limit": limit})
+    return [(d["_id"], d["count"]) for d in db[ROLLUP_COLLECTIONS[grain]].aggregate(pipeline)]
+
+
+def count(db, dim: str = "total", key: str = "all", grain: str = "day",
+          since: Optional[datetime] = None, until: Optional[datetime] = None) -> int:
+    pipeline = [
+        {"$match": {"dim": dim, "key": key, **_time_match(since, until)}},
+        {"$group": {"_id": None, "count": {"$sum": "$count"}}},
+    ]
+    return next((d["count"] for d in db[ROLLUP_COLLECTIONS[grain]].aggregate(pipeline)), 0)
+
+
+def distinct_keys(db, dim: str, grain: str = "day", since: Optional[datetime] = None,
+                  until: Optional[datetime] = None) -> int:
+    """Number of distinct keys (e.g. unique IPs) seen in the range."""
+    pipeline = [
+        {"$match": {"dim": dim, **_time_match(since, until)}},
+        {"$group": {"_id": "$key"}},
+        {"$count": "n"},
+    ]
+    return next((d["n"] for d in db[ROLLUP_COLLECTIONS[grain]].aggregate(pipeline)), 0)
+
+
+def series(db, grain: str = "day", dim: str = "total", key: str = "all", since: Optional[datetime] = None,
+           until: Optional[datetime] = None) -> List[Tuple[datetime, int]]:
+    """[(bucket start, count)] in time order."""
+    cursor = db[ROLLUP_COLLECTIONS[grain]].find(
+        {"dim": dim, "key": key, **_time_match(since, until)}, {"t": 1, "count": 1}).sort("t", 1)
+    return [(_utc(d["t"]), d["count"]) for d in cursor]
+
+
+# ---------- CLI ----------
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Maintain / read normalized_logs rollups")
+    parser.add_argument("action", choices=["refresh", "rebuild", "top"])
+    parser.add_argument("--dim", choices=DIMENSIONS, default="source")
+    parser.add_argument("--grain", choices=list(GRAINS), default="day")
+    parser.add_argument("--days", type=float, help="only the last N days (default: everything kept)")
+    parser.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+
+    from common.mongo import get_db
+    db = get_db()
+    if args.action == "refresh":
+        ensure_indexes(db, ROLLUP_COLLECTIONS.values())
+        print(f"✅ Refreshed {refresh(db)} minute buckets")
+    elif args.action == "rebuild":
+        print(f"✅ Rebuilt rollups from {rebuild(db)} minute buckets")
+    else:
+        since = datetime.now(timezone.utc) - timedelta(days=args.days) if args.days else None
+        for key, n in totals(db, args.dim, args.grain, since=since, limit=args.limit):
+            print(f"  {key}: {n}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Sliding-window port-scan detector.
+
+Replaces the old global `ip_to_ports = defaultdict(set)`, which never expired
+and grew with every source IP ever seen. An IP is a scanner when it touched
+more than `threshold` distinct ports within the last `window_seconds` (the
+old rule was `len(ip_to_ports[ip]) > 10`, checked before adding the port).
+
+Memory is bounded on both axes:
+  - per IP, only the `max_ports_per_ip` most recently seen ports are kept
+    (we only need to know that the count passed the threshold);
+  - across IPs, an LRU of at most `max_ips` entries; IPs idle for longer
+    than the window are dropped as a side effect of every observation.
+
+Time is taken from the event (log timestamp), not the wall clock, so the
+backfill replaying a month of logs detects the same scans as the live loop.
+"""
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any
+
+
+def event_seconds(ts: Any) -> float:
+    """Epoch seconds of a log timestamp (naive datetimes from Mongo are UTC)."""
+    if isinstance(ts, datetime):
+        if ts.tzinfo is None:
+            ts = ts.replace(tzinfo=timezone.utc)
+        return ts.timestamp()
+    if isinstance(ts, (int, float)):
+        return float(ts)
+    return time.time()
+
+
+class PortScanTracker:
+    def __init__(self, threshold: int = 10, window_seconds: float = 300.0,
+                 max_ips: int = 100_000, max_ports_per_ip: int = 0):
+        self.threshold = threshold
+        self.window = window_seconds
+        self.max_ips = max_ips
+        self.max_ports = max_ports_per_ip or max(threshold * 2, 16)
+        # ip -> OrderedDict(port -> last_seen), ports oldest first
+        self._ips: "OrderedDict[str, OrderedDict[int, float]]" = OrderedDict()
+        self._clock = 0.0
+
+    def __len__(self) -> int:
+        return len(self._ips)
+
+    def observe(self, ip: str, port: int, ts: Any = None) -> int:
+        """Record a hit and return the distinct ports seen from `ip` within the window."""
+        now = event_seconds(ts)
+        self._clock = max(self._clock, now)
+        cutoff = self._clock - self.window
+
+        ports = self._ips.get(ip)
+        if ports is None:
+            ports = self._ips[ip] = OrderedDict()
+        else:
+            self._ips.move_to_end(ip)
+
+        ports[port] = max(now, ports.get(port, now))
+        ports.move_to_end(port)
+        while ports and next(iter(ports.values())) < cutoff:
+            ports.popitem(last=False)
+        while len(ports) > self.max_ports:
+            ports.popitem(last=False)
+
+        self._evict(cutoff)
+        return len(ports)
+
+    def distinct_ports(self, ip: str, ts: Any = None) -> int:
+        ports = self._ips.get(ip)
+        if not ports:
+            return 0
+        cutoff = max(self._clock, event_seconds(ts) if ts is not None else self._clock) - self.window
+        return sum(1 for seen in ports.values() if seen >= cutoff)
+
+    def is_scanning(self, ip: str, ts: Any = None) -> bool:
+        return self.distinct_ports(ip, ts) > self.threshold
+
+    def _evict(self, cutoff: float) -> None:
+        # LRU order == last activity order, so idle IPs sit at the front.
+        while self._ips:
+            ip, ports = next(iter(self._ips.items()))
+            idle = not ports or next(reversed(ports.values())) < cutoff
+            if not idle and len(self._ips) <= self.max_ips:
+                break
+            self._ips.popitem(last=False)
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Streaming ingest for the raw honeypot collections.
+
+Each source collection gets its own watcher thread. Watchers push
+(collection_name, raw_doc, position) tuples onto a bounded queue and the
+caller processes them on a single thread, so normalizer state (port-scan
+tracking, inserts) never needs locking.
+
+Preferred transport is a MongoDB change stream. A standalone mongod does not
+support change streams, so we fall back to a tailable cursor for capped
+collections and to `_id` polling for everything else.
+
+Positions are persisted per collection via normalizer.checkpoints, so a
+restart resumes exactly where the previous run stopped.
+"""
+from __future__ import annotations
+
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+
+from bson import ObjectId
+from pymongo import CursorType
+from pymongo.errors import OperationFailure, PyMongoError
+
+from normalizer.checkpoints import CheckpointStore
+
+# "$changeStream is only supported on replica sets" (standalone mongod)
+CHANGE_STREAM_UNSUPPORTED = {40573}
+# Stored resume token fell off the oplog
+CHANGE_STREAM_HISTORY_LOST = {136, 280, 286}
+# How far (by ObjectId time) before a stream opened a doc it delivers can sort
+STREAM_ID_LAG_SECONDS = int(os.getenv("STREAM_ID_LAG_SECONDS", "300"))
+
+
+class SourceWatcher(threading.Thread):
+    """Feeds new documents of one raw collection into the shared queue."""
+
+    def __init__(self, collection, out_queue: "queue.Queue", checkpoints: CheckpointStore,
+                 stop_event: threading.Event, poll_interval: float = 3.0):
+        super().__init__(name=f"watch-{collection.name}", daemon=True)
+        self.coll = collection
+        self.out = out_queue
+        self.checkpoints = checkpoints
+        self.stop_event = stop_event
+        self.poll_interval = poll_interval
+        self.mode = "pending"
+
+    # ---------- plumbing ----------
+    def _emit(self, doc, resume_token=None) -> None:
+        position = {"resume_token": resume_token, "last_id": doc["_id"]}
+        while not self.stop_event.is_set():
+            try:
+                self.out.put((self.coll.name, doc, position), timeout=0.5)
+                return
+            except queue.Full:
+                continue  # consumer is behind → block here (backpressure)
+
+    def _catch_up(self, last_id, seen=None, seen_from=None):
+        """
+        Replay everything inserted after `last_id` (or all docs on first run).
+        The ids of replayed docs from `seen_from` on are added to `seen`.
+        """
+        query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+        for doc in self.coll.find(query).sort("_id", 1):
+            if self.stop_event.is_set():
+                break
+            self._emit(doc)
+            last_id = doc["_id"]
+            if seen is not None and last_id >= seen_from:
+                seen.add(last_id)
+        return last_id
+
+    def run(self) -> None:
+        while not self.stop_event.is_set():
+            state = self.checkpoints.load(self.coll.name)
+            try:
+                self._watch(state)
+                return
+            except OperationFailure as e:
+                if e.code in CHANGE_STREAM_UNSUPPORTED:
+                    self._tail_or_poll(state)
+                    return
+                print(f"[!] {self.coll.name}: change stream error ({e.code}): {e}; retrying")
+            except PyMongoError as e:
+                print(f"[!] {self.coll.name}: watcher error: {e}; retrying")
+            time.sleep(self.poll_interval)
+
+    # ---------- change stream ----------
+    def _open_stream(self, token):
+        pipeline = [{"$match": {"operationType": "insert"}}]
+        return self.coll.watch(pipeline, resume_after=token, max_await_time_ms=500)
+
+    def _watch(self, state: Dict[str, Any]) -> None:
+        token = state.get("resume_token")
+        last_id = state.get("last_id")
+        while not self.stop_event.is_set():
+            try:
+                stream = self._open_stream(token)
+            except OperationFailure as e:
+                if token is None or e.code not in CHANGE_STREAM_HISTORY_LOST:
+                    raise
+                print(f"[!] {self.coll.name}: resume token expired, catching up from last _id")
+                token = None
+                stream = self._open_stream(None)
+
+            self.mode = "change_stream"
+            with stream:
+                # Stream is open before the catch-up scan, so nothing inserted in
+                # between is lost. Docs in both are dropped by the ids the scan
+                # emitted, not by `_id` order: ObjectIds come from the writers'
+                # clocks, so a doc committed after the scan can sort below its end.
+                # Only ids from STREAM_ID_LAG_SECONDS before the open can be in both.
+                emitted = set()
+                if token is None:
+                    floor = ObjectId.from_datetime(datetime.now(timezone.utc) - timedelta(seconds=STREAM_ID_LAG_SECONDS))
+                    last_id = self._catch_up(last_id, emitted, floor)
+                while not self.stop_event.is_set() and stream.alive:
+                    change = stream.try_next()
+                    if change is None:
+                        continue
+                    doc = change.get("fullDocument")
+                    if doc is None:
+                        continue
+                    if doc["_id"] in emitted:
+                        continue
+                    self._emit(doc, resume_token=change["_id"])
+                    token = change["_id"]
+                    last_id = doc["_id"] if last_id is None else max(last_id, doc["_id"])
+
+            if not self.stop_event.is_set():
+                # invalidated (collection dropped or renamed): a resume token can't
+                # follow that, so open a fresh stream and catch up by `_id`
+                print(f"[!] {self.coll.name}: change stream closed, reopening")
+                token = None
+
+    # ---------- standalone fallback ----------
+    def _tail_or_poll(self, state: Dict[str, Any]) -> None:
+        last_id = self._catch_up(state.get("last_id"))
+        capped = bool(self.coll.options().get("capped"))
+        self.mode = "tailable" if capped else "poll"
+        print(f"[i] {self.coll.name}: change streams unavailable → {self.mode} mode")
+
+        while not self.stop_event.is_set():
+            query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+            if capped:
+                cursor = self.coll.find(query, cursor_type=CursorType.TAILABLE_AWAIT)
+                while cursor.alive and not self.stop_event.is_set():
+                    for doc in cursor:
+                        self._emit(doc)
+                        last_id = doc["_id"]
+            else:
+                for doc in self.coll.find(query).sort("_id", 1):
+                    self._emit(doc)
+                    last_id = doc["_id"]
+            self.stop_event.wait(self.poll_interval)
+
+
+class SourceStream:
+    """
+    Merge the raw collections into one ordered-per-collection event feed.
+
+        stream = SourceStream(db, ["cowrie_logs", ...])
+        stream.start()
+        for name, doc, position in stream:
+            ...
+            stream.commit(name, position)   # once doc's output is written
+    """
+
+    def __init__(self, db, collection_names, max_pending: int = 10000,
+                 poll_interval: float = 3.0, checkpoints: Optional[CheckpointStore] = None):
+        self.checkpoints = checkpoints or CheckpointStore(db)
+        self.queue: "queue.Queue" = queue.Queue(maxsize=max_pending)
+        self.stop_event = threading.Event()
+        self.watchers = [
+            SourceWatcher(db[name], self.queue, self.checkpoints, self.stop_event, poll_interval)
+            for name in collection_names
+        ]
+
+    def start(self) -> "SourceStream":
+        for w in self.watchers:
+            w.start()
+        return self
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self.stop_event.set()
+        for w in self.watchers:
+            w.join(timeout=timeout)
+
+    def commit(self, name: str, position: Dict[str, Any], session=None) -> None:
+        self.checkpoints.save(name, session=session, **position)
+
+    def __iter__(self):
+        while not self.stop_event.is_set():
+            try:
+                yield self.queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
@@ -1,73 +1,56 @@
 #!/usr/bin/env python3
-
-from pymongo import MongoClient
-from collections import Counter
-from datetime import datetime, timedelta
-import pandas as pd
-
-# MongoDB connection
-MONGO_URI = "mongodb://127.0.0.1:27017/"
-DB_NAME = "adapttrap"
-COLLECTION_NAME = "normalized_logs"
-
-client = MongoClient(MONGO_URI)
-db = client[DB_NAME]
-collection = db[COLLECTION_NAME]
+"""
+Honeypot attack summary, read from the day rollups (normalizer/rollups.py)
+instead of grouping the whole normalized_logs collection.
+
+    python3 Code/normalizer/summarize_logs.py            # everything
+    python3 Code/normalizer/summarize_logs.py --days 7   # last 7 days
+"""
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import argparse
+from datetime import datetime, timedelta, timezone
+
+from common.mongo import get_db
+from normalizer.rollups import refresh, totals
+
+parser = argparse.ArgumentParser(description="Honeypot attack summary")
+parser.add_argument("--days", type=float, help="only the last N days")
+parser.add_argument("--no-refresh", action="store_true", help="don't catch the rollups up first")
+args = parser.parse_args()
+
+db = get_db()
+if not args.no_refresh:
+    refresh(db)
+since = None
+if args.days:
+    # day buckets: count the whole first day
+    since = (datetime.now(timezone.utc) - timedelta(days=args.days)).replace(hour=0, minute=0, second=0, microsecond=0)
 
 print("\n--- Honeypot Attack Summary ---")
 
 # 1. Logs per honeypot source
 print("\n📊 Logs by Honeypot Source:")
-source_cursor = collection.aggregate([
-    {"$group": {"_id": "$source", "count": {"$sum": 1}}},
-    {"$sort": {"count": -1}}
-])
-for item in source_cursor:
-    source = item['_id'] if item['_id'] else 'unknown'
-    print(f"  {source}: {item['count']} logs")
+for source, count in totals(db, "source", since=since):
+    print(f"  {source}: {count} logs")
 
 # 2. Top Protocols used
 print("\n📡 Top Protocols:")
-protocol_cursor = collection.aggregate([
-    {"$group": {"_id": "$protocol", "count": {"$sum": 1}}},
-    {"$sort": {"count": -1}}
-])
-for item in protocol_cursor:
-    proto = item['_id'] if item['_id'] else 'unknown'
-    print(f"  {proto}: {item['count']}")
+for proto, count in totals(db, "protocol", since=since):
+    print(f"  {proto}: {count}")
 
 # 3. Top 10 targeted ports
 print("\n🎯 Top 10 Targeted Ports:")
-port_cursor = collection.aggregate([
-    {"$group": {"_id": "$port", "count": {"$sum": 1}}},
-    {"$sort": {"count": -1}},
-    {"$limit": 10}
-])
-for item in port_cursor:
-    port = str(item['_id']) if item['_id'] != "" else "unknown"
-    print(f"  Port {port}: {item['count']} times")
+for port, count in totals(db, "port", since=since, limit=10):
+    print(f"  Port {port or 'unknown'}: {count} times")
 
 # 4. Top 10 attacker IPs
 print("\n🚨 Top 10 Attacker IPs:")
-ip_cursor = collection.aggregate([
-    {"$group": {"_id": "$ip", "count": {"$sum": 1}}},
-    {"$sort": {"count": -1}},
-    {"$limit": 10}
-])
-for item in ip_cursor:
-    ip = item['_id'] if item['_id'] else 'unknown'
-    print(f"  IP {ip}: {item['count']} attacks")
+for ip, count in totals(db, "ip", since=since, limit=10):
+    print(f"  IP {ip}: {count} attacks")
 
 # 5. Tags Breakdown
 print("\n🏷️ Top Tags (Attack Techniques/Tools):")
-tag_cursor = collection.aggregate([
-    {"$unwind": "$tags"},
-    {"$group": {"_id": "$tags", "count": {"$sum": 1}}},
-    {"$sort": {"count": -1}},
-    {"$limit": 10}
-])
-for item in tag_cursor:
-    tag = item['_id'] if item['_id'] else 'unknown'
-    print(f"  {tag}: {item['count']}")
-
-client.close()
+for tag, count in totals(db, "tag", since=since, limit=10):
+    print(f"  {tag}: {count}")
@@ -1,8 +1,23 @@
 import gymnasium as gym
 import numpy as np
-from pymongo import MongoClient
 from gymnasium import spaces
 
+from common.mongo import get_db
+from rl_agent.feature_store import FeatureStore, LiveFeed
+
+PLUGINS = ["ssh", "ftp", "http", "telnet"]
+
+
+def decode_action(action):
+    """Decode numeric action into plugin commands."""
+    return [
+        {
+            "plugin": PLUGINS[i],
+            "action": "disable_plugin" if bit == 1 else "enable_plugin"
+        }
+        for i, bit in enumerate(action)
+    ]
+
 
 class AdaptTrapEnv(gym.Env):
     """
@@ -11,13 +26,14 @@ class AdaptTrapEnv(gym.Env):
     """
     metadata = {"render.modes": ["human"]}
 
-    def __init__(self):
+    def __init__(self, feature_store=None, debug=False):
         super(AdaptTrapEnv, self).__init__()
 
-        # === MongoDB connection
-        self.client = MongoClient("mongodb://localhost:27017/")
-        self.db = self.client["adapttrap"]
-        self.collection = self.db["normalized_logs"]
+        # === Features: newest 50 normalized logs. Without a caller-supplied
+        # (and fed) store, a live feed is started on first use, not here, so
+        # constructing N copies (or pickling one into a worker) is free.
+        self.feed = None
+        self.features = feature_store
 
         # === Spaces
         self.action_space = spaces.MultiDiscrete([2, 2, 2, 2])
@@ -27,16 +43,24 @@ class AdaptTrapEnv(gym.Env):
         self.max_steps = 64        # end an episode after this many steps
         self.step_count = 0
 
-        self.debug = True
+        self.debug = debug
         self.last_action = None
 
+    def _ensure_features(self):
+        if self.features is None:
+            self.features = FeatureStore(max_events=50)
+            self.feed = LiveFeed(get_db(), self.features).start()
+        return self.features
+
     def reset(self, seed=None, options=None):
         super().reset(seed=seed)
+        self._ensure_features()
         self.step_count = 0
         self.last_action = None
         return self._get_state(), {}
 
     def step(self, action):
+        self._ensure_features()
         self.last_action = action
         state = self._get_state()
         reward = self._calculate_reward(action)
@@ -58,99 +82,31 @@ class AdaptTrapEnv(gym.Env):
         return state, reward, terminated, truncated, info
 
     def _decode_action(self, action):
-        """Decode numeric action into plugin commands."""
-        plugin_map = ["ssh", "ftp", "http", "telnet"]
-        return [
-            {
-                "plugin": plugin_map[i],
-                "action": "disable_plugin" if bit == 1 else "enable_plugin"
-            }
-            for i, bit in enumerate(action)
-        ]
+        return decode_action(action)
 
     def _get_state(self):
-        """Extract observation vector from recent MongoDB logs."""
-        recent_logs = list(self.collection.find().sort("timestamp", -1).limit(50))
-
-        ip_set = set()
-        ports = set()
-        ssh_count, http_count = 0, 0
-        nmap_count = 0
-
-        for log in recent_logs:
-            ip_set.add(log.get("ip", "unknown"))
-            ports.add(log.get("port", "unknown"))
-            tags = log.get("tags", [])
-
-            if "ssh" in tags:
-                ssh_count += 1
-            if "http" in tags:
-                http_count += 1
-            if "nmap" in tags:
-                nmap_count += 1
-
-        return np.array([
-            len(ip_set),
-            len(ports),
-            ssh_count,
-            http_count,
-            len(recent_logs),
-            nmap_count
-        ], dtype=np.float32)
+        """Observation vector over the newest 50 normalized logs (see FeatureStore)."""
+        return self.features.observation()
 
     def _calculate_reward(self, action):
-        """Reward function based on attacker behavior."""
-        logs = list(self.collection.find().sort("timestamp", -1).limit(50))
-
-        ip_counter = {}
-        unique_ports = set()
-        reward = 0.0
-        attack_tag_bonus = 0
-
-        for log in logs:
-            ip = log.get("ip", "unknown")
-            port = log.get("port", "unknown")
-            tags = log.get("tags", [])
-
-            if ip == "unknown":
-                continue
-
-            # Unique or repeated IPs
-            if ip in ip_counter:
-                ip_counter[ip] += 1
-            else:
-                ip_counter[ip] = 1
-                reward += 2.0  # reward for new IP
-
-            if port != "unknown":
-                unique_ports.add(port)
-
-            if any(tag in tags for tag in ["nmap", "ssh_brute", "login_attempt"]):
-                attack_tag_bonus += 1
-
-        # Port diversity bonus
-        reward += 0.5 * len(unique_ports)
-        reward += attack_tag_bonus
-
-        # Repeated IP penalty
-        repeated_penalty = sum(1 for count in ip_counter.values() if count > 1)
-        reward -= float(repeated_penalty)
-
-        # Low activity penalty
-        if len(logs) < 5:
-            reward -= 0.5
-
-        final_reward = max(reward, 0.0)
+        """Reward function based on attacker behavior (see FeatureStore.reward)."""
+        final_reward = self.features.reward()
 
         if self.debug:
+            f = self.features
             print("[🔍 REWARD BREAKDOWN]")
-            print(f"Unique IPs: {len(ip_counter)}")
-            print(f"Unique Ports: {len(unique_ports)}")
-            print(f"Attack Tags Bonus: {attack_tag_bonus}")
-            print(f"Repeated IP Penalty: {repeated_penalty}")
+            print(f"Unique IPs: {len(f.known_ips)}")
+            print(f"Unique Ports: {len(f.known_ports)}")
+            print(f"Attack Tags Bonus: {f.attack_tagged}")
+            print(f"Repeated IP Penalty: {f.repeated_ips}")
             print(f"Final Reward: {final_reward}\n")
 
         return final_reward
 
+    def close(self):
+        if self.feed is not None:
+            self.feed.stop()
+        super().close()
+
     def render(self, mode='human'):
         print(f"Last action taken: {self.last_action}")
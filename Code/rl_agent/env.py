@@ -2,8 +2,14 @@
 
 import gym
 from gym import spaces
+import time
 import numpy as np
-from pymongo import MongoClient
+
+from common.mongo import get_db
+from rl_agent.feature_store import FeatureStore, LiveFeed
+
+SOURCES = ['cowrie', 'honeypy', 'honeytrap', 'conpot']
+WINDOW_SECONDS = 5 * 60
 
 class AdaptTrapEnv(gym.Env):
     def __init__(self):
@@ -15,10 +21,9 @@ class AdaptTrapEnv(gym.Env):
         # Observation space: normalized attack stats for 4 honeypots
         self.observation_space = spaces.Box(low=0, high=1, shape=(4,), dtype=np.float32)
 
-        # MongoDB connection
-        self.client = MongoClient("mongodb://localhost:27017/")
-        self.db = self.client["adapttrap"]
-        self.logs = self.db["normalized_logs"]
+        # Rolling 5-minute window of normalized_logs, kept current in memory
+        self.features = FeatureStore(max_events=None, max_age=WINDOW_SECONDS)
+        self.feed = None  # started on first reset()
 
         # State tracking
         self.state = np.zeros(4, dtype=np.float32)
@@ -27,6 +32,8 @@ class AdaptTrapEnv(gym.Env):
         self.max_steps = 10
 
     def reset(self):
+        if self.feed is None:
+            self.feed = LiveFeed(get_db(), self.features).start()
         self.step_count = 0
         self.last_attack_count = self._get_attack_count()
         self.state = self._compute_state()
@@ -56,28 +63,14 @@ class AdaptTrapEnv(gym.Env):
 
     def _get_attack_count(self):
         # Count attacks in last 5 minutes (simulate step-wise interaction)
-        from datetime import datetime, timedelta
-        now = datetime.utcnow()
-        recent_time = now - timedelta(minutes=5)
-        return self.logs.count_documents({"timestamp": {"$gte": recent_time}})
+        self.features.expire(now=time.time())
+        return len(self.features)
 
     def _compute_state(self):
         # Normalize log distribution across honeypots in last 5 minutes
-        from datetime import datetime, timedelta
-        now = datetime.utcnow()
-        recent_time = now - timedelta(minutes=5)
-
-        source_list = ['cowrie', 'honeypy', 'honeytrap', 'conpot']
-        counts = []
-        total = 0
-
-        for src in source_list:
-            count = self.logs.count_documents({
-                "source": src,
-                "timestamp": {"$gte": recent_time}
-            })
-            counts.append(count)
-            total += count
+        self.features.expire(now=time.time())
+        counts = self.features.source_counts(SOURCES)
+        total = sum(counts)
 
         if total == 0:
             return np.zeros(4, dtype=np.float32)
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+Incremental rolling-window features for the RL observation and reward.
+
+AdaptTrapEnv used to re-read the newest 50 normalized logs from Mongo twice
+per step, and env.py issued a count_documents per source. FeatureStore keeps
+the window in memory instead: every record is added once, and expires once
+when it falls out of the window (by count, `max_events`, and/or by event
+time, `max_age`). All counters are adjusted on add/expire, so reading an
+observation or reward is O(1) regardless of window size.
+
+    store = FeatureStore(max_events=50)
+    store.add(record)              # normalized_logs document
+    store.observation()            # [unique IPs, unique ports, ssh, http, count, nmap]
+    store.reward()                 # same formula as AdaptTrapEnv._calculate_reward
+
+LiveFeed keeps a store current from normalized_logs (one seed query, then the
+change stream / tail fallback from normalizer.stream).
+"""
+from __future__ import annotations
+
+import threading
+from bisect import bisect_right
+from collections import deque
+from datetime import timedelta
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+from pymongo import DESCENDING
+
+from normalizer.checkpoints import MemoryCheckpoints
+from normalizer.scan_tracker import event_seconds
+from normalizer.stream import SourceStream
+
+ATTACK_TAGS = frozenset({"nmap", "ssh_brute", "login_attempt"})
+
+
+def _inc(counter: Dict[Any, int], key: Any) -> int:
+    n = counter.get(key, 0) + 1
+    counter[key] = n
+    return n
+
+
+def _dec(counter: Dict[Any, int], key: Any) -> int:
+    n = counter[key] - 1
+    if n:
+        counter[key] = n
+    else:
+        del counter[key]
+    return n
+
+
+class FeatureStore:
+    def __init__(self, max_events: Optional[int] = 50, max_age: Optional[float] = None):
+        self.max_events = max_events
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self._reset()
+
+    def _reset(self) -> None:
+        # (event_seconds, ip, port, source, tags) in event-time order, oldest first
+        self._events: deque = deque()
+        self.ips: Dict[Any, int] = {}
+        self.ports: Dict[Any, int] = {}
+        self.sources: Dict[str, int] = {}
+        self.tags: Dict[str, int] = {}
+        # reward only looks at events with a known IP
+        self.known_ips: Dict[str, int] = {}
+        self.known_ports: Dict[Any, int] = {}
+        self.repeated_ips = 0
+        self.attack_tagged = 0
+        self.latest = 0.0
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    # ---------- updates ----------
+    def add(self, record: Dict[str, Any]) -> None:
+        self.add_event(event_seconds(record.get("timestamp")), record.get("ip", "unknown"),
+                       record.get("port", "unknown"), record.get("source", "unknown"),
+                       frozenset(record.get("tags") or ()))
+
+    def add_event(self, ts: float, ip: Any, port: Any, source: Any, tags: frozenset) -> None:
+        """
+        add() without the dict: `ip`/`port` may be any hashable, "unknown" meaning
+        absent. The window is kept in event-time order, like the old
+        sort("timestamp", -1).limit(50) query: a late record (a backfill upsert,
+        a slow forwarder) is sorted into place, or dropped if it is older than
+        everything a full window holds or than `max_age` before the newest event.
+        """
+        event = (ts, ip, port, source, tags)
+        with self.lock:
+            if self.max_age is not None and ts < self.latest - self.max_age:
+                return
+            if not self._events or ts >= self._events[-1][0]:
+                self._events.append(event)
+            elif self.max_events is not None and len(self._events) >= self.max_events \
+                    and ts < self._events[0][0]:
+                return
+            else:
+                self._events.insert(bisect_right(self._events, ts, key=lambda e: e[0]), event)
+            self._count(event, _inc)
+            self.latest = max(self.latest, ts)
+            if self.max_events is not None:
+                while len(self._events) > self.max_events:
+                    self._count(self._events.popleft(), _dec)
+            self._expire(self.latest)
+
+    def add_many(self, records: Iterable[Dict[str, Any]]) -> None:
+        for record in records:
+            self.add(record)
+
+    def expire(self, now: Optional[float] = None) -> None:
+        """Drop events older than `max_age` before `now` (default: newest event time)."""
+        with self.lock:
+            self._expire(self.latest if now is None else now)
+
+    def _expire(self, now: float) -> None:
+        if self.max_age is None:
+            return
+        cutoff = now - self.max_age
+        while self._events and self._events[0][0] < cutoff:
+            self._count(self._events.popleft(), _dec)
+
+    def _count(self, event, step) -> None:
+        _, ip, port, source, tags = event
+        step(self.ips, ip)
+        step(self.ports, port)
+        step(self.sources, source)
+        for tag in tags:
+            step(self.tags, tag)
+        if ip == "unknown":
+            return
+        n = step(self.known_ips, ip)
+        # n is the count after the step: 2 on the way up, 1 on the way down
+        if step is _inc and n == 2:
+            self.repeated_ips += 1
+        elif step is _dec and n == 1:
+            self.repeated_ips -= 1
+        if port != "unknown":
+            step(self.known_ports, port)
+        if tags & ATTACK_TAGS:
+            self.attack_tagged += 1 if step is _inc else -1
+
+    def clear(self) -> None:
+        with self.lock:
+            self._reset()
+
+    # ---------- reads ----------
+    def observation(self) -> np.ndarray:
+        """[unique IPs, unique ports, ssh tags, http tags, log count, nmap tags]"""
+        with self.lock:
+            return np.array([
+                len(self.ips),
+                len(self.ports),
+                self.tags.get("ssh", 0),
+                self.tags.get("http", 0),
+                len(self._events),
+                self.tags.get("nmap", 0),
+            ], dtype=np.float32)
+
+    def reward(self) -> float:
+        """+2 per new IP, +0.5 per port, +1 per attack-tagged log, -1 per repeated IP, -0.5 if quiet."""
+        with self.lock:
+            reward = 2.0 * len(self.known_ips) + 0.5 * len(self.known_ports) + self.attack_tagged
+            reward -= float(self.repeated_ips)
+            if len(self._events) < 5:
+                reward -= 0.5
+            return max(reward, 0.0)
+
+    def source_counts(self, sources: List[str]) -> List[int]:
+        with self.lock:
+            return [self.sources.get(s, 0) for s in sources]
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "events": len(self._events),
+                "unique_ips": len(self.ips),
+                "unique_ports": len(self.ports),
+                "sources": dict(self.sources),
+                "tags": dict(self.tags),
+            }
+
+
+class LiveFeed:
+    """
+    Keep a FeatureStore current from normalized_logs on a background thread.
+    Each applied event's position is committed, so a watcher that retries
+    resumes after it; events it re-emits from the queue's backlog are
+    dropped by `_id`.
+    """
+
+    COLLECTION = "normalized_logs"
+
+    def __init__(self, db, store: FeatureStore, on_record=None, poll_interval: float = 1.0):
+        self.db = db
+        self.store = store
+        self.on_record = on_record
+        self.poll_interval = poll_interval
+        self.stream: Optional[SourceStream] = None
+        self.thread: Optional[threading.Thread] = None
+
+    def seed(self) -> Any:
+        """Load the current window with one query; returns the newest `_id` seen."""
+        limit = self.store.max_events or 0
+        query: Dict[str, Any] = {}
+        if self.store.max_age is not None:
+            newest = self.db[self.COLLECTION].find_one({}, {"timestamp": 1}, sort=[("timestamp", DESCENDING)])
+            if newest is not None:
+                query["timestamp"] = {"$gte": newest["timestamp"] - timedelta(seconds=self.store.max_age)}
+        cursor = self.db[self.COLLECTION].find(
+            query, {"ip": 1, "port": 1, "source": 1, "tags": 1, "timestamp": 1}
+        ).sort("timestamp", DESCENDING).limit(limit)
+        docs = list(cursor)
+        self.store.add_many(reversed(docs))
+        return max((d["_id"] for d in docs), default=None)
+
+    def start(self) -> "LiveFeed":
+        last_id = self.seed()
+        checkpoints = MemoryCheckpoints({self.COLLECTION: {"last_id": last_id}} if last_id else None)
+        self.stream = SourceStream(self.db, [self.COLLECTION], poll_interval=self.poll_interval,
+                                   checkpoints=checkpoints)
+        self.stream.start()
+        self.thread = threading.Thread(target=self._run, name="feature-feed", daemon=True)
+        self.thread.start()
+        return self
+
+    def _run(self) -> None:
+        # only events still queued when a watcher retried can come twice
+        window = self.stream.queue.maxsize
+        recent: deque = deque()
+        applied = set()
+        for name, doc, position in self.stream:
+            if doc["_id"] in applied:
+                continue
+            recent.append(doc["_id"])
+            applied.add(doc["_id"])
+            if len(recent) > window:
+                applied.discard(recent.popleft())
+            self.store.add(doc)
+            if self.on_record is not None:
+                self.on_record(doc)
+            self.stream.commit(name, position)
+
+    def stop(self) -> None:
+        if self.stream is not None:
+            self.stream.stop()
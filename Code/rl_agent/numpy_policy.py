@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Torch-free inference for the PPO policy.
+
+The deployed policy is SB3's MlpPolicy over a 6-float observation: a small
+tanh MLP followed by one logit head per MultiDiscrete dimension. `export`
+copies those weights out of the SB3 zip into a .npz artifact; NumpyPolicy
+runs the same forward pass with NumPy only, so the predictor starts without
+importing torch or stable-baselines3.
+
+    python3 Code/rl_agent/numpy_policy.py export                 # Models/rl/*.zip → *.npz
+    python3 Code/rl_agent/numpy_policy.py verify --samples 10000 # parity + latency vs PPO.predict
+
+`export` and `verify` need stable-baselines3; loading the .npz does not.
+`load_policy()` re-exports when the zip is newer than the .npz (retrained).
+"""
+from __future__ import annotations
+
+import os
+import sys
+import argparse
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+MODELS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "Models", "rl"))
+DEFAULT_MODEL = os.path.join(MODELS_DIR, "ppo_adapttrap_sb3.zip")
+DEFAULT_ARTIFACT = os.path.join(MODELS_DIR, "ppo_adapttrap_policy.npz")
+
+ACTIVATIONS = {
+    "Tanh": np.tanh,
+    "ReLU": lambda x: np.maximum(x, 0.0),
+    "Identity": lambda x: x,
+}
+
+
+class NumpyPolicy:
+    """MlpPolicy forward pass for MultiDiscrete actions; predict() mirrors PPO.predict."""
+
+    def __init__(self, layers: List[Tuple[np.ndarray, np.ndarray]], activation: str,
+                 head: Tuple[np.ndarray, np.ndarray], nvec: np.ndarray):
+        # weights stored transposed (in, out) so the forward pass is x @ W + b
+        self.layers = [(np.ascontiguousarray(w.T, dtype=np.float32), b.astype(np.float32)) for w, b in layers]
+        self.activation_name = activation
+        self.activation = ACTIVATIONS[activation]
+        self.head_w = np.ascontiguousarray(head[0].T, dtype=np.float32)
+        self.head_b = head[1].astype(np.float32)
+        self.nvec = np.asarray(nvec, dtype=np.int64)
+        self.splits = np.cumsum(self.nvec)[:-1]
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_ARTIFACT) -> "NumpyPolicy":
+        data = np.load(path, allow_pickle=False)
+        n_layers = int(data["n_layers"])
+        layers = [(data[f"w{i}"], data[f"b{i}"]) for i in range(n_layers)]
+        return cls(layers, str(data["activation"]), (data["head_w"], data["head_b"]), data["nvec"])
+
+    def save(self, path: str) -> None:
+        arrays: Dict[str, np.ndarray] = {"n_layers": np.array(len(self.layers)),
+                                         "activation": np.array(self.activation_name),
+                                         "head_w": self.head_w.T, "head_b": self.head_b, "nvec": self.nvec}
+        for i, (w, b) in enumerate(self.layers):
+            arrays[f"w{i}"], arrays[f"b{i}"] = w.T, b
+        np.savez(path, **arrays)
+
+    def logits(self, obs: np.ndarray) -> np.ndarray:
+        x = np.asarray(obs, dtype=np.float32).reshape(-1, self.layers[0][0].shape[0])
+        for w, b in self.layers:
+            x = self.activation(x @ w + b)
+        return x @ self.head_w + self.head_b
+
+    def predict(self, obs, state=None, episode_start=None, deterministic: bool = True,
+                rng: Optional[np.random.Generator] = None):
+        """(action, None) for one observation, or a batch when `obs` is 2-D."""
+        obs = np.asarray(obs, dtype=np.float32)
+        single = obs.ndim == 1
+        parts = np.split(self.logits(obs), self.splits, axis=1)
+        if deterministic:
+            actions = np.stack([p.argmax(axis=1) for p in parts], axis=1)
+        else:
+            rng = rng or np.random.default_rng()
+            cols = []
+            for p in parts:
+                # Gumbel-max: sampling from softmax(p) without normalizing
+                cols.append((p - np.log(-np.log(rng.random(p.shape)))).argmax(axis=1))
+            actions = np.stack(cols, axis=1)
+        return (actions[0] if single else actions), None
+
+
+def load_policy(artifact: str = DEFAULT_ARTIFACT, model_zip: str = DEFAULT_MODEL):
+    """
+    The exported policy when it is at least as new as `model_zip`. Otherwise
+    the SB3 model (needs torch), re-exported to `artifact` so a retrained
+    model is never shadowed by an old export and the next start skips torch.
+    """
+    stale = os.path.exists(model_zip) and os.path.exists(artifact) \
+        and os.path.getmtime(model_zip) > os.path.getmtime(artifact)
+    if os.path.exists(artifact) and not stale:
+        return NumpyPolicy.load(artifact)
+    from stable_baselines3 import PPO
+    if stale:
+        print(f"[!] {model_zip} is newer than {artifact}; re-exporting")
+    else:
+        print(f"[!] {artifact} not found, loading {model_zip} with stable-baselines3")
+    model = PPO.load(model_zip, device="cpu")
+    try:
+        policy = from_sb3(model)
+    except ValueError as e:
+        print(f"[!] Cannot export {model_zip} ({e}); running it with stable-baselines3")
+        return model
+    os.makedirs(os.path.dirname(os.path.abspath(artifact)), exist_ok=True)
+    policy.save(artifact)
+    print(f"[+] Exported {model_zip} → {artifact}")
+    return policy
+
+
+# ---------- export / verify (need stable-baselines3) ----------
+def from_sb3(model) -> NumpyPolicy:
+    policy = model.policy
+    nvec = getattr(model.action_space, "nvec", None)
+    if nvec is None:
+        raise ValueError(f"only MultiDiscrete action spaces are supported, got {model.action_space}")
+    if type(policy.features_extractor).__name__ != "FlattenExtractor":
+        raise ValueError("only the default FlattenExtractor is supported")
+    layers, activation = [], "Identity"
+    for module in policy.mlp_extractor.policy_net:
+        name = type(module).__name__
+        if name == "Linear":
+            layers.append((module.weight.detach().cpu().numpy(), module.bias.detach().cpu().numpy()))
+        elif name in ACTIVATIONS:
+            activation = name
+        else:
+            raise ValueError(f"unsupported layer in policy_net: {name}")
+    head = policy.action_net
+    return NumpyPolicy(layers, activation,
+                       (head.weight.detach().cpu().numpy(), head.bias.detach().cpu().numpy()), nvec)
+
+
+def sample_observations(n: int, seed: int = 0) -> np.ndarray:
+    """Observations in the ranges the live window produces (counts over 50 logs)."""
+    rng = np.random.default_rng(seed)
+    obs = rng.integers(0, 51, size=(n, 6)).astype(np.float32)
+    obs[:, 4] = np.maximum(obs[:, 4], obs[:, :4].max(axis=1))  # log count bounds the others
+    return obs
+
+
+def verify(model_zip: str, artifact: str, samples: int, seed: int) -> bool:
+    from stable_baselines3 import PPO
+
+    model = PPO.load(model_zip, device="cpu")
+    policy = NumpyPolicy.load(artifact)
+    obs = sample_observations(samples, seed)
+
+    expected, _ = model.predict(obs, deterministic=True)
+    got, _ = policy.predict(obs, deterministic=True)
+    mismatches = int((expected != got).any(axis=1).sum())
+    print(f"[=] Parity: {samples - mismatches}/{samples} identical deterministic actions")
+
+    single = obs[:1000]
+    timings = {}
+    for name, fn in (("PPO.predict", model.predict), ("NumpyPolicy", policy.predict)):
+        fn(single[0], deterministic=True)  # warm-up
+        start = time.perf_counter()
+        for o in single:
+            fn(o, deterministic=True)
+        timings[name] = (time.perf_counter() - start) / len(single) * 1e6
+    for name, us in timings.items():
+        print(f"    {name:<12} {us:8.1f} µs/decision")
+    print(f"    speed-up     {timings['PPO.predict'] / timings['NumpyPolicy']:8.1f}x")
+    return mismatches == 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Export the PPO policy to NumPy and check it")
+    parser.add_argument("action", choices=["export", "verify"])
+    parser.add_argument("--model", default=DEFAULT_MODEL, help="SB3 PPO zip")
+    parser.add_argument("--out", default=DEFAULT_ARTIFACT, help="NumPy policy artifact (.npz)")
+    parser.add_argument("--samples", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.action == "export":
+        from stable_baselines3 import PPO
+        policy = from_sb3(PPO.load(args.model, device="cpu"))
+        policy.save(args.out)
+        print(f"✅ Exported {args.model} → {args.out}")
+    sys.exit(0 if verify(args.model, args.out, args.samples, args.seed) else 1)
+
+
+if __name__ == "__main__":
+    main()
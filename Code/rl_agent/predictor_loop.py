@@ -1,13 +1,18 @@
 import os
 import sys
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import threading
 import time
-import numpy as np
-from pymongo import MongoClient
-from datetime import datetime, timedelta, timezone
+from datetime import datetime, timezone
 
-from stable_baselines3 import PPO
-from rl_agent.adapt_trap_env import AdaptTrapEnv
+from bson.objectid import ObjectId
+from pymongo import InsertOne, UpdateOne
+
+from common.indexes import ensure_indexes
+from common.mongo import get_db
+from rl_agent.adapt_trap_env import decode_action
+from rl_agent.feature_store import FeatureStore, LiveFeed
+from rl_agent.numpy_policy import DEFAULT_ARTIFACT, load_policy
 
 # =========================
 # DEMO MODE TOGGLE
@@ -15,23 +20,24 @@ from rl_agent.adapt_trap_env import AdaptTrapEnv
 DEMO_MODE = True  # ✅ Set to False for normal operation
 
 # MongoDB setup
-client = MongoClient("mongodb://localhost:27017/")
-db = client["adapttrap"]
-logs_collection = db["normalized_logs"]
+db = get_db()
 actions_collection = db["agent_actions"]
 state_collection = db["plugin_states"]  # 🔁 NEW: tracks current state
+ensure_indexes(db, ["normalized_logs", "agent_actions", "plugin_states"])
 
-# Load model
+# Load model: the NumPy export (numpy_policy.py export) when present and not
+# older than the SB3 zip, so torch is never imported here; otherwise the zip,
+# re-exported for the next start.
+policy_path = os.getenv("PREDICTOR_POLICY", DEFAULT_ARTIFACT)
 model_path = os.path.abspath("rl_agent/models/ppo_adapttrap_sb3.zip")
-model = PPO.load(model_path)
-print("✅ RL model loaded from:", model_path)
-
-# Environment setup
-env = AdaptTrapEnv()
+model = load_policy(policy_path, model_path)
+print("✅ RL model loaded from:", policy_path if os.path.exists(policy_path) else model_path)
 
-# Track last check time (shorter for demo)
-LOOKBACK_SECONDS = 10 if DEMO_MODE else 30
-last_check_time = datetime.now(timezone.utc) - timedelta(seconds=LOOKBACK_SECONDS)
+# Decision windows: a burst of triggering logs is coalesced into one decision,
+# taken once the burst has been quiet for QUIET_SECONDS, or at the latest
+# MAX_DELAY_SECONDS after its first log (the old loop slept 10/30 s).
+QUIET_SECONDS = 1.0 if DEMO_MODE else 2.0
+MAX_DELAY_SECONDS = 3.0 if DEMO_MODE else 5.0
 
 # Define tags that should trigger prediction
 TRIGGER_TAGS = {
@@ -39,99 +45,176 @@ TRIGGER_TAGS = {
     "sqli", "dir_traversal", "netcat", "login_attempt"
 }
 
-def check_for_attacker_activity(since_time):
-    recent_logs = list(logs_collection.find(
-        {"timestamp": {"$gte": since_time}},
-        sort=[("timestamp", -1)]
-    ))
+def is_attacker_activity(log):
+    tags = set(log.get("tags", []))
+    ip = log.get("ip", "unknown")
+    protocol = log.get("protocol", "unknown")
 
     if DEMO_MODE:
         # In demo mode: trigger if ANY log has at least one tag or valid external IP
-        for log in recent_logs:
-            tags = set(log.get("tags", []))
-            ip = log.get("ip", "unknown")
-            protocol = log.get("protocol", "unknown")
-            if tags or (protocol in {"ftp", "http", "ssh", "telnet"} and ip != "unknown"):
-                return True, len(recent_logs)
-        return False, len(recent_logs)
-    else:
-        # Normal mode: stricter logic
-        trigger_count = 0
-        for log in recent_logs:
-            tags = set(log.get("tags", []))
-            ip = log.get("ip", "unknown")
-            protocol = log.get("protocol", "unknown")
-
-            # Known attack tags
-            if tags & TRIGGER_TAGS:
-                trigger_count += 1
-            # Fallback for external IPs
-            elif protocol in {"ftp", "http", "ssh", "telnet"} and ip != "unknown" and not ip.startswith("192.168.186."):
-                trigger_count += 1
-
-        return trigger_count > 0, len(recent_logs)
-
-def get_current_plugin_state(plugin):
-    entry = state_collection.find_one({"plugin": plugin})
-    return entry["status"] if entry else "enabled"  # default: enabled
-
-def update_plugin_state(plugin, action):
-    new_state = "enabled" if action == "enable_plugin" else "disabled"
-    state_collection.update_one(
-        {"plugin": plugin},
-        {"$set": {"status": new_state, "last_updated": datetime.now(timezone.utc)}},
-        upsert=True
-    )
+        return bool(tags) or (protocol in {"ftp", "http", "ssh", "telnet"} and ip != "unknown")
+
+    # Normal mode: stricter logic
+    # Known attack tags
+    if tags & TRIGGER_TAGS:
+        return True
+    # Fallback for external IPs
+    return protocol in {"ftp", "http", "ssh", "telnet"} and ip != "unknown" and not ip.startswith("192.168.186.")
+
+
+class DecisionWindows:
+    """Coalesce normalized events (fed from the LiveFeed thread) into decision windows."""
+
+    def __init__(self, quiet=QUIET_SECONDS, max_delay=MAX_DELAY_SECONDS):
+        self.quiet = quiet
+        self.max_delay = max_delay
+        self.cond = threading.Condition()
+        self.logs = 0
+        self.triggers = 0
+        self.opened = None
+        self.last = None
+
+    def offer(self, log):
+        with self.cond:
+            self.logs += 1
+            if not is_attacker_activity(log):
+                return
+            now = time.monotonic()
+            self.triggers += 1
+            self.last = now
+            if self.opened is None:
+                self.opened = now
+                self.cond.notify()
+
+    def next_window(self):
+        """Block until a window closes; returns (logs seen, triggering logs, seconds since first trigger)."""
+        with self.cond:
+            while self.opened is None:
+                self.cond.wait()
+            while True:
+                now = time.monotonic()
+                deadline = min(self.last + self.quiet, self.opened + self.max_delay)
+                if now >= deadline:
+                    break
+                self.cond.wait(deadline - now)
+            result = (self.logs, self.triggers, now - self.opened)
+            self.logs = self.triggers = 0
+            self.opened = self.last = None
+            return result
+
+class PluginStateCache:
+    """
+    In-process copy of plugin_states; decisions read it instead of one find_one per plugin.
+
+    The predictor is the only writer, so the cache is authoritative. It is loaded
+    on startup and re-read every RECONCILE_SECONDS; a document changed elsewhere
+    (newer last_updated, e.g. a manual edit) replaces the cached entry.
+    """
+    RECONCILE_SECONDS = 60
+
+    def __init__(self, collection):
+        self.coll = collection
+        self.states = {}  # plugin -> {"status", "last_updated"}
+        self.reconciled_at = 0.0
+
+    def reconcile(self):
+        for doc in self.coll.find({}, {"plugin": 1, "status": 1, "last_updated": 1}):
+            cached = self.states.get(doc.get("plugin"))
+            updated = _utc(doc["last_updated"]) if doc.get("last_updated") else NEVER
+            if cached is None or updated > cached["last_updated"]:
+                self.states[doc["plugin"]] = {"status": doc.get("status", "enabled"), "last_updated": updated}
+        self.reconciled_at = time.monotonic()
+
+    def maybe_reconcile(self):
+        if time.monotonic() - self.reconciled_at >= self.RECONCILE_SECONDS:
+            self.reconcile()
+
+    def get(self, plugin):
+        entry = self.states.get(plugin)
+        return entry["status"] if entry else "enabled"  # default: enabled
+
+    def set_many(self, changes, now):
+        """Persist {plugin: status} in one bulk_write, then update the cache."""
+        self.coll.bulk_write([
+            UpdateOne({"plugin": plugin}, {"$set": {"status": status, "last_updated": now}}, upsert=True)
+            for plugin, status in changes.items()
+        ], ordered=False)
+        for plugin, status in changes.items():
+            self.states[plugin] = {"status": status, "last_updated": now}
+
+NEVER = datetime.min.replace(tzinfo=timezone.utc)
+
+def _utc(dt):
+    # Mongo hands back naive UTC datetimes
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+plugin_states = PluginStateCache(state_collection)
+
+def decide(features, now):
+    plugin_states.maybe_reconcile()
+
+    # Observation and reward come straight from the incremental aggregate
+    # (same definitions as AdaptTrapEnv), built once per window.
+    obs = features.observation()
+    action, _ = model.predict(obs, deterministic=True if DEMO_MODE else False)
+    print(f"[DEBUG] Full action vector from agent: {action}")
+    reward_value = features.reward()
+    selected_actions = decode_action(action)
+
+    changes = {}
+    for selected_action in selected_actions:
+        plugin = selected_action.get("plugin")
+        action_type = selected_action.get("action")
+
+        desired_state = "enabled" if action_type == "enable_plugin" else "disabled"
+        if plugin_states.get(plugin) != desired_state:
+            changes[plugin] = (selected_action, desired_state)
+        else:
+            print(f"[=] Skipping {plugin} ({action_type}) — already in desired state.")
+
+    if not changes:
+        print("[-] No action needed. Agent decision matches current plugin states.")
+        return
+
+    # One decision → one bulk_write of its actions, tied together by decision_id
+    # so the actuator can apply them as a batch.
+    decision_id = ObjectId()
+    actions_collection.bulk_write([
+        InsertOne({
+            "timestamp": now,
+            "selected_action": selected_action,
+            "processed": False,
+            "created_at": now,
+            "reward": reward_value,
+            "decision_id": decision_id,
+            "decision_size": len(changes),
+        })
+        for selected_action, _ in changes.values()
+    ], ordered=True)
+    plugin_states.set_many({plugin: state for plugin, (_, state) in changes.items()}, now)
+    for selected_action, _ in changes.values():
+        print(f"[✓] Action logged: {selected_action} (reward: {reward_value})")
+    print(f"[+] Decision {decision_id}: {len(changes)} action(s)")
 
 def run_predictor_loop():
-    global last_check_time
-    print(f"{'[DEMO] ' if DEMO_MODE else ''}Predictor loop started. Lookback window = {LOOKBACK_SECONDS}s\n")
-
-    while True:
-        now = datetime.now(timezone.utc)
-
-        should_predict, log_count = check_for_attacker_activity(last_check_time)
-        print(f"[+] {now.isoformat()} → Checked {log_count} new logs")
-
-        if not should_predict:
-            print("[=] No significant attacker activity. Skipping prediction.\n")
-        else:
+    print(f"{'[DEMO] ' if DEMO_MODE else ''}Predictor loop started. "
+          f"Decision window: {QUIET_SECONDS}s quiet / {MAX_DELAY_SECONDS}s max\n")
+
+    plugin_states.reconcile()
+    features = FeatureStore(max_events=50)
+    windows = DecisionWindows()
+    feed = LiveFeed(db, features, on_record=windows.offer).start()
+
+    try:
+        while True:
+            log_count, trigger_count, waited = windows.next_window()
+            now = datetime.now(timezone.utc)
+            print(f"[+] {now.isoformat()} → {log_count} new logs, {trigger_count} attacker events "
+                  f"(window {waited:.1f}s)")
             print(f"{'[DEMO] ' if DEMO_MODE else ''}[!] Attack detected! Making prediction...")
-
-            obs, _ = env.reset()
-            action, _ = model.predict(obs, deterministic=True if DEMO_MODE else False)
-            print(f"[DEBUG] Full action vector from agent: {action}")
-
-            _, reward_value, _, _, info = env.step(action)
-            selected_actions = info.get("selected_action", [])
-
-            changes_logged = 0
-            for selected_action in selected_actions:
-                plugin = selected_action.get("plugin")
-                action_type = selected_action.get("action")
-
-                current_state = get_current_plugin_state(plugin)
-                desired_state = "enabled" if action_type == "enable_plugin" else "disabled"
-
-                if current_state != desired_state:
-                    actions_collection.insert_one({
-                        "timestamp": now,
-                        "selected_action": selected_action,
-                        "processed": False,
-                        "created_at": now,
-                        "reward": reward_value
-                    })
-                    update_plugin_state(plugin, action_type)
-                    changes_logged += 1
-                    print(f"[✓] Action logged: {selected_action} (reward: {reward_value})")
-                else:
-                    print(f"[=] Skipping {plugin} ({action_type}) — already in desired state.")
-
-            if changes_logged == 0:
-                print("[-] No action needed. Agent decision matches current plugin states.")
-
-        last_check_time = now
-        time.sleep(LOOKBACK_SECONDS)
+            decide(features, now)
+    finally:
+        feed.stop()
 
 if __name__ == "__main__":
     run_predictor_loop()
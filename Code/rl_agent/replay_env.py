@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Offline replay environment for PPO training.
+
+`export` dumps a time slice of normalized_logs into a snapshot directory of
+column arrays (.npy, read back memory-mapped) plus meta.json with the
+IP/source/tag vocabularies:
+
+    python3 Code/rl_agent/replay_env.py export --out Data/replay/july --since 2025-07-01 --until 2025-08-01
+    python3 Code/rl_agent/replay_env.py bench  --snapshot Data/replay/july
+
+ReplayEnv then steps through the recording without touching MongoDB. Each
+step advances `step_seconds` of recorded time; observation and reward are
+computed by the same FeatureStore as the live AdaptTrapEnv (newest 50
+records), so a policy trained here sees identical features in production.
+Episode start offsets are drawn from the env's seeded RNG, so a run is
+reproducible from its seed. With `shard=(i, n)` starts are confined to the
+i-th of n contiguous slices, so n parallel envs cover the recording evenly.
+"""
+from __future__ import annotations
+
+import os
+import sys
+import argparse
+import json
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Tuple
+
+import gymnasium as gym
+import numpy as np
+from gymnasium import spaces
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from normalizer.scan_tracker import event_seconds
+from rl_agent.adapt_trap_env import decode_action
+from rl_agent.feature_store import FeatureStore
+
+COLUMNS = {"ts": np.float64, "ip": np.int32, "port": np.int32, "source": np.int16, "tags": np.uint64}
+# Tags the observation/reward read always get the low bits.
+FIXED_TAGS = ["ssh", "http", "nmap", "ssh_brute", "login_attempt"]
+MAX_TAGS = 64
+
+
+# ---------- snapshot export ----------
+def _port_code(port: Any) -> int:
+    try:
+        return int(port)
+    except (TypeError, ValueError):
+        return -1
+
+
+def export_snapshot(db, out_dir: str, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                    batch_size: int = 5000) -> int:
+    """Write normalized_logs in [since, until) sorted by timestamp; returns the row count."""
+    until = until or datetime.now(timezone.utc)
+    query: Dict[str, Any] = {"timestamp": {"$lt": until}}
+    if since:
+        query["timestamp"]["$gte"] = since
+    coll = db["normalized_logs"]
+    n = coll.count_documents(query)
+
+    os.makedirs(out_dir, exist_ok=True)
+    arrays = {name: np.lib.format.open_memmap(os.path.join(out_dir, f"{name}.npy"), mode="w+",
+                                              dtype=dtype, shape=(n,))
+              for name, dtype in COLUMNS.items()}
+    ips: Dict[str, int] = {}
+    sources: Dict[str, int] = {}
+    tags: Dict[str, int] = {t: i for i, t in enumerate(FIXED_TAGS)}
+
+    cursor = coll.find(query, {"timestamp": 1, "ip": 1, "port": 1, "source": 1, "tags": 1},
+                       batch_size=batch_size).sort("timestamp", 1)
+    i = 0
+    for doc in cursor:
+        if i >= n:  # rows inserted after the count (until is exclusive, so only clock skew)
+            break
+        ip = doc.get("ip", "unknown")
+        mask = 0
+        for tag in doc.get("tags") or ():
+            bit = tags.setdefault(tag, len(tags))
+            if bit < MAX_TAGS:
+                mask |= 1 << bit
+        arrays["ts"][i] = event_seconds(doc.get("timestamp"))
+        arrays["ip"][i] = -1 if ip == "unknown" else ips.setdefault(ip, len(ips))
+        arrays["port"][i] = _port_code(doc.get("port"))
+        arrays["source"][i] = sources.setdefault(doc.get("source", "unknown"), len(sources))
+        arrays["tags"][i] = mask
+        i += 1
+
+    for arr in arrays.values():
+        arr.flush()
+    meta = {
+        "rows": i,
+        "since": since.isoformat() if since else None,
+        "until": until.isoformat(),
+        "ips": list(ips),
+        "sources": list(sources),
+        "tags": [t for t, _ in sorted(tags.items(), key=lambda kv: kv[1])][:MAX_TAGS],
+    }
+    with open(os.path.join(out_dir, "meta.json"), "w") as f:
+        json.dump(meta, f)
+    return i
+
+
+class ReplaySnapshot:
+    """Read-only, memory-mapped view of an exported snapshot."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), "r") as f:
+            self.meta = json.load(f)
+        self.rows = self.meta["rows"]
+        for name in COLUMNS:
+            setattr(self, name, np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")[:self.rows])
+        self.tag_names = self.meta["tags"]
+        self._tag_sets: Dict[int, frozenset] = {}
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def tag_set(self, mask: int) -> frozenset:
+        names = self._tag_sets.get(mask)
+        if names is None:
+            names = self._tag_sets[mask] = frozenset(
+                t for bit, t in enumerate(self.tag_names) if mask >> bit & 1)
+        return names
+
+
+# ---------- environment ----------
+class ReplayEnv(gym.Env):
+    """AdaptTrapEnv's spaces, observation and reward, driven by a recorded snapshot."""
+    metadata = {"render.modes": ["human"]}
+
+    def __init__(self, snapshot, step_seconds: float = 30.0, max_steps: int = 64, window: int = 50,
+                 shard: Tuple[int, int] = (0, 1)):
+        super().__init__()
+        self.snapshot = snapshot if isinstance(snapshot, ReplaySnapshot) else ReplaySnapshot(snapshot)
+        if len(self.snapshot) == 0:
+            raise ValueError(f"empty replay snapshot: {self.snapshot.path}")
+        index, count = shard
+        rows = len(self.snapshot)
+        self.start_lo = rows * index // count
+        self.start_hi = max(rows * (index + 1) // count, self.start_lo + 1)
+        self.step_seconds = step_seconds
+        self.max_steps = max_steps
+        self.window = window
+        self.features = FeatureStore(max_events=window)
+
+        self.action_space = spaces.MultiDiscrete([2, 2, 2, 2])
+        self.observation_space = spaces.Box(low=0, high=1000, shape=(6,), dtype=np.float32)
+
+        self.cursor = 0
+        self.clock = 0.0
+        self.step_count = 0
+        self.last_action = None
+
+    def _feed(self, lo: int, hi: int) -> None:
+        snap, add, tag_set = self.snapshot, self.features.add_event, self.snapshot.tag_set
+        # tolist() once per slice: indexing numpy scalars one by one is ~10x slower
+        rows = zip(snap.ts[lo:hi].tolist(), snap.ip[lo:hi].tolist(), snap.port[lo:hi].tolist(),
+                   snap.source[lo:hi].tolist(), snap.tags[lo:hi].tolist())
+        for ts, ip, port, src, tags in rows:
+            add(ts, "unknown" if ip < 0 else ip, "unknown" if port < 0 else port, src, tag_set(tags))
+
+    def reset(self, seed=None, options=None):
+        super().reset(seed=seed)
+        self.features.clear()
+        self.step_count = 0
+        self.last_action = None
+        start = (options or {}).get("start")
+        if start is None:
+            start = int(self.np_random.integers(self.start_lo, self.start_hi))
+        self.cursor = start
+        self._feed(max(0, start - self.window), start)
+        self.clock = float(self.snapshot.ts[start - 1]) if start else float(self.snapshot.ts[0])
+        return self.features.observation(), {}
+
+    def step(self, action):
+        self.last_action = action
+        self.clock += self.step_seconds
+        end = int(np.searchsorted(self.snapshot.ts, self.clock, side="right"))
+        self._feed(self.cursor, end)
+        self.cursor = end
+
+        self.step_count += 1
+        terminated = False
+        truncated = self.step_count >= self.max_steps or self.cursor >= len(self.snapshot)
+        info = {"selected_action": decode_action(action)}
+        return self.features.observation(), self.features.reward(), terminated, truncated, info
+
+    def render(self, mode="human"):
+        print(f"Last action taken: {self.last_action} | replay row {self.cursor}/{len(self.snapshot)}")
+
+
+# ---------- CLI ----------
+def _bench(path: str, steps: int, seed: int) -> None:
+    env = ReplayEnv(path)
+    env.reset(seed=seed)
+    env.action_space.seed(seed)
+    started = time.perf_counter()
+    for _ in range(steps):
+        _, _, terminated, truncated, _ = env.step(env.action_space.sample())
+        if terminated or truncated:
+            env.reset()
+    elapsed = time.perf_counter() - started
+    print(f"[=] {steps} steps in {elapsed:.2f}s → {steps / elapsed:,.0f} steps/s ({len(env.snapshot)} rows)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Export / benchmark normalized_logs replay snapshots")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    exp = sub.add_parser("export")
+    exp.add_argument("--out", required=True)
+    exp.add_argument("--since", help="ISO date/datetime (UTC if no offset), inclusive")
+    exp.add_argument("--until", help="ISO date/datetime (UTC if no offset), exclusive; default now")
+    bench = sub.add_parser("bench")
+    bench.add_argument("--snapshot", required=True)
+    bench.add_argument("--steps", type=int, default=100000)
+    bench.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    if args.cmd == "bench":
+        _bench(args.snapshot, args.steps, args.seed)
+        return
+
+    from common.mongo import get_db
+    from normalizer.normalized_logs import parse_when
+    rows = export_snapshot(get_db(), args.out, parse_when(args.since), parse_when(args.until))
+    print(f"✅ Exported {rows} normalized logs to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,59 +1,93 @@
 #!/usr/bin/env python3
+"""
+PPO training for AdaptTrapEnv.
 
+    python3 Code/rl_agent/train_sb3.py                                    # live env, 1 copy
+    python3 Code/rl_agent/train_sb3.py --replay Data/replay/july --envs 8 # offline, 8 processes
+
+With --replay, each of the --envs copies runs in its own process
+(SubprocVecEnv) and draws its episodes from its own shard of the snapshot.
+The live env reads a single stream of normalized logs, so its copies share
+one feature store in this process (DummyVecEnv) instead; --vec subproc is
+rejected without --replay.
+"""
 import os
 import sys
+import argparse
 import numpy as np
-import gymnasium as gym
 import random
 import time as time_module
 import psutil
 import threading
 from datetime import datetime, timezone
-from pymongo import MongoClient
 import matplotlib.pyplot as plt
 from scipy.ndimage import gaussian_filter1d
 from stable_baselines3 import PPO
+from stable_baselines3.common.callbacks import BaseCallback
 from stable_baselines3.common.env_checker import check_env
+from stable_baselines3.common.vec_env import DummyVecEnv, SubprocVecEnv, VecMonitor
 from tqdm import tqdm
 import torch  # GPU support
 
-# === Path fix for local modules (env is in same folder)
-sys.path.append(os.path.abspath(os.path.dirname(__file__)))
-from adapt_trap_env import AdaptTrapEnv  # type: ignore
+# === Path fix for local modules (rl_agent/ and common/ live one up)
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from rl_agent.adapt_trap_env import AdaptTrapEnv
+from rl_agent.replay_env import ReplayEnv
+from common.mongo import get_db
 
 # === Reproducibility
 SEED = 42
-random.seed(SEED)
-np.random.seed(SEED)
 
-# === Initialize Environment
-env = AdaptTrapEnv()
-env.debug = False
-env.action_space.seed(SEED)
-env.observation_space.seed(SEED)
-check_env(env)
+MODEL_DIR = "rl_agent/models"
+MODEL_PATH = os.path.join(MODEL_DIR, "ppo_adapttrap_sb3.zip")
+N_STEPS = 512  # rollout length per env
+
+
+# === Environments
+def make_env(rank, n_envs, replay=None, shared_store=None):
+    def _init():
+        if replay:
+            return ReplayEnv(replay, shard=(rank, n_envs))
+        return AdaptTrapEnv(feature_store=shared_store)
+    return _init
+
+
+def build_vec_env(n_envs, replay=None, vec=None):
+    """(vec env, live feed to stop after it or None)."""
+    shared_store = feed = None
+    if not replay:
+        # One live feed for all copies; started by the first reset(). The feed
+        # outlives the probe: the copies read its store until training ends.
+        probe = AdaptTrapEnv()
+        probe.reset()
+        shared_store, feed = probe.features, probe.feed
+        probe.feed = None
+        probe.close()
+    env_fns = [make_env(i, n_envs, replay, shared_store) for i in range(n_envs)]
+    check_env(env_fns[0]())
+
+    vec = vec or ("subproc" if replay and n_envs > 1 else "dummy")
+    vec_cls = SubprocVecEnv if vec == "subproc" else DummyVecEnv
+    vec_env = VecMonitor(vec_cls(env_fns))
+    vec_env.seed(SEED)
+    return vec_env, feed
+
 
 # === Reward Tracker
-class RewardLoggerWrapper(gym.Wrapper):
-    def __init__(self, env):
-        super().__init__(env)
-        self.episode_rewards = []
-        self.episode_reward = 0.0
+class EpisodeRewardCallback(BaseCallback):
+    """Collect finished-episode returns from VecMonitor infos (all envs)."""
 
-    def reset(self, **kwargs):
-        # start a new episode
-        self.episode_reward = 0.0
-        return self.env.reset(**kwargs)
+    def __init__(self):
+        super().__init__()
+        self.episode_rewards = []
 
-    def step(self, action):
-        obs, reward, terminated, truncated, info = self.env.step(action)
-        self.episode_reward += float(reward)
-        if terminated or truncated:
-            self.episode_rewards.append(self.episode_reward)
-            self.episode_reward = 0.0
-        return obs, reward, terminated, truncated, info
+    def _on_step(self):
+        for info in self.locals.get("infos", []):
+            episode = info.get("episode")
+            if episode is not None:
+                self.episode_rewards.append(float(episode["r"]))
+        return True
 
-wrapped_env = RewardLoggerWrapper(env)
 
 # === System Monitor
 def monitor_resources(interval=15):
@@ -63,138 +97,168 @@ def monitor_resources(interval=15):
         print(f"[System Resource] CPU: {cpu}%, RAM: {mem}%")
         time_module.sleep(interval)
 
-threading.Thread(target=monitor_resources, daemon=True).start()
-
-# === Model Setup
-model_path = "rl_agent/models/ppo_adapttrap_sb3.zip"
-os.makedirs("rl_agent/models", exist_ok=True)
-
-if os.path.exists(model_path):
-    print(f"📥 Resuming training from: {model_path}")
-    model = PPO.load(model_path, env=wrapped_env, device="auto")
-else:
-    print("🆕 Starting new training")
-    model = PPO(
-        "MlpPolicy",
-        wrapped_env,
-        verbose=0,
-        tensorboard_log="./ppo_logs",
-        seed=SEED,
-        device="auto",
-        n_steps=512
-    )
-
-print("✅ CUDA Available:", torch.cuda.is_available())
-print("🚀 Training Device:", model.device)
-
-# === Training Config
-MAX_MINUTES = 30
-MAX_SECONDS = MAX_MINUTES * 60
-TIMESTEP_BATCH = 512
-pbar = tqdm(desc="Training PPO")
-start_time = time_module.time()
-last_status_time = start_time
-steps_trained = 0
-
-# === Training Loop
-try:
-    while True:
-        if time_module.time() - start_time >= MAX_SECONDS:
-            print("\n⏱️ Time limit reached. Exiting training loop...\n")
-            break
-
-        model.learn(total_timesteps=TIMESTEP_BATCH, reset_num_timesteps=False)
-        steps_trained += TIMESTEP_BATCH
-        pbar.update(TIMESTEP_BATCH)
-
-        if time_module.time() - last_status_time >= 300:
-            elapsed = time_module.time() - start_time
-            eps = len(wrapped_env.episode_rewards)
-            avg_reward = float(np.mean(wrapped_env.episode_rewards[-10:])) if eps else 0.0
-            print(f"\n[⏱️ Status @ {elapsed:.1f}s] Steps: {steps_trained}, Episodes: {eps}, Avg Reward (last 10): {avg_reward:.2f}\n")
-            last_status_time = time_module.time()
-
-except KeyboardInterrupt:
-    print("\n🛑 Training interrupted manually. Saving model...\n")
-
-finally:
-    pbar.close()
-    model.save(model_path)
-    print(f"✅ Model saved to: {model_path}")
-
-    # === Rewards and plotting (guard if empty)
-    reward_array = np.array(wrapped_env.episode_rewards, dtype=float)
-
-    if reward_array.size == 0:
-        print("⚠️ No completed episodes during this run. Skipping reward stats/plot.")
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the ADAPT Trap PPO agent")
+    parser.add_argument("--replay", default=os.getenv("ADAPTTRAP_REPLAY"),
+                        help="replay snapshot dir from replay_env.py export (default: live MongoDB)")
+    parser.add_argument("--envs", type=int, default=1, help="parallel environment copies")
+    parser.add_argument("--vec", choices=["subproc", "dummy"],
+                        help="default: subproc for replay with --envs > 1, else dummy")
+    parser.add_argument("--minutes", type=float, default=30, help="wall-clock training budget")
+    args = parser.parse_args()
+    if args.vec == "subproc" and not args.replay:
+        # the live copies share one feature store (a lock and a feed thread) in this process
+        parser.error("--vec subproc needs --replay")
+
+    random.seed(SEED)
+    np.random.seed(SEED)
+
+    # === Initialize Environment
+    if args.replay:
+        print(f"📼 Training on replay snapshot: {args.replay} ({args.envs} envs)")
+    elif args.envs > 1:
+        print(f"[i] Live env: {args.envs} copies share one normalized_logs feed")
+    env, feed = build_vec_env(args.envs, args.replay, args.vec)
+    rewards = EpisodeRewardCallback()
+
+    threading.Thread(target=monitor_resources, daemon=True).start()
+
+    # === Model Setup
+    os.makedirs(MODEL_DIR, exist_ok=True)
+
+    if os.path.exists(MODEL_PATH):
+        print(f"📥 Resuming training from: {MODEL_PATH}")
+        model = PPO.load(MODEL_PATH, env=env, device="auto")
     else:
-        np.save("rl_agent/models/reward_trend.npy", reward_array)
-        print("📊 Reward trend saved to: rl_agent/models/reward_trend.npy")
-
-        plt.figure(figsize=(10, 4))
-        smoothed = gaussian_filter1d(reward_array, sigma=2)
-        plt.plot(smoothed, label="Smoothed Reward")
-        plt.xlabel("Episode")
-        plt.ylabel("Reward")
-        plt.title("Smoothed Training Reward Trend")
-        plt.grid(True)
-        plt.legend()
-        plt.savefig("rl_agent/models/reward_trend.png")
-        print("📈 Reward plot saved to: rl_agent/models/reward_trend.png")
-
-    # === MongoDB Logging
+        print("🆕 Starting new training")
+        model = PPO(
+            "MlpPolicy",
+            env,
+            verbose=0,
+            tensorboard_log="./ppo_logs",
+            seed=SEED,
+            device="auto",
+            n_steps=N_STEPS
+        )
+
+    print("✅ CUDA Available:", torch.cuda.is_available())
+    print("🚀 Training Device:", model.device)
+
+    # === Training Config
+    MAX_SECONDS = args.minutes * 60
+    TIMESTEP_BATCH = N_STEPS * args.envs  # one rollout across all envs
+    pbar = tqdm(desc="Training PPO")
+    start_time = time_module.time()
+    last_status_time = start_time
+    steps_trained = 0
+
+    # === Training Loop
     try:
-        client = MongoClient("mongodb://192.168.186.135:27017/")
-        db = client["adapttrap"]
-        actions_db = db["agent_actions"]
-        logs_db = db["training_logs"]
-
-        recent_reward = float(reward_array[-1]) if reward_array.size else 0.0
-        now = datetime.now(timezone.utc)
-
-        plugin_map = ["ssh", "ftp", "http", "telnet"]
-        action_vector = [0, 0, 0, 0]
-        if recent_reward > 20:
-            action_vector = [1, 1, 1, 1]
-        elif recent_reward > 10:
-            action_vector = [1, 0, 1, 0]
-
-        for i, val in enumerate(action_vector):
-            action_doc = {
-                "plugin": plugin_map[i],
-                "action": "disable_plugin" if val else "enable_plugin"
-            }
-            actions_db.insert_one({
+        while True:
+            if time_module.time() - start_time >= MAX_SECONDS:
+                print("\n⏱️ Time limit reached. Exiting training loop...\n")
+                break
+
+            model.learn(total_timesteps=TIMESTEP_BATCH, reset_num_timesteps=False, callback=rewards)
+            steps_trained += TIMESTEP_BATCH
+            pbar.update(TIMESTEP_BATCH)
+
+            if time_module.time() - last_status_time >= 300:
+                elapsed = time_module.time() - start_time
+                eps = len(rewards.episode_rewards)
+                avg_reward = float(np.mean(rewards.episode_rewards[-10:])) if eps else 0.0
+                print(f"\n[⏱️ Status @ {elapsed:.1f}s] Steps: {steps_trained} ({steps_trained / elapsed:,.0f}/s), "
+                      f"Episodes: {eps}, Avg Reward (last 10): {avg_reward:.2f}\n")
+                last_status_time = time_module.time()
+
+    except KeyboardInterrupt:
+        print("\n🛑 Training interrupted manually. Saving model...\n")
+
+    finally:
+        pbar.close()
+        model.save(MODEL_PATH)
+        print(f"✅ Model saved to: {MODEL_PATH}")
+
+        # === Rewards and plotting (guard if empty)
+        reward_array = np.array(rewards.episode_rewards, dtype=float)
+
+        if reward_array.size == 0:
+            print("⚠️ No completed episodes during this run. Skipping reward stats/plot.")
+        else:
+            np.save(os.path.join(MODEL_DIR, "reward_trend.npy"), reward_array)
+            print("📊 Reward trend saved to: rl_agent/models/reward_trend.npy")
+
+            plt.figure(figsize=(10, 4))
+            smoothed = gaussian_filter1d(reward_array, sigma=2)
+            plt.plot(smoothed, label="Smoothed Reward")
+            plt.xlabel("Episode")
+            plt.ylabel("Reward")
+            plt.title("Smoothed Training Reward Trend")
+            plt.grid(True)
+            plt.legend()
+            plt.savefig(os.path.join(MODEL_DIR, "reward_trend.png"))
+            print("📈 Reward plot saved to: rl_agent/models/reward_trend.png")
+
+        # === MongoDB Logging
+        try:
+            db = get_db(uri=os.getenv("MONGO_URI", "mongodb://192.168.186.135:27017/"))
+            actions_db = db["agent_actions"]
+            logs_db = db["training_logs"]
+
+            recent_reward = float(reward_array[-1]) if reward_array.size else 0.0
+            now = datetime.now(timezone.utc)
+
+            plugin_map = ["ssh", "ftp", "http", "telnet"]
+            action_vector = [0, 0, 0, 0]
+            if recent_reward > 20:
+                action_vector = [1, 1, 1, 1]
+            elif recent_reward > 10:
+                action_vector = [1, 0, 1, 0]
+
+            for i, val in enumerate(action_vector):
+                action_doc = {
+                    "plugin": plugin_map[i],
+                    "action": "disable_plugin" if val else "enable_plugin"
+                }
+                actions_db.insert_one({
+                    "timestamp": now,
+                    "selected_action": action_doc,
+                    "processed": False,
+                    "created_at": now,
+                    "reward": float(recent_reward),
+                    "source": "train_sb3"
+                })
+                print("✅ Logged action:", action_doc)
+
+            logs_db.insert_one({
+                "model_path": MODEL_PATH,
+                "timesteps": steps_trained,
+                "final_reward": float(recent_reward),
                 "timestamp": now,
-                "selected_action": action_doc,
-                "processed": False,
-                "created_at": now,
-                "reward": float(recent_reward),
-                "source": "train_sb3"
+                "duration_sec": time_module.time() - start_time,
+                "reward_mean": float(np.mean(reward_array)) if reward_array.size else None,
+                "reward_std": float(np.std(reward_array)) if reward_array.size else None,
+                "seed": SEED,
+                "n_envs": args.envs,
+                "replay": args.replay,
             })
-            print("✅ Logged action:", action_doc)
-
-        logs_db.insert_one({
-            "model_path": model_path,
-            "timesteps": steps_trained,
-            "final_reward": float(recent_reward),
-            "timestamp": now,
-            "duration_sec": time_module.time() - start_time,
-            "reward_mean": float(np.mean(reward_array)) if reward_array.size else None,
-            "reward_std": float(np.std(reward_array)) if reward_array.size else None,
-            "seed": SEED
-        })
-        print("📝 Training metadata logged to MongoDB")
-
-    except Exception as e:
-        print("⚠️ MongoDB logging failed:", str(e))
-
-    # === Post-training Evaluation
-    print("\n🧪 Sample Evaluation:")
-    obs, info = wrapped_env.reset()
-    for _ in range(5):
-        action, _ = model.predict(obs, deterministic=True)
-        obs, reward, terminated, truncated, info = wrapped_env.step(action)
-        print(f"→ Action: {action}, Reward: {reward}")
-        if terminated or truncated:
-            obs, info = wrapped_env.reset()
+            print("📝 Training metadata logged to MongoDB")
+
+        except Exception as e:
+            print("⚠️ MongoDB logging failed:", str(e))
+
+        # === Post-training Evaluation (first env)
+        print("\n🧪 Sample Evaluation:")
+        obs = env.reset()
+        for _ in range(5):
+            action, _ = model.predict(obs, deterministic=True)
+            obs, reward, done, info = env.step(action)
+            print(f"→ Action: {action[0]}, Reward: {reward[0]}")
+        env.close()
+        if feed is not None:
+            feed.stop()
+
+
+if __name__ == "__main__":
+    main()
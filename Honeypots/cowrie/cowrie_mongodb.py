@@ -1,23 +1,177 @@
 #!/usr/bin/env python3
+"""
+Ship cowrie.log lines to MongoDB (adapttrap.cowrie_logs).
 
-from pymongo import MongoClient
-from datetime import datetime, timezone
-import time
+Lines are read as they are written (inotify on the log directory, polling
+where inotify is unavailable) and inserted in batches of up to BATCH_SIZE
+lines or every FLUSH_SECONDS, by a writer thread so a slow or unreachable
+MongoDB never stalls the tail. After each batch is stored, the log file's
+inode and the byte offset after its last line go to OFFSET_PATH; a restart
+resumes from there, including the rest of a file that was rotated away
+meanwhile (Cowrie renames cowrie.log to cowrie.log.YYYY-MM-DD). Each line
+carries `log_pos` (inode:offset:crc), unique in the collection, so the
+batch that was in flight during a crash is not inserted twice.
+
+With no saved offset the shipper starts at the end of the log, as before;
+--from-start ships the existing contents first.
+"""
+import argparse
+import ctypes
+import ctypes.util
+import glob
+import json
 import os
+import queue
+import select
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+
+from pymongo import ASCENDING, MongoClient
+from pymongo.errors import BulkWriteError, PyMongoError
 
-MONGO_URI = "mongodb://192.168.186.135:27017"
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://192.168.186.135:27017")
 DB_NAME = "adapttrap"
 COLLECTION_NAME = "cowrie_logs"
-LOG_PATH = "/home/cowrie/cowrie/var/log/cowrie/cowrie.log"
+LOG_PATH = os.getenv("COWRIE_LOG_PATH", "/home/cowrie/cowrie/var/log/cowrie/cowrie.log")
+OFFSET_PATH = os.getenv("COWRIE_OFFSET_PATH", os.path.join(os.path.dirname(LOG_PATH), ".cowrie_mongodb.offset"))
+BATCH_SIZE = int(os.getenv("COWRIE_BATCH_SIZE", "500"))
+FLUSH_SECONDS = float(os.getenv("COWRIE_FLUSH_SECONDS", "1.0"))
+POLL_SECONDS = 1.0          # only without inotify
+READ_CHUNK = 1 << 16
+INSERT_ATTEMPTS = int(os.getenv("COWRIE_INSERT_ATTEMPTS", "5"))    # per batch, for lines MongoDB rejects
+SHUTDOWN_SECONDS = float(os.getenv("COWRIE_SHUTDOWN_SECONDS", "10"))  # wait for queued batches on exit
+DUPLICATE_KEY = 11000
 
-def tail(f):
-    f.seek(0, 2)  # move to end of file
-    while True:
-        line = f.readline()
-        if not line:
-            time.sleep(0.1)
+
+# ---------- file change notification ----------
+class DirWatch:
+    """Blocks until something in a directory changes (inotify), or a timeout passes."""
+
+    IN_MODIFY, IN_MOVED_FROM, IN_MOVED_TO, IN_CREATE, IN_DELETE = 0x2, 0x40, 0x80, 0x100, 0x200
+
+    def __init__(self, path):
+        self.fd = None
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            mask = self.IN_MODIFY | self.IN_MOVED_FROM | self.IN_MOVED_TO | self.IN_CREATE | self.IN_DELETE
+            if fd >= 0 and libc.inotify_add_watch(fd, os.fsencode(path), mask) >= 0:
+                self.fd = fd
+            elif fd >= 0:
+                os.close(fd)
+        except (OSError, AttributeError):
+            pass
+        if self.fd is None:
+            print(f"[!] inotify unavailable, polling {path} every {POLL_SECONDS}s")
+
+    def wait(self, timeout):
+        if self.fd is None:
+            time.sleep(min(timeout, POLL_SECONDS))
+            return
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if ready:
+            try:
+                while os.read(self.fd, 4096):  # drain; we re-check the file either way
+                    pass
+            except BlockingIOError:
+                pass
+
+
+# ---------- offsets ----------
+def load_offset():
+    try:
+        with open(OFFSET_PATH, "r") as f:
+            state = json.load(f)
+        return int(state["inode"]), int(state["offset"])
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def save_offset(inode, offset):
+    with open(OFFSET_PATH + ".tmp", "w") as f:
+        json.dump({"inode": inode, "offset": offset, "updated_at": datetime.now(timezone.utc).isoformat()}, f)
+    os.replace(OFFSET_PATH + ".tmp", OFFSET_PATH)
+
+
+def find_rotated(inode):
+    """The rotated copy of the log that still has `inode`, if any."""
+    for path in glob.glob(LOG_PATH + ".*"):
+        try:
+            if os.stat(path).st_ino == inode:
+                return path
+        except OSError:
             continue
-        yield line
+    return None
+
+
+# ---------- reading ----------
+class LogReader:
+    """Complete lines from one open log file, tracking the byte offset after each."""
+
+    def __init__(self, path, offset=0):
+        self.f = open(path, "rb")
+        self.inode = os.fstat(self.f.fileno()).st_ino
+        self.f.seek(offset)
+        self.offset = offset
+        self.pending = b""
+
+    def lines(self):
+        """[(offset of line, line bytes)] for the complete lines available now."""
+        out = []
+        while True:
+            chunk = self.f.read(READ_CHUNK)
+            if not chunk:
+                return out
+            self.pending += chunk
+            *complete, self.pending = self.pending.split(b"\n")
+            for line in complete:
+                out.append((self.offset, line))
+                self.offset += len(line) + 1
+
+    def truncated(self):
+        return os.fstat(self.f.fileno()).st_size < self.offset + len(self.pending)
+
+    def close(self):
+        self.f.close()
+
+
+def to_doc(inode, offset, line):
+    text = line.decode("utf-8", errors="replace").strip()
+    return {
+        "timestamp": datetime.now(timezone.utc),
+        "source": "cowrie",
+        "raw_log": text,
+        "log_pos": f"{inode}:{offset}:{zlib.crc32(line):08x}",
+    }
+
+
+class Batcher:
+    """
+    Groups lines into batches of up to BATCH_SIZE lines of one file. A batch's
+    offset is the end of its own last line: `LogReader.lines()` reads ahead,
+    and the lines past that belong to the next batch.
+    """
+
+    def __init__(self, out, size=BATCH_SIZE):
+        self.out = out
+        self.size = size
+        self.docs, self.inode, self.offset = [], None, 0
+
+    def add(self, inode, offset, line):
+        if self.docs and self.inode != inode:
+            self.flush()
+        self.docs.append(to_doc(inode, offset, line))
+        self.inode, self.offset = inode, offset + len(line) + 1
+        if len(self.docs) >= self.size:
+            self.flush()
+
+    def flush(self, timeout=None):
+        if self.docs:
+            self.out.put((self.docs, self.inode, self.offset), timeout=timeout)
+            self.docs = []
+
 
 def wait_for_logfile(path, retries=30, delay=2):
     print(f"⏳ Waiting for log file: {path}")
@@ -28,24 +182,136 @@ def wait_for_logfile(path, retries=30, delay=2):
         time.sleep(delay)
     raise FileNotFoundError(f"❌ Log file not found after {retries * delay} seconds: {path}")
 
+
+# ---------- writing ----------
+def writer(coll, batches):
+    """
+    Insert queued batches in order; the offset is saved only once a batch is
+    stored. While MongoDB is unreachable a batch is retried indefinitely; lines
+    it rejects are retried INSERT_ATTEMPTS times, then logged and skipped so
+    one bad line can't hold back the rest of the log.
+    """
+    while True:
+        item = batches.get()
+        if item is None:
+            return
+        docs, inode, offset = item
+        delay, attempt, skipped = 1, 0, 0
+        while True:
+            try:
+                coll.insert_many(docs, ordered=False)
+                break
+            except BulkWriteError as e:
+                failed = [err for err in e.details.get("writeErrors", []) if err.get("code") != DUPLICATE_KEY]
+                if not failed:
+                    break  # already stored before a restart
+                attempt += 1
+                if attempt >= INSERT_ATTEMPTS:
+                    for err in failed:
+                        print(f"[!] Skipping line {docs[err['index']]['log_pos']}: {err.get('errmsg')}")
+                    skipped = len(failed)
+                    break
+                print(f"[!] Insert failed for {len(failed)} lines ({failed[0].get('errmsg')}); "
+                      f"attempt {attempt}/{INSERT_ATTEMPTS}, retrying in {delay}s")
+            except PyMongoError as e:
+                print(f"[!] MongoDB unavailable ({e}); retrying in {delay}s")
+            time.sleep(delay)  # docs keep their _id, so a retry can't duplicate what got through
+            delay = min(delay * 2, 30)
+        save_offset(inode, offset)
+        print(f"[+] Inserted {len(docs) - skipped} lines (inode {inode}, offset {offset})")
+
+
 def main():
+    parser = argparse.ArgumentParser(description="Ship cowrie.log to MongoDB")
+    parser.add_argument("--from-start", action="store_true",
+                        help="with no saved offset, ship the existing log instead of starting at its end")
+    args = parser.parse_args()
+
     print("📡 Starting Cowrie MongoDB Logger…")
     wait_for_logfile(LOG_PATH)
 
     client = MongoClient(MONGO_URI)
-    db = client[DB_NAME]
-    coll = db[COLLECTION_NAME]
-
-    with open(LOG_PATH, 'r') as logfile:
-        loglines = tail(logfile)
-        for line in loglines:
-            doc = {
-                "timestamp": datetime.now(timezone.utc),  # Fixed timezone warning
-                "source": "cowrie",
-                "raw_log": line.strip()
-            }
-            coll.insert_one(doc)
-            print(f"Inserted: {doc}")
+    coll = client[DB_NAME][COLLECTION_NAME]
+    coll.create_index([("log_pos", ASCENDING)], name="log_pos_unique", unique=True,
+                      partialFilterExpression={"log_pos": {"$exists": True}})
+
+    batches = queue.Queue(maxsize=16)  # full queue = MongoDB is behind; the tail waits
+    thread = threading.Thread(target=writer, args=(coll, batches), name="cowrie-mongo-writer", daemon=True)
+    thread.start()
+
+    # where to resume
+    saved = load_offset()
+    current = os.stat(LOG_PATH).st_ino
+    readers = []
+    if saved is None:
+        readers.append(LogReader(LOG_PATH, 0 if args.from_start else os.stat(LOG_PATH).st_size))
+    elif saved[0] == current:
+        readers.append(LogReader(LOG_PATH, saved[1] if os.stat(LOG_PATH).st_size >= saved[1] else 0))
+    else:
+        rotated = find_rotated(saved[0])
+        if rotated:
+            print(f"[=] Finishing rotated log {rotated} from offset {saved[1]}")
+            readers.append(LogReader(rotated, saved[1]))
+        else:
+            print(f"[!] Log rotated while stopped and inode {saved[0]} is gone; starting {LOG_PATH} from the top")
+        readers.append(LogReader(LOG_PATH, 0))
+
+    watch = DirWatch(os.path.dirname(LOG_PATH))
+    batch = Batcher(batches)
+    deadline = time.monotonic() + FLUSH_SECONDS
+
+    def flush():
+        nonlocal deadline
+        batch.flush()
+        deadline = time.monotonic() + FLUSH_SECONDS
+
+    try:
+        while True:
+            reader = readers[0]
+            for offset, line in reader.lines():
+                batch.add(reader.inode, offset, line)
+
+            # at the end of this file: move on if it was rotated away or truncated
+            if len(readers) > 1:
+                flush()
+                readers.pop(0).close()
+                continue
+            try:
+                rotated = os.stat(LOG_PATH).st_ino != reader.inode
+            except FileNotFoundError:
+                rotated = False  # renamed, new file not created yet
+            if rotated:
+                # the old file is drained first: lines written between the last read and the rename
+                readers.append(LogReader(LOG_PATH, 0))
+                print(f"[=] Log rotated; following new {LOG_PATH}")
+                continue
+            if reader.truncated():
+                flush()
+                reader.close()
+                readers[0] = LogReader(LOG_PATH, 0)
+                print(f"[=] Log truncated; reading {LOG_PATH} from the top")
+                continue
+
+            if time.monotonic() >= deadline:
+                flush()
+            watch.wait(max(deadline - time.monotonic(), 0.01) if batch.docs else FLUSH_SECONDS)
+    except KeyboardInterrupt:
+        print("\n👋 Stopping Cowrie MongoDB Logger.")
+    finally:
+        # bounded: with MongoDB down the queue stays full and the writer never returns
+        deadline = time.monotonic() + SHUTDOWN_SECONDS
+        try:
+            batch.flush(timeout=SHUTDOWN_SECONDS)
+            batches.put(None, timeout=max(deadline - time.monotonic(), 0.01))
+        except queue.Full:
+            pass
+        thread.join(max(deadline - time.monotonic(), 0))
+        if thread.is_alive():
+            # offsets only move once a batch is stored: the next start re-reads these lines
+            print(f"[!] MongoDB still unavailable after {SHUTDOWN_SECONDS:.0f}s; "
+                  f"{batches.qsize()} queued batches will be re-read on restart")
+        client.close()
+
 
 if __name__ == "__main__":
     main()
@@ -8,7 +8,7 @@ setup(
     package_dir={"": "src"},
     package_data={"": ["*.md"]},
     use_incremental=True,
-    scripts=["bin/fsctl", "bin/asciinema", "bin/cowrie", "bin/createfs", "bin/playlog"],
+    scripts=["bin/fsctl", "bin/asciinema", "bin/cowrie", "bin/cowriectl", "bin/createfs", "bin/playlog"],
     setup_requires=["incremental", "click"],
 )
 
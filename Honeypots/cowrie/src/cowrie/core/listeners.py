@@ -0,0 +1,133 @@
+# -*- test-case-name: cowrie.test.test_listeners -*-
+# See the COPYRIGHT file for more information
+
+"""
+Runtime control of Cowrie's listening endpoints.
+
+ListenerManager keeps the endpoint services of each protocol ("ssh",
+"telnet") under the top service and can add or remove them while the
+reactor runs. Removing a protocol only stops its listening ports: sessions
+already established on it, and every other protocol, are left alone.
+
+ControlProtocol exposes that over a local stream endpoint (by default a
+UNIX socket, see [honeypot] control_endpoint), one command per line:
+
+    enable <protocol>
+    disable <protocol>
+    status
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from twisted.application import internet
+from twisted.internet import defer, endpoints, protocol
+from twisted.protocols import basic
+from twisted.python import log
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+    from twisted.application.service import MultiService
+    from twisted.python.failure import Failure
+
+
+class UnknownProtocolError(ValueError):
+    def __init__(self, name: str) -> None:
+        super().__init__(f"unknown protocol {name!r}")
+
+
+class ListenerManager:
+    def __init__(self, reactor, parent: MultiService) -> None:
+        self.reactor = reactor
+        self.parent = parent
+        self.listeners: dict[str, list[internet.StreamServerEndpointService]] = {}
+
+    def enabled(self, name: str) -> bool:
+        return name in self.listeners
+
+    def add(self, name: str, listen_endpoints: list[str], factory: protocol.Factory) -> None:
+        """
+        Listen on `listen_endpoints` for `name`; a no-op if already listening.
+        Services join the parent, so they start right away when it is running.
+        """
+        if name in self.listeners:
+            return
+        services = []
+        for listen_endpoint in listen_endpoints:
+            endpoint = endpoints.serverFromString(self.reactor, listen_endpoint)
+            service = internet.StreamServerEndpointService(endpoint, factory)
+            service.setServiceParent(self.parent)
+            services.append(service)
+        self.listeners[name] = services
+
+    def remove(self, name: str) -> defer.Deferred:
+        """
+        Stop listening for `name`. The Deferred fires once its ports are
+        closed; connections already accepted stay up.
+        """
+        services = self.listeners.pop(name, [])
+        return defer.gatherResults(
+            [defer.maybeDeferred(service.disownServiceParent) for service in services]
+        )
+
+
+class ControlProtocol(basic.LineReceiver):
+    delimiter = b"\n"
+
+    def lineReceived(self, line: bytes) -> None:
+        parts = line.decode(errors="replace").split()
+        if not parts:
+            return
+        command, args = parts[0].lower(), parts[1:]
+
+        if command == "status":
+            self.reply(self.factory.status())
+        elif command in ("enable", "disable") and len(args) == 1:
+            d = defer.maybeDeferred(self.factory.toggle, args[0].lower(), command == "enable")
+            d.addCallbacks(self.reply, self.failed)
+        else:
+            self.reply("ERROR usage: enable <protocol> | disable <protocol> | status")
+
+    def reply(self, message: str) -> None:
+        self.sendLine(message.encode())
+
+    def failed(self, failure: Failure) -> None:
+        self.reply(f"ERROR {failure.getErrorMessage()}")
+
+
+class ControlFactory(protocol.Factory):
+    protocol = ControlProtocol
+
+    def __init__(
+        self,
+        listeners: ListenerManager,
+        builders: dict[str, Callable[[], None]],
+    ) -> None:
+        """
+        `builders` maps each controllable protocol to a callable that creates
+        its factory and registers it with `listeners`.
+        """
+        self.listeners = listeners
+        self.builders = builders
+
+    def status(self) -> str:
+        return "OK " + " ".join(
+            f"{name}={'on' if self.listeners.enabled(name) else 'off'}"
+            for name in sorted(self.builders)
+        )
+
+    def toggle(self, name: str, enable: bool) -> defer.Deferred | str:
+        if name not in self.builders:
+            raise UnknownProtocolError(name)
+        if enable == self.listeners.enabled(name):
+            return f"OK {name} already {'on' if enable else 'off'}"
+
+        log.msg(f"Control: {'enabling' if enable else 'disabling'} {name}")
+        if enable:
+            self.builders[name]()
+            return f"OK {name} on"
+        d = self.listeners.remove(name)
+        d.addCallback(lambda _: f"OK {name} off")
+        return d
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+
+###############################################################
+# This program talks to a running Cowrie over its control socket
+# ([honeypot] control_endpoint) to enable or disable the ssh and
+# telnet listeners without restarting Cowrie.
+#
+#   bin/cowriectl status
+#   bin/cowriectl enable telnet
+#   bin/cowriectl disable ssh
+#
+##############################################################
+
+import argparse
+import os
+import socket
+import sys
+
+DEFAULT_SOCKET = "var/run/cowrie.sock"
+
+
+def control(path: str, command: str, timeout: float = 10.0) -> str:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.settimeout(timeout)
+        s.connect(path)
+        s.sendall(command.encode() + b"\n")
+        reply = b""
+        while not reply.endswith(b"\n"):
+            chunk = s.recv(4096)
+            if not chunk:
+                break
+            reply += chunk
+    return reply.decode().strip()
+
+
+def run():
+    cowriedir = os.path.join(os.path.dirname(os.path.abspath(sys.argv[0])), "..")
+    parser = argparse.ArgumentParser(description="Enable/disable Cowrie listeners at runtime")
+    parser.add_argument("command", choices=["status", "enable", "disable"])
+    parser.add_argument("protocol", nargs="?", choices=["ssh", "telnet"])
+    parser.add_argument("-s", "--socket", default=os.path.join(cowriedir, DEFAULT_SOCKET))
+    args = parser.parse_args()
+
+    if args.command != "status" and not args.protocol:
+        parser.error(f"{args.command} needs a protocol")
+
+    try:
+        reply = control(args.socket, " ".join(filter(None, [args.command, args.protocol])))
+    except OSError as e:
+        print(f"Cannot reach Cowrie on {args.socket}: {e}")
+        sys.exit(2)
+
+    print(reply)
+    if not reply.startswith("OK"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+import os
+import queue
+import sys
+import tempfile
+import unittest
+
+try:
+    import mongomock
+except ImportError:
+    mongomock = None
+
+# cowrie_mongodb.py is a standalone script next to src/
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "..")))
+
+
+@unittest.skipIf(mongomock is None, "needs mongomock")
+class ShipperResumeTests(unittest.TestCase):
+    """Tests for cowrie_mongodb.py offsets."""
+
+    def setUp(self) -> None:
+        import cowrie_mongodb
+
+        self.shipper = cowrie_mongodb
+        self.tmp = tempfile.TemporaryDirectory()
+        self.log_path = os.path.join(self.tmp.name, "cowrie.log")
+        self.lines = [f"2025-07-14T10:00:{i % 60:02d} login attempt {i}" for i in range(1200)]
+        with open(self.log_path, "w") as f:
+            f.write("\n".join(self.lines) + "\n")
+        self.old_offset_path = cowrie_mongodb.OFFSET_PATH
+        cowrie_mongodb.OFFSET_PATH = os.path.join(self.tmp.name, "offset")
+        self.coll = mongomock.MongoClient().db.cowrie_logs
+
+    def tearDown(self) -> None:
+        self.shipper.OFFSET_PATH = self.old_offset_path
+        self.tmp.cleanup()
+
+    def ship(self, offset: int, max_batches: int | None = None) -> None:
+        """Read the log from `offset`; store at most `max_batches` batches (then "crash")."""
+        batches: queue.Queue = queue.Queue()
+        batcher = self.shipper.Batcher(batches, size=500)
+        reader = self.shipper.LogReader(self.log_path, offset)
+        for line_offset, line in reader.lines():
+            batcher.add(reader.inode, line_offset, line)
+        batcher.flush()
+        reader.close()
+        stored: queue.Queue = queue.Queue()
+        for _ in range(batches.qsize() if max_batches is None else max_batches):
+            stored.put(batches.get())
+        stored.put(None)
+        self.shipper.writer(self.coll, stored)
+
+    def test_batch_offset_is_end_of_last_line(self) -> None:
+        batches: queue.Queue = queue.Queue()
+        batcher = self.shipper.Batcher(batches, size=500)
+        reader = self.shipper.LogReader(self.log_path, 0)
+        for line_offset, line in reader.lines():
+            batcher.add(reader.inode, line_offset, line)
+        reader.close()
+        _, _, offset = batches.get()
+        self.assertEqual(offset, sum(len(line) + 1 for line in self.lines[:500]))
+
+    def test_restart_after_first_batch(self) -> None:
+        self.ship(0, max_batches=1)
+        self.assertEqual(self.coll.count_documents({}), 500)
+
+        inode, offset = self.shipper.load_offset()
+        self.assertEqual(inode, os.stat(self.log_path).st_ino)
+        self.ship(offset)
+
+        stored = [d["raw_log"] for d in self.coll.find().sort("_id", 1)]
+        self.assertEqual(stored, self.lines)
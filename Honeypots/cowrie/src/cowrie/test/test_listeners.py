@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import unittest
+
+from cowrie.core.listeners import ControlFactory, ListenerManager
+
+from twisted.application.service import MultiService
+from twisted.internet import protocol
+from twisted.internet import reactor
+from twisted.internet.testing import StringTransport
+
+
+class ListenerManagerTests(unittest.TestCase):
+    """Tests for cowrie/core/listeners.py."""
+
+    def setUp(self) -> None:
+        self.parent = MultiService()
+        self.listeners = ListenerManager(reactor, self.parent)
+
+    def test_add_remove(self) -> None:
+        self.listeners.add(
+            "telnet",
+            ["tcp:2223:interface=1.1.1.1", "tcp:2223:interface=2.2.2.2"],
+            protocol.Factory(),
+        )
+        self.assertTrue(self.listeners.enabled("telnet"))
+        self.assertEqual(len(self.parent.services), 2)
+
+        # already listening: no duplicate services
+        self.listeners.add("telnet", ["tcp:2223:interface=1.1.1.1"], protocol.Factory())
+        self.assertEqual(len(self.parent.services), 2)
+
+        results = []
+        self.listeners.remove("telnet").addCallback(results.append)
+        self.assertEqual(len(results), 1)
+        self.assertFalse(self.listeners.enabled("telnet"))
+        self.assertEqual(len(self.parent.services), 0)
+
+    def test_remove_leaves_other_protocols(self) -> None:
+        self.listeners.add("ssh", ["tcp:2222:interface=1.1.1.1"], protocol.Factory())
+        self.listeners.add("telnet", ["tcp:2223:interface=1.1.1.1"], protocol.Factory())
+        ssh_services = list(self.listeners.listeners["ssh"])
+
+        self.listeners.remove("telnet")
+        self.assertTrue(self.listeners.enabled("ssh"))
+        self.assertEqual(list(self.parent), ssh_services)
+
+
+class ControlProtocolTests(unittest.TestCase):
+    """Tests for the control socket protocol."""
+
+    def setUp(self) -> None:
+        self.listeners = ListenerManager(reactor, MultiService())
+
+        def start_telnet() -> None:
+            self.listeners.add("telnet", ["tcp:2223:interface=1.1.1.1"], protocol.Factory())
+
+        factory = ControlFactory(self.listeners, {"ssh": lambda: None, "telnet": start_telnet})
+        self.proto = factory.buildProtocol(("127.0.0.1", 0))
+        self.tr = StringTransport()
+        self.proto.makeConnection(self.tr)
+
+    def command(self, line: bytes) -> bytes:
+        self.tr.clear()
+        self.proto.dataReceived(line + b"\n")
+        return self.tr.value()
+
+    def test_status(self) -> None:
+        self.assertEqual(self.command(b"status"), b"OK ssh=off telnet=off\n")
+
+    def test_enable_disable(self) -> None:
+        self.assertEqual(self.command(b"enable telnet"), b"OK telnet on\n")
+        self.assertTrue(self.listeners.enabled("telnet"))
+        self.assertEqual(self.command(b"enable telnet"), b"OK telnet already on\n")
+        self.assertEqual(self.command(b"disable telnet"), b"OK telnet off\n")
+        self.assertFalse(self.listeners.enabled("telnet"))
+
+    def test_errors(self) -> None:
+        self.assertEqual(self.command(b"enable ftp"), b"ERROR unknown protocol 'ftp'\n")
+        self.assertTrue(self.command(b"restart").startswith(b"ERROR usage"))
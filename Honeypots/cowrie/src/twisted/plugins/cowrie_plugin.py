@@ -28,6 +28,7 @@ from backend_pool.pool_server import PoolServerFactory
 from cowrie import core
 from cowrie._version import __version__ as __cowrie_version__
 from cowrie.core.config import CowrieConfig
+from cowrie.core.listeners import ControlFactory, ListenerManager
 from cowrie.core.utils import create_endpoint_services, get_endpoints_from_section
 from cowrie.pool_interface.handler import PoolHandler
 
@@ -53,6 +54,11 @@ def importFailureObserver(event: dict) -> None:
 globalLogPublisher.addObserver(importFailureObserver)
 
 
+class BackendNotReadyError(RuntimeError):
+    def __init__(self) -> None:
+        super().__init__("backend pool not ready")
+
+
 @implementer(IServiceMaker, IPlugin)
 class CowrieServiceMaker:
     tapname: ClassVar[str] = "cowrie"
@@ -60,6 +66,7 @@ class CowrieServiceMaker:
     options = Options
     output_plugins: list[Callable]
     topService: service.Service
+    listeners: ListenerManager
 
     def __init__(self) -> None:
         self.pool_handler = None
@@ -74,6 +81,9 @@ class CowrieServiceMaker:
         # pool only
         self.pool_only: bool = CowrieConfig.getboolean("backend_pool", "pool_only", fallback=False)
 
+        # ssh/telnet factories need the backend; with the pool that is after pool_ready()
+        self.backend_ready: bool = False
+
     def makeService(self, options: dict) -> service.Service:
         if options["help"] is True:
             print("""Usage: twistd [options] cowrie [-h]
@@ -123,6 +133,17 @@ Makes a Cowrie SSH/Telnet honeypot.
         self.topService = service.MultiService()
         application = service.Application("cowrie")
         self.topService.setServiceParent(application)
+        self.listeners = ListenerManager(reactor, self.topService)
+
+        # Runtime enable/disable of ssh/telnet (bin/cowriectl), no restart needed
+        control_endpoint: str = CowrieConfig.get(
+            "honeypot", "control_endpoint", fallback="unix:var/run/cowrie.sock:mode=600:lockfile=1"
+        )
+        if control_endpoint:
+            control = ControlFactory(
+                self.listeners, {"ssh": self.start_ssh, "telnet": self.start_telnet}
+            )
+            create_endpoint_services(reactor, self.topService, [control_endpoint], control)
 
         backend_type: str = CowrieConfig.get("honeypot", "backend", fallback="shell")
         proxy_backend: str = CowrieConfig.get("proxy", "backend", fallback="simple")
@@ -147,41 +168,53 @@ Makes a Cowrie SSH/Telnet honeypot.
         return self.topService
 
     def pool_ready(self) -> None:
-        backend: str = CowrieConfig.get("honeypot", "backend", fallback="shell")
+        self.backend_ready = True
 
         if self.enableSSH:
-            factory = cowrie.ssh.factory.CowrieSSHFactory(backend, self.pool_handler)
-            factory.tac = self
-            factory.portal = portal.Portal(core.realm.HoneyPotRealm())
-            factory.portal.registerChecker(core.checkers.HoneypotPublicKeyChecker())
-            factory.portal.registerChecker(core.checkers.HoneypotPasswordChecker())
-
-            if CowrieConfig.getboolean("ssh", "auth_none_enabled", fallback=False):
-                factory.portal.registerChecker(core.checkers.HoneypotNoneChecker())
-
-            if CowrieConfig.has_section("ssh"):
-                listen_endpoints = get_endpoints_from_section(CowrieConfig, "ssh", 2222)
-            else:
-                listen_endpoints = get_endpoints_from_section(CowrieConfig, "honeypot", 2222)
-
-            create_endpoint_services(reactor, self.topService, listen_endpoints, factory)
+            self.start_ssh()
 
         # ✅ Adaptive Telnet Plugin Launch
         enable_telnet_env = os.getenv("ENABLE_TELNET", "").lower() in ("1", "true", "yes")
         enable_telnet_flag = os.path.exists("/home/cowrie/cowrie/etc/enable_telnet.flag")
 
         if self.enableTelnet and (enable_telnet_env or enable_telnet_flag):
-            f = cowrie.telnet.factory.HoneyPotTelnetFactory(backend, self.pool_handler)
-            f.tac = self
-            f.portal = portal.Portal(core.realm.HoneyPotRealm())
-            f.portal.registerChecker(core.checkers.HoneypotPasswordChecker())
-
-            listen_endpoints = get_endpoints_from_section(CowrieConfig, "telnet", 2223)
-            create_endpoint_services(reactor, self.topService, listen_endpoints, f)
+            self.start_telnet()
             log.msg("✅ Cowrie Telnet enabled on port 2223")
         else:
             log.msg("❌ Cowrie Telnet disabled (no flag or env set)")
 
+    def start_ssh(self) -> None:
+        if not self.backend_ready:
+            raise BackendNotReadyError
+        backend: str = CowrieConfig.get("honeypot", "backend", fallback="shell")
+        factory = cowrie.ssh.factory.CowrieSSHFactory(backend, self.pool_handler)
+        factory.tac = self
+        factory.portal = portal.Portal(core.realm.HoneyPotRealm())
+        factory.portal.registerChecker(core.checkers.HoneypotPublicKeyChecker())
+        factory.portal.registerChecker(core.checkers.HoneypotPasswordChecker())
+
+        if CowrieConfig.getboolean("ssh", "auth_none_enabled", fallback=False):
+            factory.portal.registerChecker(core.checkers.HoneypotNoneChecker())
+
+        if CowrieConfig.has_section("ssh"):
+            listen_endpoints = get_endpoints_from_section(CowrieConfig, "ssh", 2222)
+        else:
+            listen_endpoints = get_endpoints_from_section(CowrieConfig, "honeypot", 2222)
+
+        self.listeners.add("ssh", listen_endpoints, factory)
+
+    def start_telnet(self) -> None:
+        if not self.backend_ready:
+            raise BackendNotReadyError
+        backend: str = CowrieConfig.get("honeypot", "backend", fallback="shell")
+        f = cowrie.telnet.factory.HoneyPotTelnetFactory(backend, self.pool_handler)
+        f.tac = self
+        f.portal = portal.Portal(core.realm.HoneyPotRealm())
+        f.portal.registerChecker(core.checkers.HoneypotPasswordChecker())
+
+        listen_endpoints = get_endpoints_from_section(CowrieConfig, "telnet", 2223)
+        self.listeners.add("telnet", listen_endpoints, f)
+
 
 # IPlugin + IServiceMaker binding
 serviceMaker = CowrieServiceMaker()
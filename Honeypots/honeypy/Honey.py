@@ -5,8 +5,8 @@
 
 import sys
 import os
+import signal
 import subprocess
-import socket
 import configparser
 import argparse
 import importlib
@@ -19,6 +19,7 @@ from twisted.python.logfile import DailyLogFile
 from lib.honeypy_logtail import SingleDailyLogFile
 from lib.honeypy_logtail import HoneyPyLogTail
 from lib.honeypy_console import HoneyPyConsole
+from lib.honeypy_services import HoneyPyServices
 
 # prevent creation of compiled bytecode files
 sys.dont_write_bytecode = True
@@ -32,15 +33,12 @@ args = parser.parse_args()
 # get path for config files
 script_dir = os.path.dirname(os.path.abspath(__file__))
 honeypy_config_file = script_dir + '/etc/honeypy.cfg'
-service_config_file = script_dir + '/etc/services.cfg'
 
-# setup config parsers
+# setup config parser
 honeypy_config = configparser.ConfigParser()
-service_config = configparser.ConfigParser()
 
-# read config files
+# read config file (services are read by HoneyPyServices, also on reload)
 honeypy_config.read(honeypy_config_file)
-service_config.read(service_config_file)
 
 # setup log file and formatting
 if honeypy_config.has_option('honeypy', 'internal_log_dir'):
@@ -74,27 +72,14 @@ with open(script_dir + '/VERSION') as f:
 # start logging
 log.startLoggingWithObserver(file_log_observer.emit, False)
 
-#check if other service profiles are to be included
-if honeypy_config.has_option('honeypy', 'service_profiles'):
-    log.msg('Skipping etc/services.cfg')
-    service_config = configparser.ConfigParser()
-    for service_profile in honeypy_config.get('honeypy', 'service_profiles').split(','):
-        profile_cfg_file = script_dir + '/etc/profiles/' + service_profile.strip()
-        log.msg("Reading services from %s" % profile_cfg_file)
-        profile_cfg = configparser.ConfigParser()
-        profile_cfg.read(profile_cfg_file)
-        #add the services from this profile
-        for section in profile_cfg.sections():
-            if profile_cfg.get(section, 'enabled').lower() == 'yes':
-                #if enabled and don't already exist
-                if not service_config.has_section(section):
-                    log.msg("Adding service : %s %s" % (section, profile_cfg.get(section, 'low_port')))
-                    service_config.add_section(section)
-                    #read the options and add then to the new service section
-                    for option in profile_cfg.options(section):
-                        service_config.set(section, option, profile_cfg.get(section, option))
-                else:
-                    log.msg("Skipping duplicate service : %s %s" % (section, service_config.get(section, 'low_port')))
+# services object array
+services = []
+services.append([])
+services.append([])
+
+# services.cfg, or the service profiles from honeypy.cfg
+service_manager = HoneyPyServices(script_dir, args.d, services)
+service_config = service_manager.load_config()
 
 if args.ipt:
     # generate ipt-kit script in /tmp and quit.
@@ -133,76 +118,59 @@ for section in tailer.config.sections():
     if section != 'honeypy' and tailer.config.get(section, 'enabled').lower() == 'yes':
         log.msg("Enabled Logger : %s" % (section))
 
-# services object array
-services = []
-services.append([])
-services.append([])
-
 # start enabled services
 display_low_port_message = True
 
+for service, spec in service_manager.enabled_specs(service_config).items():
+    [low_protocol, low_port] = service_config.get(service, 'low_port').split(':')
 
-def get_ip_address():
-    # function to ensure we get external IP (rather than hostname) for udp connections.
-    # http://stackoverflow.com/questions/24196932/how-can-i-get-the-ip-address-of-eth0-in-python/24196955
-    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    s.connect(("8.8.8.8", 80))
-    ipaddress = s.getsockname()[0]
-    s.shutdown(socket.SHUT_RDWR)
-    s.close()
-    return ipaddress
-
-for service in service_config.sections():
-    if service_config.get(service, 'enabled') == 'Yes':
-        [low_protocol, low_port] = service_config.get(service, 'low_port').split(':')
-        [protocol, port] = service_config.get(service, 'port').split(':')
-        plugin_module = 'plugins.' + service_config.get(service, 'plugin')
-        plugin = importlib.import_module(plugin_module)
-        service_object = None
-
-        if args.d is False:
-            if int(low_port) < 1024:
-                if display_low_port_message:
-                    print('Your service configuration suggests that you want to run on at least one low port!')
-                    print('To enable port redirection run the following ipt-kit (https://github.com/foospidy/ipt-kit) commands as root:')
-                    print('')
-                    display_low_port_message = False
-
-        try:
-            if protocol.lower() == 'tcp':
-                # run tcp service
-                service_object = reactor.listenTCP(int(port), plugin.pluginFactory(service))
-            else:
-                # run udp service
-                service_object = reactor.listenUDP(int(port), plugin.pluginMain(service, get_ip_address(), port))
-
-            if service_object:
-                # stop services from listening immediately if not starting in daemon mode.
-                if args.d is False:
-                    service_object.stopListening()
-
-                # save service objects to array, to be used by HoneyPy Console
-                services[0].append(service)
-                services[1].append(service_object)
-
-        except Exception as e:
-            print(str(e) + '\n')
-
-            if str(e).find('Permission denied') != -1:
-                print('If you are attempting to use a low port (below 1024), do not.')
-                print('Low ports require root privilege and you should not run HoneyPy as root.')
-                print('Run the service on a high port and use IP Tables to redirect the low port')
-                print('to a high port. This may help, https://github.com/foospidy/ipt-kit')
-
-            if str(e).find('Address already in use') != -1:
-                print('A service (' + service + ') is configured to run on a port that is already')
-                print('in use by another process. Kill the other process or use a different port.')
-
-            sys.exit()
+    if args.d is False:
+        if int(low_port) < 1024:
+            if display_low_port_message:
+                print('Your service configuration suggests that you want to run on at least one low port!')
+                print('To enable port redirection run the following ipt-kit (https://github.com/foospidy/ipt-kit) commands as root:')
+                print('')
+                display_low_port_message = False
+
+    try:
+        # stop services from listening immediately if not starting in daemon mode;
+        # service objects are saved to the services array, used by HoneyPy Console
+        service_manager.start(service, spec, listen=args.d)
+
+    except Exception as e:
+        print(str(e) + '\n')
+
+        if str(e).find('Permission denied') != -1:
+            print('If you are attempting to use a low port (below 1024), do not.')
+            print('Low ports require root privilege and you should not run HoneyPy as root.')
+            print('Run the service on a high port and use IP Tables to redirect the low port')
+            print('to a high port. This may help, https://github.com/foospidy/ipt-kit')
+
+        if str(e).find('Address already in use') != -1:
+            print('A service (' + service + ') is configured to run on a port that is already')
+            print('in use by another process. Kill the other process or use a different port.')
+
+        sys.exit()
+
+# hot reload: `kill -HUP <pid>` (or 'reload' in the console) re-reads services.cfg / profiles
+# and starts or stops only the services whose configuration changed
+pid_file = os.path.join(log_path, 'honeypy.pid')
+with open(pid_file, 'w') as f:
+    f.write(str(os.getpid()))
+
+def remove_pid_file():
+    try:
+        os.remove(pid_file)
+    except OSError:
+        pass
+
+reactor.addSystemEventTrigger('before', 'shutdown', remove_pid_file)
+
+signal.signal(signal.SIGHUP, lambda signum, frame: reactor.callFromThread(service_manager.reload))
 
 # run HoneyPy Console if daemon mode not specified
 if args.d is False:
-    stdio.StandardIO(HoneyPyConsole(honeypy_config, services))
+    stdio.StandardIO(HoneyPyConsole(honeypy_config, services, service_manager.reload))
 
 # start reactor
 reactor.run()
@@ -77,6 +77,18 @@ class HoneyPyConsole(basic.LineReceiver):
 
         self.sendLine(f'{i + 1} service(s) stopped!')
 
+    def do_reload(self):
+        """reload: Re-read services.cfg and start/stop only the services that changed"""
+        if self.reload is None:
+            self.sendLine('Reload is not available.')
+            return
+
+        def report(result):
+            started, stopped = result
+            self.sendLine(f'{len(started)} service(s) started, {len(stopped)} service(s) stopped.')
+
+        self.reload().addCallback(report)
+
     def do_banner(self):
         """banner: Display HoneyPy banner"""
         banner = (
@@ -172,6 +184,7 @@ class HoneyPyConsole(basic.LineReceiver):
         # stop the reactor, only because this is meant to be run in Stdio.
         reactor.stop()
 
-    def __init__(self, config, services):
+    def __init__(self, config, services, reload=None):
         self.config = config
         self.services = services
+        self.reload = reload
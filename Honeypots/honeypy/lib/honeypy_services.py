@@ -0,0 +1,140 @@
+# HoneyPy Copyright (C) 2013-2017 foospidy
+# https://github.com/foospidy/HoneyPy
+# See LICENSE for details
+# HoneyPy service management: load services.cfg / profiles, start listeners,
+# and reload them in place.
+
+import os
+import socket
+import configparser
+import importlib
+from twisted.internet import defer, reactor
+from twisted.python import log
+
+
+def get_ip_address():
+    # function to ensure we get external IP (rather than hostname) for udp connections.
+    # http://stackoverflow.com/questions/24196932/how-can-i-get-the-ip-address-of-eth0-in-python/24196955
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    s.connect(("8.8.8.8", 80))
+    ipaddress = s.getsockname()[0]
+    s.shutdown(socket.SHUT_RDWR)
+    s.close()
+    return ipaddress
+
+
+class HoneyPyServices(object):
+    """
+    Owns the running service listeners. `services` is the two-list structure
+    the console works on ([names], [listening ports]) and is updated in place.
+    """
+
+    def __init__(self, script_dir, daemon, services):
+        self.script_dir = script_dir
+        self.daemon = daemon
+        self.services = services
+        self.specs = {}  # service name -> (plugin, protocol, port) it was started with
+
+    def load_config(self):
+        """services.cfg, or the union of the profiles named in honeypy.cfg."""
+        honeypy_config = configparser.ConfigParser()
+        honeypy_config.read(os.path.join(self.script_dir, 'etc', 'honeypy.cfg'))
+        service_config = configparser.ConfigParser()
+
+        if not honeypy_config.has_option('honeypy', 'service_profiles'):
+            service_config.read(os.path.join(self.script_dir, 'etc', 'services.cfg'))
+            return service_config
+
+        log.msg('Skipping etc/services.cfg')
+        for service_profile in honeypy_config.get('honeypy', 'service_profiles').split(','):
+            profile_cfg_file = os.path.join(self.script_dir, 'etc', 'profiles', service_profile.strip())
+            log.msg("Reading services from %s" % profile_cfg_file)
+            profile_cfg = configparser.ConfigParser()
+            profile_cfg.read(profile_cfg_file)
+            #add the services from this profile
+            for section in profile_cfg.sections():
+                if profile_cfg.get(section, 'enabled').lower() == 'yes':
+                    #if enabled and don't already exist
+                    if not service_config.has_section(section):
+                        log.msg("Adding service : %s %s" % (section, profile_cfg.get(section, 'low_port')))
+                        service_config.add_section(section)
+                        #read the options and add then to the new service section
+                        for option in profile_cfg.options(section):
+                            service_config.set(section, option, profile_cfg.get(section, option))
+                    else:
+                        log.msg("Skipping duplicate service : %s %s" % (section, service_config.get(section, 'low_port')))
+        return service_config
+
+    @staticmethod
+    def enabled_specs(service_config):
+        specs = {}
+        for service in service_config.sections():
+            if service_config.get(service, 'enabled') == 'Yes':
+                [protocol, port] = service_config.get(service, 'port').split(':')
+                specs[service] = (service_config.get(service, 'plugin'), protocol.lower(), int(port))
+        return specs
+
+    def start(self, service, spec, listen=True):
+        """Bind one service and record it; raises what listenTCP/listenUDP raise."""
+        plugin_name, protocol, port = spec
+        plugin = importlib.import_module('plugins.' + plugin_name)
+
+        if protocol == 'tcp':
+            # run tcp service
+            service_object = reactor.listenTCP(port, plugin.pluginFactory(service))
+        else:
+            # run udp service
+            service_object = reactor.listenUDP(port, plugin.pluginMain(service, get_ip_address(), str(port)))
+
+        if not listen:
+            service_object.stopListening()
+
+        self.services[0].append(service)
+        self.services[1].append(service_object)
+        self.specs[service] = spec
+        return service_object
+
+    def stop(self, service):
+        """Stop one service; returns a Deferred that fires once its port is released."""
+        i = self.services[0].index(service)
+        service_object = self.services[1][i]
+        del self.services[0][i]
+        del self.services[1][i]
+        del self.specs[service]
+        return defer.maybeDeferred(service_object.stopListening)
+
+    def listening(self):
+        """Whether services are live: always in daemon mode, else after the console's 'start'."""
+        if self.daemon:
+            return True
+        return any(getattr(port, 'connected', False) for port in self.services[1])
+
+    def reload(self):
+        """
+        Re-read the service configuration and converge the running listeners
+        on it: stop services that were disabled or removed, start newly
+        enabled ones, and rebind services whose plugin or port changed.
+        Untouched services keep their listeners and open sessions.
+        Returns a Deferred firing (started, stopped) service names.
+        """
+        wanted = self.enabled_specs(self.load_config())
+        listen = self.listening()
+        stopped = [service for service in self.services[0] if wanted.get(service) != self.specs.get(service)]
+
+        def start_wanted(_):
+            # ports of stopped services are free now, so a changed service can rebind its old port
+            started = []
+            for service, spec in wanted.items():
+                if service in self.specs:
+                    continue
+                try:
+                    self.start(service, spec, listen)
+                    started.append(service)
+                except Exception as e:
+                    log.msg("Reload: could not start service %s: %s" % (service, e))
+            log.msg("Services reloaded: started [%s] stopped [%s]" % (', '.join(started), ', '.join(stopped)))
+            return started, stopped
+
+        d = defer.DeferredList([self.stop(service) for service in stopped], consumeErrors=True)
+        d.addCallback(start_wanted)
+        return d
@@ -210,11 +210,14 @@ def claim_next(coll) -> dict | None:
         {
             "event_type": "file_upload",
             "dead": {"$ne": True},
-            "$or": [{"forwarded": {"$exists": False}}, {"forwarded": False}],
-            "$or": [
-                {"processing": {"$exists": False}},
-                {"processing": False},
-                {"processing_at": {"$lt": stale}},
+            # two $or clauses need an explicit $and (a repeated dict key keeps only the last)
+            "$and": [
+                {"$or": [{"forwarded": {"$exists": False}}, {"forwarded": False}]},
+                {"$or": [
+                    {"processing": {"$exists": False}},
+                    {"processing": False},
+                    {"processing_at": {"$lt": stale}},
+                ]},
             ],
         },
         {"$set": {"processing": True, "processing_at": _utcnow()}},